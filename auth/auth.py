@@ -3,13 +3,19 @@
 import firebase_admin
 from firebase_admin import credentials, auth
 from fastapi import HTTPException, Depends, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 import os
 import json
+import logging
 
-from database.database import get_db
+from database.database import get_db, SessionLocal
 from models.user import User
+from auth.token_cache import get_cached_claims, cache_claims
+from auth.identity import UserIdentity, get_cached_identity, remember_identity
+
+logger = logging.getLogger(__name__)
 
 # --- INIZIALIZZAZIONE FIREBASE ADMIN ---
 # ✅ Usa variabile d'ambiente invece del file
@@ -20,7 +26,7 @@ if firebase_creds_json:
     try:
         creds_dict = json.loads(firebase_creds_json)
         creds = credentials.Certificate(creds_dict)
-        print("✅ Firebase initialized from environment variable")
+        logger.info("Firebase initialized from environment variable")
     except json.JSONDecodeError as e:
         raise ValueError(f"Invalid FIREBASE_CREDENTIALS JSON: {e}")
 else:
@@ -32,7 +38,7 @@ else:
             "Set FIREBASE_CREDENTIALS environment variable or provide firebase-credentials.json file."
         )
     creds = credentials.Certificate(creds_path)
-    print("✅ Firebase initialized from local file")
+    logger.info("Firebase initialized from local file")
 
 firebase_admin.initialize_app(creds)
 # -----------------------------------------
@@ -44,36 +50,88 @@ def verify_firebase_token(id_token: str, credentials_exception):
     Verifica l'ID Token di Firebase.
     Se valido, restituisce il payload decodificato.
     Altrimenti, solleva un'eccezione.
+    I token già verificati vengono serviti dalla cache locale fino al loro `exp`,
+    evitando di ricontrollare la firma RS256 a ogni richiesta.
     """
+    cached_token = get_cached_claims(id_token)
+    if cached_token is not None:
+        return cached_token
+
     try:
         decoded_token = auth.verify_id_token(id_token,clock_skew_seconds=30)
+        cache_claims(id_token, decoded_token)
         return decoded_token
     except Exception as e:
-        print(f"Firebase token verification failed: {e}")
+        logger.info("Firebase token verification failed: %s", e)
         raise credentials_exception
 
 
-def get_current_user(db: Session = Depends(get_db), credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)):
-    """
-    Dependency per FastAPI: prende il token Bearer, lo verifica con Firebase
-    e restituisce l'utente corrispondente dal database SQL.
-    """
-    credentials_exception = HTTPException(
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+
+def _get_firebase_uid(credentials: HTTPAuthorizationCredentials, credentials_exception) -> str:
     id_token = credentials.credentials
     decoded_token = verify_firebase_token(id_token, credentials_exception)
     firebase_uid = decoded_token.get("user_id")
-    
+
     if firebase_uid is None:
         raise credentials_exception
-        
+
+    return firebase_uid
+
+
+def get_current_user(db: Session = Depends(get_db), credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)):
+    """
+    Dependency per FastAPI: prende il token Bearer, lo verifica con Firebase
+    e restituisce l'utente corrispondente dal database SQL.
+    Da usare negli endpoint che modificano l'utente o ne leggono le relazioni.
+    """
+    credentials_exception = _credentials_exception()
+    firebase_uid = _get_firebase_uid(credentials, credentials_exception)
+
     user = db.query(User).filter(User.firebase_uid == firebase_uid).first()
     
     if user is None:
         raise credentials_exception
-    
-    return user
\ No newline at end of file
+
+    remember_identity(user)
+    return user
+
+
+async def get_current_identity(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)) -> UserIdentity:
+    """
+    Dependency per FastAPI: come `get_current_user`, ma restituisce solo
+    un'istantanea (id, is_admin, faculty_id, ...) servita dalla cache in memoria.
+    Se token e utente sono in cache risponde direttamente dall'event loop;
+    altrimenti verifica il token e apre una Session nel threadpool.
+    """
+    decoded_token = get_cached_claims(credentials.credentials)
+    if decoded_token is not None and decoded_token.get("user_id") is not None:
+        identity = get_cached_identity(decoded_token["user_id"])
+        if identity is not None:
+            return identity
+
+    return await run_in_threadpool(_load_identity, credentials)
+
+
+def _load_identity(credentials: HTTPAuthorizationCredentials) -> UserIdentity:
+    credentials_exception = _credentials_exception()
+    firebase_uid = _get_firebase_uid(credentials, credentials_exception)
+
+    identity = get_cached_identity(firebase_uid)
+    if identity is not None:
+        return identity
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.firebase_uid == firebase_uid).first()
+        if user is None:
+            raise credentials_exception
+        return remember_identity(user)
+    finally:
+        db.close()
@@ -0,0 +1,56 @@
+# auth/identity.py
+
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from cache import make_cache
+
+
+@dataclass(frozen=True)
+class UserIdentity:
+    """
+    Istantanea leggera dell'utente autenticato: contiene solo i campi che
+    servono alla maggior parte degli endpoint (id, ruolo, facoltà).
+    Non è legata a nessuna Session, quindi non può essere modificata né
+    usata per caricare relazioni: per quello serve `get_current_user`.
+    """
+    id: int
+    firebase_uid: str
+    email: str
+    is_admin: bool
+    faculty_id: Optional[int] = None
+
+    @classmethod
+    def from_user(cls, user) -> "UserIdentity":
+        return cls(
+            id=user.id,
+            firebase_uid=user.firebase_uid,
+            email=user.email,
+            is_admin=bool(user.is_admin),
+            faculty_id=user.faculty_id,
+        )
+
+
+IDENTITY_CACHE_SIZE = int(os.getenv("AUTH_IDENTITY_CACHE_SIZE", "10000"))
+# L'invalidazione raggiunge gli altri worker solo con PUBSUB_BACKEND=unix:
+# altrimenti il TTL limita quanto a lungo possono servire un'istantanea vecchia.
+IDENTITY_CACHE_TTL = int(os.getenv("AUTH_IDENTITY_CACHE_TTL", "300"))
+
+# Sempre in memoria: viene letta dall'event loop a ogni richiesta autenticata
+identity_cache = make_cache("identity", IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL, local=True)
+
+
+def get_cached_identity(firebase_uid: str) -> Optional[UserIdentity]:
+    return identity_cache.get(firebase_uid)
+
+
+def remember_identity(user) -> UserIdentity:
+    identity = UserIdentity.from_user(user)
+    identity_cache.set(user.firebase_uid, identity)
+    return identity
+
+
+def invalidate_identity(firebase_uid: str):
+    """Da chiamare dopo ogni commit che modifica o elimina un utente (vale per tutti i worker)."""
+    identity_cache.delete(firebase_uid)
@@ -0,0 +1,37 @@
+# auth/token_cache.py
+
+import hashlib
+import os
+import time
+
+from cache import make_cache
+
+# Numero massimo di token verificati tenuti in memoria (0 disattiva la cache)
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+# Tetto alla permanenza in cache, indipendente dall'exp del token
+TOKEN_CACHE_MAX_TTL = int(os.getenv("AUTH_TOKEN_CACHE_MAX_TTL", "3600"))
+
+# Sempre in memoria, come le identità: letta a ogni richiesta autenticata, e i
+# claims verificati non devono finire su un server condiviso
+token_cache = make_cache("auth-token", TOKEN_CACHE_SIZE, TOKEN_CACHE_MAX_TTL, local=True)
+
+
+def token_key(id_token: str) -> str:
+    """Non teniamo in memoria il token in chiaro, solo il suo hash."""
+    return hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+
+
+def get_cached_claims(id_token: str):
+    return token_cache.get(token_key(id_token))
+
+
+def cache_claims(id_token: str, decoded_token: dict):
+    """
+    Salva i claims di un token appena verificato fino alla sua scadenza (`exp`).
+    Token senza `exp` non vengono messi in cache.
+    """
+    exp = decoded_token.get("exp")
+    if exp is None:
+        return
+    ttl = min(float(exp) - time.time(), TOKEN_CACHE_MAX_TTL)
+    token_cache.set(token_key(id_token), decoded_token, ttl=ttl)
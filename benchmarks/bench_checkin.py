@@ -0,0 +1,87 @@
+# benchmarks/bench_checkin.py
+#
+# Verifica di concorrenza del check-in: N studenti diversi fanno check-in
+# sulla stessa lezione contemporaneamente (attraverso l'app, come farebbero N
+# telefoni all'inizio della lezione), ognuno due volte. Contatore e registro
+# devono arrivare esattamente a N: nessun aggiornamento perso e nessun
+# doppione contato. Esce con codice 1 se il conteggio non torna.
+#
+#   python -m benchmarks.bench_checkin [--checkins 500] [--database-url ...]
+#
+# Con CHECKIN_BUFFER_MS > 0 verifica anche il contatore in memoria (il
+# conteggio finale è letto dopo il flush).
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from benchmarks.seed import DEFAULT_DATABASE_URL
+
+
+async def _fire(app, lesson_id: int, latitude: float, longitude: float, checkins: int):
+    import httpx
+
+    from benchmarks.firebase_stub import token_for
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        body = {"latitude": latitude, "longitude": longitude}
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(
+            client.post(f"/lessons/{lesson_id}/check-in", json=body, headers={"Authorization": f"Bearer {token_for(i % checkins + 1)}"})
+            for i in range(2 * checkins)
+        ))
+        return responses, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check-in concorrenti: nessun aggiornamento perso")
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    parser.add_argument("--checkins", type=int, default=500)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from benchmarks.firebase_stub import install
+    install()
+
+    from benchmarks.seed import seed, sizes
+    # Servono almeno N utenti (1000 per unità di scala)
+    scale = max((args.checkins + 0.5) / sizes(1)["users"], 0.05)
+    seed(scale=scale)
+
+    from main import app
+    from database.database import SessionLocal
+    from models import Course, Lesson, LessonCheckin
+    from services.checkin_counter import checkin_buffer
+
+    db = SessionLocal()
+    lesson_id, latitude, longitude = (
+        db.query(Lesson.id, Course.latitude, Course.longitude)
+        .join(Course, Lesson.course_id == Course.id).order_by(Lesson.id).first()
+    )
+    db.close()
+
+    responses, elapsed = asyncio.run(_fire(app, lesson_id, latitude, longitude, args.checkins))
+    failed = [r for r in responses if r.status_code != 200]
+    if checkin_buffer is not None:
+        checkin_buffer.flush()
+
+    db = SessionLocal()
+    stored = db.query(Lesson.checkins).filter(Lesson.id == lesson_id).scalar()
+    logged = db.query(LessonCheckin).filter(LessonCheckin.lesson_id == lesson_id).count()
+    db.close()
+
+    ok = not failed and stored == logged == args.checkins
+    print(f"check-ins sent {2 * args.checkins} ({args.checkins} students), failed {len(failed)}, "
+          f"stored {stored}, logged {logged}, {2 * args.checkins / elapsed:.0f} req/s -> "
+          f"{'OK' if ok else 'WRONG COUNT'}")
+    if failed:
+        print(f"first failure: {failed[0].status_code} {failed[0].text}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
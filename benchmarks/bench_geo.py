@@ -0,0 +1,60 @@
+# benchmarks/bench_geo.py
+#
+# Confronta la haversine scalare (un loop Python, come nei vecchi router)
+# con quella vettorizzata di utils.geo, da uno e da più punti utente.
+#
+#   python -m benchmarks.bench_geo [--sizes 1000 10000 100000] [--repeat 5]
+
+import argparse
+import random
+import timeit
+
+import numpy as np
+
+from utils.geo import calculate_distance, haversine_many
+
+
+def _rooms(n: int):
+    rng = random.Random(42)
+    lats = [41.85 + rng.random() * 0.1 for _ in range(n)]
+    lons = [12.45 + rng.random() * 0.1 for _ in range(n)]
+    return lats, lons
+
+
+def run(sizes, repeat: int, users: int):
+    user_lat, user_lon = 41.9, 12.5
+    many_lats = np.full(users, user_lat) + np.linspace(-0.01, 0.01, users)
+    many_lons = np.full(users, user_lon)
+
+    print(f"{'rooms':>8} {'scalar ms':>11} {'numpy ms':>10} {'speedup':>8} {f'numpy x{users} ms':>15}")
+    for n in sizes:
+        lats, lons = _rooms(n)
+        lats_np, lons_np = np.array(lats), np.array(lons)
+
+        scalar = min(timeit.repeat(
+            lambda: [calculate_distance(user_lat, user_lon, la, lo) for la, lo in zip(lats, lons)],
+            number=1, repeat=repeat,
+        ))
+        vector = min(timeit.repeat(
+            lambda: haversine_many(user_lat, user_lon, lats_np, lons_np),
+            number=1, repeat=repeat,
+        ))
+        matrix = min(timeit.repeat(
+            lambda: haversine_many(many_lats, many_lons, lats_np, lons_np),
+            number=1, repeat=repeat,
+        ))
+
+        # Le due implementazioni devono dare lo stesso risultato
+        expected = np.array([calculate_distance(user_lat, user_lon, la, lo) for la, lo in zip(lats[:100], lons[:100])])
+        assert np.allclose(expected, haversine_many(user_lat, user_lon, lats_np[:100], lons_np[:100]))
+
+        print(f"{n:>8} {scalar * 1000:>11.2f} {vector * 1000:>10.2f} {scalar / vector:>7.1f}x {matrix * 1000:>15.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Haversine scalare vs NumPy")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--users", type=int, default=10, help="punti utente per il caso matrice")
+    args = parser.parse_args()
+    run(args.sizes, args.repeat, args.users)
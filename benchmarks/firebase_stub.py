@@ -0,0 +1,60 @@
+# benchmarks/firebase_stub.py
+#
+# Firebase finto per i benchmark: nessuna chiamata di rete, nessun account
+# reale. `install()` va chiamata PRIMA di importare l'app (auth.auth
+# inizializza firebase_admin all'import):
+#
+#   - genera un service account usa-e-getta (chiave RSA locale) e lo mette
+#     in FIREBASE_CREDENTIALS, se non è già impostata;
+#   - sostituisce firebase_admin.auth.verify_id_token: il token
+#     "bench-user-<n>" è valido e ha come uid lo stesso valore.
+
+import json
+import os
+import time
+
+TOKEN_PREFIX = "bench-user-"
+
+
+def token_for(index: int) -> str:
+    return f"{TOKEN_PREFIX}{index}"
+
+
+def _fake_service_account() -> dict:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode("ascii")
+    return {
+        "type": "service_account",
+        "project_id": "uniadvisor-bench",
+        "private_key_id": "bench",
+        "private_key": pem,
+        "client_email": "bench@uniadvisor-bench.iam.gserviceaccount.com",
+        "client_id": "0",
+        "token_uri": "https://oauth2.googleapis.com/token",
+    }
+
+
+def verify_id_token(id_token: str, *args, **kwargs) -> dict:
+    if not id_token.startswith(TOKEN_PREFIX):
+        raise ValueError("Unknown benchmark token")
+    return {
+        "uid": id_token,
+        "user_id": id_token,
+        "email": f"{id_token}@bench.uniadvisor.it",
+        "exp": time.time() + 3600,
+    }
+
+
+def install():
+    os.environ.setdefault("FIREBASE_CREDENTIALS", json.dumps(_fake_service_account()))
+
+    import firebase_admin.auth
+
+    firebase_admin.auth.verify_id_token = verify_id_token
@@ -0,0 +1,251 @@
+# benchmarks/resp_stub.py
+#
+# Stand-in di Redis per sviluppo e benchmark: un server asyncio in un solo
+# processo che parla RESP2 e implementa i comandi usati da cache/resp.py
+# (più qualche comando utile da redis-cli). Niente persistenza, niente
+# replica: i dati vivono finché il processo è attivo.
+#
+#   python -m benchmarks.resp_stub [--host 127.0.0.1] [--port 6379] [--password ...]
+#
+# e poi l'app con CACHE_BACKEND=redis CACHE_URL=redis://127.0.0.1:6379/0.
+# `start_in_thread()` lo avvia in un thread dello script che lo usa (prove locali).
+
+import argparse
+import asyncio
+import fnmatch
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+
+class StubError(Exception):
+    pass
+
+
+def _encode(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, StubError):
+        return b"-%s\r\n" % str(value).encode()
+    if isinstance(value, bool):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode()
+    if isinstance(value, (list, tuple)):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(item) for item in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class Store:
+    """Database numerati come in Redis: chiave -> (valore, scadenza monotonic o None)."""
+
+    def __init__(self):
+        self.dbs: Dict[int, Dict[bytes, Tuple[bytes, Optional[float]]]] = defaultdict(dict)
+
+    def _live(self, db: int, key: bytes) -> Optional[bytes]:
+        entry = self.dbs[db].get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.dbs[db][key]
+            return None
+        return value
+
+
+class Session:
+    def __init__(self, store: Store, password: Optional[str]):
+        self.store = store
+        self.password = password
+        self.authenticated = password is None
+        self.db = 0
+
+    def execute(self, args):
+        name = args[0].decode().upper()
+        if not self.authenticated and name not in ("AUTH", "PING", "QUIT"):
+            return StubError("NOAUTH Authentication required.")
+        handler = getattr(self, f"cmd_{name.lower()}", None)
+        if handler is None:
+            return StubError(f"ERR unknown command '{name}'")
+        try:
+            return handler(*args[1:])
+        except TypeError:
+            return StubError(f"ERR wrong number of arguments for '{name}' command")
+        except ValueError:
+            return StubError("ERR value is not an integer or out of range")
+
+    @property
+    def data(self):
+        return self.store.dbs[self.db]
+
+    def cmd_ping(self, message=None):
+        return message if message is not None else "PONG"
+
+    def cmd_auth(self, *credentials):
+        if self.password is None or credentials[-1].decode() == self.password:
+            self.authenticated = True
+            return "OK"
+        return StubError("WRONGPASS invalid username-password pair")
+
+    def cmd_select(self, db):
+        self.db = int(db)
+        return "OK"
+
+    def cmd_get(self, key):
+        return self.store._live(self.db, key)
+
+    def cmd_mget(self, *keys):
+        return [self.store._live(self.db, key) for key in keys]
+
+    def cmd_set(self, key, value, *options):
+        expires_at = None
+        exists = self.store._live(self.db, key) is not None
+        i = 0
+        while i < len(options):
+            option = options[i].upper()
+            if option in (b"EX", b"PX"):
+                amount = int(options[i + 1]) / (1 if option == b"EX" else 1000)
+                expires_at = time.monotonic() + amount
+                i += 2
+            elif option == b"NX":
+                if exists:
+                    return None
+                i += 1
+            elif option == b"XX":
+                if not exists:
+                    return None
+                i += 1
+            else:
+                return StubError("ERR syntax error")
+        self.data[key] = (value, expires_at)
+        return "OK"
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self.store._live(self.db, key) is not None:
+                removed += 1
+            self.data.pop(key, None)
+        return removed
+
+    def cmd_exists(self, *keys):
+        return sum(self.store._live(self.db, key) is not None for key in keys)
+
+    def cmd_incr(self, key):
+        value = self.store._live(self.db, key)
+        number = int(value) + 1 if value is not None else 1
+        expires_at = self.data[key][1] if value is not None else None
+        self.data[key] = (str(number).encode(), expires_at)
+        return number
+
+    def cmd_pexpire(self, key, milliseconds):
+        value = self.store._live(self.db, key)
+        if value is None:
+            return 0
+        self.data[key] = (value, time.monotonic() + int(milliseconds) / 1000)
+        return 1
+
+    def cmd_pttl(self, key):
+        value = self.store._live(self.db, key)
+        if value is None:
+            return -2
+        expires_at = self.data[key][1]
+        return -1 if expires_at is None else int((expires_at - time.monotonic()) * 1000)
+
+    def cmd_scan(self, cursor, *options):
+        pattern, count = b"*", 10
+        for option, value in zip(options[::2], options[1::2]):
+            if option.upper() == b"MATCH":
+                pattern = value
+            elif option.upper() == b"COUNT":
+                count = int(value)
+        keys = sorted(self.data)
+        start = int(cursor)
+        chunk = keys[start:start + count]
+        next_cursor = start + count if start + count < len(keys) else 0
+        matched = [
+            key for key in chunk
+            if self.store._live(self.db, key) is not None and fnmatch.fnmatchcase(key.decode(errors="replace"), pattern.decode())
+        ]
+        return [str(next_cursor).encode(), matched]
+
+    def cmd_dbsize(self):
+        return sum(self.store._live(self.db, key) is not None for key in list(self.data))
+
+    def cmd_flushdb(self, *options):
+        self.data.clear()
+        return "OK"
+
+    def cmd_flushall(self, *options):
+        self.store.dbs.clear()
+        return "OK"
+
+    def cmd_quit(self):
+        return "OK"
+
+
+async def _read_command(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()  # comando inline (es. da telnet)
+    args = []
+    for _ in range(int(line[1:-2])):
+        header = await reader.readline()
+        length = int(header[1:-2])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+async def _handle(reader, writer, store: Store, password: Optional[str]):
+    session = Session(store, password)
+    try:
+        while True:
+            args = await _read_command(reader)
+            if args is None:
+                break
+            if not args:
+                continue
+            writer.write(_encode(session.execute(args)))
+            if args[0].upper() == b"QUIT":
+                break
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int, password: Optional[str] = None, ready: Optional[threading.Event] = None):
+    store = Store()
+    server = await asyncio.start_server(lambda r, w: _handle(r, w, store, password), host, port)
+    if ready is not None:
+        ready.port = server.sockets[0].getsockname()[1]
+        ready.set()
+    async with server:
+        await server.serve_forever()
+
+
+def start_in_thread(host: str = "127.0.0.1", port: int = 0, password: Optional[str] = None) -> int:
+    """Avvia lo stand-in in un thread daemon e restituisce la porta (0 = porta libera qualsiasi)."""
+    ready = threading.Event()
+    threading.Thread(target=lambda: asyncio.run(serve(host, port, password, ready)), daemon=True).start()
+    ready.wait()
+    return ready.port
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Server compatibile con il protocollo Redis, per sviluppo e benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--password", default=None)
+    args = parser.parse_args()
+    print(f"RESP stand-in listening on {args.host}:{args.port}")
+    try:
+        asyncio.run(serve(args.host, args.port, args.password))
+    except KeyboardInterrupt:
+        pass
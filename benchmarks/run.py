@@ -0,0 +1,281 @@
+# benchmarks/run.py
+#
+# Benchmark di carico degli endpoint principali, riproducibile: database
+# sintetico (benchmarks/seed.py), Firebase finto (benchmarks/firebase_stub.py),
+# concorrenza fissa e sequenza di richieste determinata da --random-seed.
+#
+#   python -m benchmarks.run [--scale 1] [--concurrency 16] [--requests 2000]
+#                            [--database-url sqlite:///benchmarks/bench.db]
+#                            [--base-url http://localhost:8000] [--no-seed]
+#                            [--scenarios courses nearby ...] [--output file.json]
+#
+# Senza --base-url l'app gira nello stesso processo (httpx + ASGITransport).
+# Con --base-url si misura un server già avviato, che deve usare lo stesso
+# database e il Firebase finto: `python -m benchmarks.serve --database-url ...`.
+#
+# Il risultato (p50/p95/p99, throughput, errori per scenario, più commit git
+# e configurazione) va in benchmarks/results/<commit>.json: due file di
+# commit diversi si confrontano con un semplice diff.
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from benchmarks.firebase_stub import token_for
+from benchmarks.seed import DEFAULT_DATABASE_URL
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+# Variabili d'ambiente che cambiano il comportamento dell'app e finiscono nei metadati
+RELEVANT_ENV = (
+    "DB_ASYNC", "DB_POOL_SIZE", "DB_MAX_OVERFLOW", "DB_PGBOUNCER", "WEB_CONCURRENCY",
+    "LOCATION_INDEX_BACKEND", "TIMETABLE_INDEX_BACKEND", "CACHE_BACKEND", "PUBSUB_BACKEND", "SEARCH_BACKEND",
+    "METRICS_ENABLED", "DB_PROFILER", "LOG_LEVEL",
+)
+
+
+class Dataset:
+    """Id e coordinate letti dal database, da cui gli scenari generano le richieste."""
+
+    def __init__(self):
+        from database.database import SessionLocal
+        from models import Course, Faculty, Lesson, Note, User
+        from sqlalchemy import func
+
+        db = SessionLocal()
+        try:
+            self.courses = [
+                (row.id, row.latitude, row.longitude)
+                for row in db.query(Course.id, Course.latitude, Course.longitude)
+                .filter(Course.latitude.isnot(None)).all()
+            ]
+            self.note_courses = [row[0] for row in db.query(Note.course_id).distinct().all()]
+            self.lessons = [
+                (row.id, row.latitude, row.longitude)
+                for row in db.query(Lesson.id, Course.latitude, Course.longitude)
+                .join(Course, Lesson.course_id == Course.id)
+                .filter(Course.latitude.isnot(None)).all()
+            ]
+            self.users = db.query(func.max(User.id)).scalar() or 0
+            self.faculties = [row[0] for row in db.query(Faculty.id).all()]
+        finally:
+            db.close()
+
+    def user_headers(self, rng):
+        return {"Authorization": f"Bearer {token_for(rng.randint(1, self.users))}"}
+
+
+def _scenarios(data: Dataset):
+    def courses(rng):
+        return "GET", "/courses/", {"params": {"limit": 100}}
+
+    def notes_sorted(rng):
+        return "GET", f"/notes/{rng.choice(data.note_courses)}/notes-sorted", {"params": {"limit": 50}}
+
+    def nearby(rng):
+        _, lat, lon = rng.choice(data.courses)
+        return "GET", "/location/courses/nearby", {
+            "params": {"latitude": lat, "longitude": lon, "radius_meters": 1000},
+            "headers": data.user_headers(rng),
+        }
+
+    def checkin(rng):
+        lesson_id, lat, lon = rng.choice(data.lessons)
+        return "POST", f"/lessons/{lesson_id}/check-in", {
+            "json": {"latitude": lat, "longitude": lon},
+            "headers": data.user_headers(rng),
+        }
+
+    def lessons_now(rng):
+        _, lat, lon = rng.choice(data.courses)
+        at = f"2026-01-{rng.randint(5, 9):02d}T{rng.randint(8, 18):02d}:{rng.choice(['00', '30'])}:00"
+        return "GET", "/lessons/now", {"params": {"at": at, "latitude": lat, "longitude": lon}}
+
+    def users_me(rng):
+        return "GET", "/users/me", {"headers": data.user_headers(rng)}
+
+    def search(rng):
+        # Ricerca mentre si scrive: prefissi di parole reali, a volte con un errore
+        from benchmarks.seed import SUBJECTS
+        words = rng.choice(SUBJECTS).split()
+        query = " ".join(words[:-1] + [words[-1][:rng.randint(2, len(words[-1]))]])
+        if rng.random() < 0.2 and len(query) > 4:
+            i = rng.randrange(1, len(query) - 1)
+            query = query[:i] + query[i + 1] + query[i] + query[i + 2:]
+        return "GET", "/search/", {"params": {"q": query}, "headers": data.user_headers(rng)}
+
+    def autocomplete(rng):
+        from benchmarks.seed import SUBJECTS
+        query = rng.choice(SUBJECTS)[:rng.randint(1, 6)]
+        return "GET", "/courses/autocomplete", {"params": {"q": query}, "headers": data.user_headers(rng)}
+
+    def ranking(rng):
+        return "GET", f"/courses/faculty/{rng.choice(data.faculties)}/ranking", {}
+
+    return {
+        "courses": courses,
+        "notes_sorted": notes_sorted,
+        "nearby": nearby,
+        "checkin": checkin,
+        "lessons_now": lessons_now,
+        "users_me": users_me,
+        "search": search,
+        "autocomplete": autocomplete,
+        "ranking": ranking,
+    }
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Percentile nearest-rank su una lista già ordinata."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def _drive(client, make_request, total: int, concurrency: int, rng_seed: int):
+    # La sequenza di richieste è generata prima: non dipende dall'ordine dei worker
+    rng = random.Random(rng_seed)
+    requests = [make_request(rng) for _ in range(total)]
+    latencies, statuses = [], Counter()
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < len(requests):
+            method, url, kwargs = requests[next_index]
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                statuses[response.status_code] += 1
+            except Exception as exc:  # connessione rifiutata, timeout...
+                statuses[type(exc).__name__] += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - started
+
+
+def _summary(latencies, statuses, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if not (isinstance(status, int) and status < 400))
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "status_counts": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        "p50_ms": round(percentile(ordered, 50), 3),
+        "p95_ms": round(percentile(ordered, 95), 3),
+        "p99_ms": round(percentile(ordered, 99), 3),
+        "mean_ms": round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+        "max_ms": round(ordered[-1], 3) if ordered else 0.0,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+async def run(args) -> dict:
+    import httpx
+
+    data = Dataset()
+    scenarios = _scenarios(data)
+    selected = args.scenarios or list(scenarios)
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=30)
+    else:
+        from main import app
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=30)
+
+    results = {}
+    async with client:
+        for index, name in enumerate(selected):
+            seed = args.random_seed + index
+            if args.warmup:
+                await _drive(client, scenarios[name], args.warmup, args.concurrency, seed + 1000)
+            latencies, statuses, elapsed = await _drive(
+                client, scenarios[name], args.requests, args.concurrency, seed
+            )
+            results[name] = _summary(latencies, statuses, elapsed)
+            print(f"{name:>14}  p50 {results[name]['p50_ms']:8.2f} ms  p95 {results[name]['p95_ms']:8.2f} ms  "
+                  f"p99 {results[name]['p99_ms']:8.2f} ms  {results[name]['throughput_rps']:8.1f} req/s  "
+                  f"errors {results[name]['errors']}", file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark di carico degli endpoint principali")
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    parser.add_argument("--base-url", default=None, help="server già avviato (default: app in-process)")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--no-seed", action="store_true", help="riusa i dati già presenti")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000, help="richieste misurate per scenario")
+    parser.add_argument("--warmup", type=int, default=100, help="richieste non misurate per scenario")
+    parser.add_argument("--scenarios", nargs="*", choices=["courses", "notes_sorted", "nearby", "checkin", "lessons_now", "users_me", "search", "autocomplete", "ranking"])
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="default: benchmarks/results/<commit>.json")
+    args = parser.parse_args()
+
+    # Prima di qualunque import dell'app: database e Firebase del benchmark, mai quelli del .env
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from benchmarks.firebase_stub import install
+    install()
+
+    seeded = None
+    if not args.no_seed:
+        from benchmarks.seed import seed
+        seeded = seed(args.scale, args.random_seed)
+
+    results = asyncio.run(run(args))
+
+    commit = _git("rev-parse", "HEAD")
+    report = {
+        "meta": {
+            "git_commit": commit,
+            "git_dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mode": "http" if args.base_url else "asgi",
+            "database": args.database_url.split("://", 1)[0],
+            "scale": args.scale,
+            "seeded_rows": seeded,
+            "concurrency": args.concurrency,
+            "requests_per_scenario": args.requests,
+            "warmup_per_scenario": args.warmup,
+            "random_seed": args.random_seed,
+            "env": {name: os.environ[name] for name in RELEVANT_ENV if name in os.environ},
+        },
+        "scenarios": results,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit[:12] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
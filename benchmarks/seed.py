@@ -0,0 +1,186 @@
+# benchmarks/seed.py
+#
+# Popola un database di benchmark con dati sintetici e deterministici
+# (stesso `seed` e stessa `scale` => stessi dati). ATTENZIONE: `seed()`
+# cancella e ricrea tutte le tabelle, va puntato solo su un database usa-e-getta.
+# Il database è sempre quello passato con --database-url, mai quello del .env.
+#
+#   python -m benchmarks.seed --scale 1 [--database-url postgresql://localhost/uniadvisor_bench]
+
+import argparse
+import os
+import random
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import text
+
+# Centro delle coordinate sintetiche (Roma)
+CENTER_LAT, CENTER_LON = 41.9, 12.5
+DEFAULT_DATABASE_URL = "sqlite:///benchmarks/bench.db"
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+# Vocabolario per nomi e descrizioni realistici (serve allo scenario "search")
+SUBJECTS = [
+    "Analisi Matematica", "Geometria", "Fisica Generale", "Chimica Organica", "Informatica",
+    "Algoritmi e Strutture Dati", "Basi di Dati", "Economia Aziendale", "Diritto Privato",
+    "Statistica", "Elettrotecnica", "Meccanica Razionale", "Biologia Molecolare", "Storia Contemporanea",
+    "Letteratura Italiana", "Filosofia Teoretica", "Sistemi Operativi", "Reti di Calcolatori",
+]
+SURNAMES = ["Rossi", "Bianchi", "Romano", "Colombo", "Ricci", "Marino", "Greco", "Bruno", "Gallo", "Conti"]
+NOTE_TOPICS = ["esercizi svolti", "riassunto", "appunti delle lezioni", "domande d'esame", "formulario", "schemi"]
+CHUNK = 5000
+
+
+def sizes(scale: float) -> dict:
+    """Numero di righe per tabella a una data scala (scale=1 ~ un ateneo piccolo)."""
+    def n(base):
+        return max(1, int(base * scale))
+    return {
+        "faculties": n(5),
+        "teachers": n(50),
+        "courses": n(200),
+        "lessons_per_course": 3,
+        "users": n(1000),
+        "notes": n(2000),
+        "ratings_per_note": 5,
+        "reviews_per_course": 20,
+    }
+
+
+def _insert(conn, model, rows):
+    for start in range(0, len(rows), CHUNK):
+        conn.execute(model.__table__.insert(), rows[start:start + CHUNK])
+
+
+def _reset_sequences(conn, models):
+    # Gli id sono espliciti: su PostgreSQL le sequence vanno riallineate
+    if conn.dialect.name != "postgresql":
+        return
+    for model in models:
+        table = model.__tablename__
+        pk = next(iter(model.__table__.primary_key.columns)).name
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', '{pk}'), COALESCE(MAX({pk}), 1)) FROM {table}"
+        ))
+
+
+def seed(scale: float = 1.0, random_seed: int = 42) -> dict:
+    import models  # noqa: F401  (registra tutti i mapper)
+    from database.database import Base, SessionLocal, engine
+    from models import Course, Faculty, Lesson, Note, NoteRating, Review, Teacher, User
+    from services.course_ratings import rebuild_course_rating_stats
+    from services.note_ratings import rebuild_note_rating_stats
+
+    from benchmarks.firebase_stub import token_for
+
+    rng = random.Random(random_seed)
+    counts = sizes(scale)
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    faculties = [
+        {
+            "id": i, "name": f"Faculty {i}",
+            "latitude": CENTER_LAT + rng.uniform(-0.03, 0.03),
+            "longitude": CENTER_LON + rng.uniform(-0.03, 0.03),
+            "building_name": f"Building {i}",
+        }
+        for i in range(1, counts["faculties"] + 1)
+    ]
+    teachers = [{"id": i, "name": f"{SURNAMES[i % len(SURNAMES)]} {i}"} for i in range(1, counts["teachers"] + 1)]
+
+    courses = []
+    for i in range(1, counts["courses"] + 1):
+        faculty = faculties[(i - 1) % len(faculties)]
+        courses.append({
+            "id": i, "name": f"{SUBJECTS[i % len(SUBJECTS)]} {i}",
+            "faculty_id": faculty["id"],
+            "teacher_id": rng.randint(1, len(teachers)),
+            "room_number": f"{rng.randint(1, 4)}{rng.randint(0, 30):02d}",
+            "building_name": faculty["building_name"],
+            # Aule entro ~500 m dalla sede della facoltà
+            "latitude": faculty["latitude"] + rng.uniform(-0.0045, 0.0045),
+            "longitude": faculty["longitude"] + rng.uniform(-0.006, 0.006),
+            "floor": rng.randint(0, 4),
+        })
+
+    lessons = []
+    for course in courses:
+        for _ in range(counts["lessons_per_course"]):
+            start = rng.randint(8, 17)
+            lessons.append({
+                "id": len(lessons) + 1,
+                "course_id": course["id"],
+                "day_of_week": rng.choice(WEEKDAYS),
+                "start_time": time(start, 0),
+                "end_time": time(start + 2, 0),
+                "checkins": 0,
+            })
+
+    users = [
+        {
+            "id": i, "firebase_uid": token_for(i), "email": f"{token_for(i)}@bench.uniadvisor.it",
+            "is_admin": i == 1, "first_name": "Bench", "last_name": f"User {i}",
+            "birth_date": date(2000, 1, 1) + timedelta(days=rng.randint(0, 2000)),
+            "city": "Roma", "faculty_id": faculties[(i - 1) % len(faculties)]["id"],
+        }
+        for i in range(1, counts["users"] + 1)
+    ]
+
+    now = datetime(2026, 1, 1)
+    notes = [
+        {
+            "id": i, "course_id": rng.randint(1, len(courses)), "student_id": rng.randint(1, len(users)),
+            "file_id": f"https://storage.example.com/notes/{i}.pdf", "description": f"{rng.choice(NOTE_TOPICS).capitalize()} di {rng.choice(SUBJECTS)} ({i})",
+            "created_at": now - timedelta(minutes=rng.randint(0, 525600)),
+        }
+        for i in range(1, counts["notes"] + 1)
+    ]
+
+    ratings = []
+    per_note = min(counts["ratings_per_note"], len(users))
+    for note in notes:
+        for student_id in rng.sample(range(1, len(users) + 1), per_note):
+            ratings.append({
+                "id": len(ratings) + 1, "note_id": note["id"], "student_id": student_id,
+                "rating": rng.randint(1, 5), "created_at": note["created_at"],
+            })
+
+    reviews = []
+    per_course = min(counts["reviews_per_course"], len(users))
+    for course in courses:
+        for student_id in rng.sample(range(1, len(users) + 1), per_course):
+            reviews.append({
+                "id": len(reviews) + 1, "course_id": course["id"], "student_id": student_id,
+                "rating_clarity": rng.randint(1, 5), "rating_feasibility": rng.randint(1, 5),
+                "rating_availability": rng.randint(1, 5),
+            })
+
+    tables = [
+        (Faculty, faculties), (Teacher, teachers), (Course, courses), (Lesson, lessons),
+        (User, users), (Note, notes), (NoteRating, ratings), (Review, reviews),
+    ]
+    with engine.begin() as conn:
+        for model, rows in tables:
+            _insert(conn, model, rows)
+        _reset_sequences(conn, [model for model, _ in tables])
+
+    db = SessionLocal()
+    try:
+        rebuild_course_rating_stats(db)
+        rebuild_note_rating_stats(db)
+    finally:
+        db.close()
+
+    return {model.__tablename__: len(rows) for model, rows in tables}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Popola il database di benchmark con dati sintetici")
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--random-seed", type=int, default=42)
+    args = parser.parse_args()
+    # Prima di importare database.database: ha la precedenza sul .env
+    os.environ["DATABASE_URL"] = args.database_url
+    print(seed(args.scale, args.random_seed))
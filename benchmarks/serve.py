@@ -0,0 +1,36 @@
+# benchmarks/serve.py
+#
+# Avvia l'app con il Firebase finto, per misurare un server vero con
+# `python -m benchmarks.run --base-url http://127.0.0.1:8000 --no-seed`
+# (dopo `python -m benchmarks.seed` sullo stesso database).
+#
+#   python -m benchmarks.serve [--database-url ...] [--port 8000] [--workers 1]
+
+import argparse
+import os
+
+from benchmarks.firebase_stub import install
+from benchmarks.seed import DEFAULT_DATABASE_URL
+
+# Ogni worker uvicorn importa `benchmarks.serve:app`, quindi lo stub viene
+# installato in tutti i processi prima di importare l'app.
+if __name__ != "__main__":
+    os.environ.setdefault("DATABASE_URL", DEFAULT_DATABASE_URL)
+    install()
+    from main import app  # noqa: E402,F401
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Server dell'app con Firebase finto, per i benchmark")
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    install()  # genera le credenziali una volta sola: i worker le ereditano dall'ambiente
+    uvicorn.run("benchmarks.serve:app", host=args.host, port=args.port, workers=args.workers)
@@ -0,0 +1,77 @@
+# cache/__init__.py
+#
+# Sottosistema di cache. CACHE_BACKEND sceglie dove stanno le voci delle
+# cache condivisibili:
+#   - "memory" (default): LRU nel processo; con più worker le invalidazioni
+#     passano dal broker pub/sub (PUBSUB_BACKEND=unix);
+#   - "redis": server che parla il protocollo Redis in CACHE_URL
+#     (redis://[:password@]host:port/db), condiviso da tutti i worker.
+#     In sviluppo: `python -m benchmarks.resp_stub`.
+#
+# Le cache sul percorso caldo dell'event loop (es. le identità) restano
+# comunque in memoria (`local=True`), con invalidazione tra worker.
+#
+# Negli endpoint una cache si riceve come dependency, es.
+# `cache: ResponseCache = Depends(get_response_cache)`, così si può
+# sostituire con `app.dependency_overrides`.
+
+import os
+import threading
+from typing import Dict, Optional
+
+from cache.backends import CacheBackend, CacheError, MemoryBackend
+from cache.core import Cache
+from cache.resp import RedisBackend, RespClient
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_URL = os.getenv("CACHE_URL", "redis://127.0.0.1:6379/0")
+# Prefisso delle chiavi: più app (o ambienti) possono usare lo stesso server
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "uniadvisor:")
+# Timeout di rete (secondi): oltre, la cache si comporta come vuota
+CACHE_TIMEOUT = float(os.getenv("CACHE_TIMEOUT", "0.5"))
+CACHE_POOL_SIZE = int(os.getenv("CACHE_POOL_SIZE", "16"))
+
+_caches: Dict[str, Cache] = {}
+_shared_backend: Optional[CacheBackend] = None
+_lock = threading.Lock()
+
+
+def shared_backend() -> Optional[CacheBackend]:
+    """Backend condiviso del processo, None con CACHE_BACKEND=memory."""
+    global _shared_backend
+    if CACHE_BACKEND == "memory":
+        return None
+    if CACHE_BACKEND != "redis":
+        raise ValueError(f"Unknown CACHE_BACKEND: {CACHE_BACKEND}")
+    if _shared_backend is None:
+        with _lock:
+            if _shared_backend is None:
+                client = RespClient(CACHE_URL, timeout=CACHE_TIMEOUT, pool_size=CACHE_POOL_SIZE)
+                _shared_backend = RedisBackend(client, prefix=CACHE_KEY_PREFIX)
+    return _shared_backend
+
+
+def make_cache(namespace: str, max_entries: int, ttl: float, local: bool = False) -> Cache:
+    """
+    Crea (una volta per processo) la cache `namespace`. `max_entries` vale
+    per il backend in memoria; `local=True` la tiene in memoria anche con
+    CACHE_BACKEND=redis.
+    """
+    with _lock:
+        if namespace in _caches:
+            raise ValueError(f"Cache '{namespace}' already exists")
+    backend = None if local else shared_backend()
+    cache = Cache(namespace, backend if backend is not None else MemoryBackend(max_entries), ttl)
+    with _lock:
+        _caches[namespace] = cache
+    return cache
+
+
+def get_cache(namespace: str) -> Cache:
+    return _caches[namespace]
+
+
+__all__ = [
+    "Cache", "CacheBackend", "CacheError", "MemoryBackend", "RedisBackend", "RespClient",
+    "get_cache", "make_cache", "shared_backend",
+]
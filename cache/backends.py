@@ -0,0 +1,128 @@
+# cache/backends.py
+#
+# Backend della cache: dove stanno fisicamente le voci. L'interfaccia è
+# minima (get/set/delete per chiave, invalidazione per tag) e non conosce
+# namespace, serializzazione o single-flight, che sono in cache/core.py.
+#
+# Invalidazione per tag con versioni: ogni tag ha un contatore, ogni voce
+# ricorda le versioni dei propri tag al momento in cui il valore è stato
+# CALCOLATO (non salvato). Invalidare un tag ne incrementa la versione in
+# O(1); una voce con una versione vecchia è considerata assente. Così anche
+# un valore calcolato prima di un'invalidazione e salvato dopo è già scaduto.
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+class CacheError(Exception):
+    """Backend non raggiungibile o risposta non valida: la cache si comporta come vuota."""
+
+
+class CacheBackend(ABC):
+    # True se il backend è condiviso tra i worker (es. Redis): i valori vanno
+    # serializzati in bytes, le chiamate fanno I/O di rete e non serve
+    # propagare le invalidazioni con il pub/sub.
+    shared = False
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """Valore della chiave, None se assente, scaduto o invalidato."""
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float, tags: Tuple[str, ...] = (),
+            versions: Optional[Tuple[int, ...]] = None):
+        """
+        Salva `value` per `ttl` secondi. `versions` sono le versioni dei tag
+        lette con `tag_versions` PRIMA di calcolare il valore (default: quelle
+        correnti).
+        """
+
+    @abstractmethod
+    def delete(self, *keys: str):
+        pass
+
+    @abstractmethod
+    def tag_versions(self, tags: Tuple[str, ...]) -> Tuple[int, ...]:
+        pass
+
+    @abstractmethod
+    def invalidate(self, *tags: str):
+        """Rende assenti tutte le voci con almeno uno dei tag."""
+
+    @abstractmethod
+    def clear(self, prefix: str = ""):
+        """Elimina le voci con chiave che inizia per `prefix` (tutte con prefix vuoto)."""
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """
+    LRU in memoria, thread-safe, con scadenza per voce e versioni dei tag.
+    Superata `max_entries` viene scartata la voce usata meno di recente;
+    `max_entries` <= 0 disattiva la cache. Locale al processo.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # chiave -> (valore, scadenza monotonic, tag, versioni dei tag)
+        self._data: "OrderedDict[str, Tuple[Any, float, Tuple[str, ...], Tuple[int, ...]]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _current(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self._versions.get(tag, 0) for tag in tags)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at, tags, versions = entry
+            if expires_at <= time.monotonic() or (tags and self._current(tags) != versions):
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float, tags: Tuple[str, ...] = (),
+            versions: Optional[Tuple[int, ...]] = None):
+        if self.max_entries <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            current = self._current(tags)
+            if versions is not None and versions != current:
+                return  # invalidato mentre il valore veniva calcolato
+            self._data[key] = (value, time.monotonic() + ttl, tuple(tags), current)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def tag_versions(self, tags: Tuple[str, ...]) -> Tuple[int, ...]:
+        with self._lock:
+            return self._current(tags)
+
+    def invalidate(self, *tags: str):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def clear(self, prefix: str = ""):
+        with self._lock:
+            if not prefix:
+                self._data.clear()
+                return
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,259 @@
+# cache/core.py
+#
+# `Cache`: una cache con namespace sopra un backend (cache/backends.py,
+# cache/resp.py). Aggiunge:
+#   - chiavi e tag con il prefisso del namespace, TTL di default;
+#   - serializzazione (pickle) per i backend condivisi: in memoria i valori
+#     restano oggetti Python, quindi NON vanno modificati dopo `set`;
+#   - single-flight: con `get_or_set` / `aget_or_set`, se molte richieste
+#     trovano la stessa chiave assente il valore viene calcolato una volta
+#     sola e le altre attendono il risultato (niente stampede sul DB);
+#   - invalidazione tra worker: con un backend locale `delete`, `invalidate`
+#     e `clear` vengono pubblicati sul canale "cache" del broker
+#     (services/pubsub.py, PUBSUB_BACKEND=unix con più worker) e applicati
+#     dagli altri processi. Con un backend condiviso non serve.
+#
+# Gli errori del backend (server irraggiungibile, timeout) non arrivano
+# agli endpoint: vengono loggati e la cache si comporta come vuota.
+#
+# Nota: None non viene messo in cache (per il backend vuol dire "assente").
+
+import asyncio
+import logging
+import os
+import pickle
+import threading
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from cache.backends import CacheBackend, CacheError
+from services.pubsub import get_broker
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache"
+
+_MISSING = object()
+
+
+class _Flight:
+    """Calcolo in corso di una chiave, atteso dai thread arrivati dopo il primo."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._value = None
+        self._error: Optional[BaseException] = None
+
+    def finish(self, value):
+        self._value = value
+        self._done.set()
+
+    def fail(self, error: BaseException):
+        self._error = error
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class Cache:
+    """Cache con namespace, TTL, tag e single-flight sopra un `CacheBackend`."""
+
+    def __init__(self, namespace: str, backend: CacheBackend, ttl: float):
+        self.namespace = namespace
+        self.backend = backend
+        self.ttl = ttl
+        self._prefix = f"{namespace}:"
+        self._flights: Dict[str, _Flight] = {}
+        self._flights_lock = threading.Lock()
+        self._async_flights: Dict[Tuple[int, str], asyncio.Future] = {}
+        if not backend.shared:
+            _local_caches[namespace] = self
+
+    def _key(self, key) -> str:
+        return f"{self._prefix}{key}"
+
+    def _tags(self, tags: Iterable[str]) -> Tuple[str, ...]:
+        return tuple(f"{self._prefix}{tag}" for tag in tags)
+
+    def _safe(self, operation: str, fn, *args, default=None):
+        try:
+            return fn(*args)
+        except CacheError as exc:
+            logger.warning("Cache backend error", extra={"cache": self.namespace, "operation": operation, "error": str(exc)})
+            return default
+
+    # --- Operazioni sincrone ----------------------------------------------
+
+    def get(self, key, default=None):
+        if not self.backend.shared:
+            _listen()
+        raw = self._safe("get", self.backend.get, self._key(key))
+        if raw is None:
+            return default
+        if not self.backend.shared:
+            return raw
+        try:
+            return pickle.loads(raw)
+        except Exception:
+            logger.warning("Undecodable cache entry ignored", extra={"cache": self.namespace})
+            return default
+
+    def _store(self, key, value, ttl: Optional[float], tags: Tuple[str, ...], versions: Optional[Tuple[int, ...]]):
+        if value is None:
+            return
+        if self.backend.shared:
+            value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._safe("set", self.backend.set, self._key(key), value, self.ttl if ttl is None else ttl, tags, versions)
+
+    def set(self, key, value, ttl: Optional[float] = None, tags: Iterable[str] = ()):
+        self._store(key, value, ttl, self._tags(tags), None)
+
+    def _versions(self, tags: Tuple[str, ...]) -> Optional[Tuple[int, ...]]:
+        return self._safe("tag_versions", self.backend.tag_versions, tags) if tags else ()
+
+    def delete(self, *keys):
+        """Elimina le chiavi, anche negli altri worker."""
+        self.apply_delete(keys)
+        self._broadcast(keys=[str(key) for key in keys])
+
+    def invalidate(self, *tags: str):
+        """Invalida le voci con uno dei tag, anche negli altri worker."""
+        self.apply_invalidate(tags)
+        self._broadcast(tags=list(tags))
+
+    def clear(self):
+        self.apply_clear()
+        self._broadcast(clear=True)
+
+    # Le stesse operazioni, solo in questo processo (chiamate dal pub/sub)
+    def apply_delete(self, keys):
+        self._safe("delete", self.backend.delete, *(self._key(key) for key in keys))
+
+    def apply_invalidate(self, tags):
+        self._safe("invalidate", self.backend.invalidate, *self._tags(tags))
+
+    def apply_clear(self):
+        self._safe("clear", self.backend.clear, self._prefix)
+
+    def _broadcast(self, **change):
+        if self.backend.shared:
+            return
+        get_broker().publish(CHANNEL, {"origin": os.getpid(), "namespace": self.namespace, **change})
+
+    def get_or_set(self, key, loader: Callable[[], Any], ttl: Optional[float] = None, tags: Iterable[str] = ()):
+        """Valore in cache o, se manca, `loader()`: un solo calcolo per chiave anche con più thread."""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        full_key = self._key(key)
+        with self._flights_lock:
+            flight = self._flights.get(full_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[full_key] = _Flight()
+        if not leader:
+            return flight.wait()
+        try:
+            tags = self._tags(tags)
+            versions = self._versions(tags)
+            value = loader()
+            self._store(key, value, ttl, tags, versions)
+        except BaseException as exc:
+            flight.fail(exc)
+            raise
+        else:
+            flight.finish(value)
+            return value
+        finally:
+            with self._flights_lock:
+                self._flights.pop(full_key, None)
+
+    # --- Operazioni dall'event loop ---------------------------------------
+
+    async def _call(self, fn, *args, **kwargs):
+        # I backend condivisi fanno I/O bloccante: fuori dall'event loop
+        if self.backend.shared:
+            return await run_in_threadpool(fn, *args, **kwargs)
+        return fn(*args, **kwargs)
+
+    async def aget(self, key, default=None):
+        return await self._call(self.get, key, default)
+
+    async def aset(self, key, value, ttl: Optional[float] = None, tags: Iterable[str] = ()):
+        await self._call(self.set, key, value, ttl, tags)
+
+    async def aget_or_set(self, key, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None,
+                          tags: Iterable[str] = ()):
+        """Come `get_or_set` con un loader asincrono: le richieste concorrenti attendono il primo calcolo."""
+        value = await self.aget(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), self._key(key))
+        while True:
+            future = self._async_flights.get(flight_key)
+            if future is None:
+                break
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Richiesta del primo calcolo annullata (client disconnesso): si riprova
+                if not future.cancelled():
+                    raise
+        future = loop.create_future()
+        self._async_flights[flight_key] = future
+        try:
+            tags = self._tags(tags)
+            versions = await self._call(self._versions, tags)
+            value = await loader()
+            await self._call(self._store, key, value, ttl, tags, versions)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # segna l'eccezione come letta anche senza altri in attesa
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            self._async_flights.pop(flight_key, None)
+
+
+# --- Invalidazione tra worker ---------------------------------------------
+
+_local_caches: Dict[str, Cache] = {}
+_listening = False
+_listen_lock = threading.Lock()
+
+
+def _on_message(message: dict):
+    if message.get("origin") == os.getpid():
+        return  # già applicata da chi l'ha pubblicata
+    cache = _local_caches.get(message.get("namespace"))
+    if cache is None:
+        return
+    if message.get("clear"):
+        cache.apply_clear()
+    if message.get("keys"):
+        cache.apply_delete(message["keys"])
+    if message.get("tags"):
+        cache.apply_invalidate(message["tags"])
+
+
+def _listen():
+    # Al primo uso di una cache locale: un worker che non l'ha mai usata non
+    # ha nulla da invalidare (e non apre il socket del broker)
+    global _listening
+    if _listening:
+        return
+    with _listen_lock:
+        if not _listening:
+            get_broker().subscribe(CHANNEL, _on_message)
+            _listening = True
@@ -0,0 +1,259 @@
+# cache/resp.py
+#
+# Backend condiviso tra worker e macchine: un server che parla il
+# protocollo di Redis (RESP2), quindi Redis, Valkey, KeyDB o lo stand-in
+# di sviluppo `python -m benchmarks.resp_stub`.
+#
+# Il client è volutamente minimo (nessuna dipendenza in più): connessioni
+# TCP bloccanti in un piccolo pool, comandi singoli o in pipeline. Usa solo
+# GET, SET PX, DEL, MGET, INCR, SCAN, più AUTH/SELECT dall'URL.
+#
+# Formato delle voci: `<lunghezza header>\n<header JSON><valore>`, dove
+# l'header contiene tag e versioni dei tag (vedi cache/backends.py); le
+# versioni stanno in chiavi `<prefix>tags/<tag>` incrementate con INCR.
+
+import json
+import socket
+import threading
+from typing import Any, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlsplit
+
+from cache.backends import CacheBackend, CacheError
+
+
+class RespError(CacheError):
+    """Errore restituito dal server (risposta `-ERR ...`)."""
+
+
+def _encode(args: Sequence[Any]) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        elif isinstance(arg, int):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+def _int(value: bytes) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        raise CacheError(f"Malformed reply from the cache server: {value[:32]!r}") from None
+
+
+def _read_reply(stream):
+    line = stream.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection closed by the cache server")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest
+    if kind == b"-":
+        return RespError(rest.decode(errors="replace"))
+    if kind == b":":
+        return _int(rest)
+    if kind == b"$":
+        length = _int(rest)
+        if length < 0:
+            return None
+        data = stream.read(length + 2)
+        if len(data) != length + 2:
+            raise ConnectionError("Connection closed by the cache server")
+        return data[:-2]
+    if kind == b"*":
+        length = _int(rest)
+        if length < 0:
+            return None
+        return [_read_reply(stream) for _ in range(length)]
+    raise CacheError(f"Unexpected reply from the cache server: {line[:32]!r}")
+
+
+class _Connection:
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.stream = self.sock.makefile("rb")
+
+    def call(self, commands: Sequence[Sequence[Any]]) -> list:
+        self.sock.sendall(b"".join(_encode(command) for command in commands))
+        return [_read_reply(self.stream) for _ in commands]
+
+    def close(self):
+        try:
+            self.stream.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RespClient:
+    """
+    Client RESP thread-safe: ogni chiamata prende una connessione dal pool
+    (o ne apre una) e la restituisce a fine comando. Un errore di rete chiude
+    la connessione e la chiamata viene ritentata una volta su una nuova.
+    """
+
+    def __init__(self, url: str, timeout: float = 0.5, pool_size: int = 16):
+        parts = urlsplit(url)
+        if parts.scheme not in ("redis", "resp"):
+            raise ValueError(f"Unsupported cache URL scheme: {parts.scheme}")
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.username = unquote(parts.username) if parts.username else None
+        self.db = int(parts.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._idle: List[_Connection] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> _Connection:
+        connection = _Connection(self.host, self.port, self.timeout)
+        setup = []
+        if self.password is not None:
+            setup.append(("AUTH", self.username, self.password) if self.username else ("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            try:
+                replies = connection.call(setup)
+            except BaseException:
+                connection.close()
+                raise
+            for reply in replies:
+                if isinstance(reply, RespError):
+                    connection.close()
+                    raise reply
+        return connection
+
+    def _acquire(self) -> _Connection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def _release(self, connection: _Connection):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def pipeline(self, commands: Sequence[Sequence[Any]]) -> list:
+        """Invia i comandi in un solo round trip; solleva il primo errore del server."""
+        for attempt in (1, 2):
+            try:
+                connection = self._acquire()
+            except OSError as exc:
+                raise CacheError(f"Cache server unreachable: {exc}") from exc
+            try:
+                replies = connection.call(commands)
+            except (OSError, ConnectionError) as exc:
+                connection.close()
+                if attempt == 2:
+                    raise CacheError(f"Cache server error: {exc}") from exc
+                continue
+            except CacheError:
+                # Risposta illeggibile: la connessione non è più allineata al protocollo
+                connection.close()
+                raise
+            self._release(connection)
+            for reply in replies:
+                if isinstance(reply, RespError):
+                    raise reply
+            return replies
+
+    def execute(self, *args):
+        return self.pipeline([args])[0]
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+def _glob_escape(value: str) -> str:
+    return "".join("\\" + char if char in "*?[]\\" else char for char in value)
+
+
+class RedisBackend(CacheBackend):
+    """Backend su server RESP, condiviso da tutti i worker che usano lo stesso URL e prefisso."""
+
+    shared = True
+
+    def __init__(self, client: RespClient, prefix: str = ""):
+        self.client = client
+        self.prefix = prefix
+
+    def _tag_keys(self, tags: Sequence[str]) -> List[str]:
+        return [f"{self.prefix}tags/{tag}" for tag in tags]
+
+    @staticmethod
+    def _pack(value: bytes, tags: Tuple[str, ...], versions: Tuple[int, ...]) -> bytes:
+        header = json.dumps([list(tags), list(versions)], separators=(",", ":")).encode()
+        return b"%d\n%s%s" % (len(header), header, value)
+
+    @staticmethod
+    def _unpack(raw: bytes) -> Tuple[Tuple[str, ...], Tuple[int, ...], bytes]:
+        try:
+            newline = raw.index(b"\n")
+            start = newline + 1
+            end = start + int(raw[:newline])
+            tags, versions = json.loads(raw[start:end])
+        except ValueError as exc:
+            raise CacheError("Malformed cache entry") from exc
+        return tuple(tags), tuple(versions), raw[end:]
+
+    def get(self, key: str) -> Optional[bytes]:
+        raw = self.client.execute("GET", self.prefix + key)
+        if raw is None:
+            return None
+        tags, versions, value = self._unpack(raw)
+        if tags and self.tag_versions(tags) != versions:
+            return None
+        return value
+
+    def set(self, key: str, value: bytes, ttl: float, tags: Tuple[str, ...] = (),
+            versions: Optional[Tuple[int, ...]] = None):
+        milliseconds = int(ttl * 1000)
+        if milliseconds <= 0:
+            return
+        if versions is None:
+            versions = self.tag_versions(tags)
+        self.client.execute("SET", self.prefix + key, self._pack(value, tuple(tags), versions), "PX", milliseconds)
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.execute("DEL", *(self.prefix + key for key in keys))
+
+    def tag_versions(self, tags: Tuple[str, ...]) -> Tuple[int, ...]:
+        if not tags:
+            return ()
+        values = self.client.execute("MGET", *self._tag_keys(tags))
+        try:
+            return tuple(int(value) if value is not None else 0 for value in values)
+        except (TypeError, ValueError) as exc:
+            raise CacheError("Malformed tag version") from exc
+
+    def invalidate(self, *tags: str):
+        if tags:
+            self.client.pipeline([("INCR", key) for key in self._tag_keys(tags)])
+
+    def clear(self, prefix: str = ""):
+        pattern = _glob_escape(self.prefix + prefix) + "*"
+        cursor = b"0"
+        while True:
+            try:
+                cursor, keys = self.client.execute("SCAN", cursor, "MATCH", pattern, "COUNT", 1000)
+            except (TypeError, ValueError) as exc:
+                raise CacheError("Malformed SCAN reply") from exc
+            if keys:
+                self.client.execute("DEL", *keys)
+            if cursor == b"0":
+                return
+
+    def close(self):
+        self.client.close()
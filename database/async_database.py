@@ -0,0 +1,133 @@
+import importlib
+import logging
+import os
+from typing import Any, Callable, Union
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from database.database import (
+    SQLALCHEMY_DATABASE_URL, SessionLocal,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+    DB_PGBOUNCER, DB_STATEMENT_TIMEOUT_MS,
+)
+from database.profiler import PROFILER_ENABLED, attach as attach_profiler
+
+# Con DB_ASYNC=true gli endpoint "caldi" usano asyncpg e non occupano il
+# threadpool di FastAPI; altrimenti (default, e nei test) usano la Session
+# sincrona di sempre, eseguita nel threadpool.
+ASYNC_DB_ENABLED = os.getenv("DB_ASYNC", "false").lower() == "true"
+
+# Driver async per dialetto. asyncpg è in requirements.txt; aiosqlite serve
+# solo per provare DB_ASYNC in locale su SQLite e va installato a parte.
+_ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+logger = logging.getLogger(__name__)
+
+
+def _async_url(database_url: str):
+    """URL con il driver async del dialetto, None se il driver non è installato."""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    driver = _ASYNC_DRIVERS.get(backend)
+    if driver is None:
+        return None
+    try:
+        importlib.import_module(driver)
+    except ImportError:
+        return None
+    return url.set(drivername=f"{backend}+{driver}")
+
+
+def _async_engine_options(url) -> dict:
+    if url.get_backend_name() != "postgresql":
+        return {}
+
+    connect_args = {}
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "connect_args": connect_args}
+    if DB_PGBOUNCER:
+        # PgBouncer in transaction mode non supporta i prepared statement
+        # che asyncpg mette in cache per connessione.
+        options["poolclass"] = NullPool
+        connect_args["statement_cache_size"] = 0
+        connect_args["prepared_statement_cache_size"] = 0
+    else:
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+        if DB_STATEMENT_TIMEOUT_MS > 0:
+            connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    return options
+
+
+async_engine = None
+AsyncSessionLocal = None
+
+_url = _async_url(SQLALCHEMY_DATABASE_URL) if ASYNC_DB_ENABLED else None
+if ASYNC_DB_ENABLED and _url is None:
+    # Meglio il threadpool che un avvio fallito con ImportError
+    logger.warning(
+        "DB_ASYNC is set but no async driver is installed for this database; using the sync session",
+        extra={"backend": make_url(SQLALCHEMY_DATABASE_URL).get_backend_name()},
+    )
+    ASYNC_DB_ENABLED = False
+
+if ASYNC_DB_ENABLED:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(_url, **_async_engine_options(_url))
+    # expire_on_commit=False: dopo il commit gli oggetti vengono serializzati
+    # fuori dalla sessione e non possono ricaricare gli attributi in modo lazy.
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    if DB_PGBOUNCER and DB_STATEMENT_TIMEOUT_MS > 0 and _url.get_backend_name() == "postgresql":
+        # Come in database/database.py: con PgBouncer il timeout non può stare
+        # nei server_settings della connessione, va reimpostato con SET LOCAL
+        # all'inizio di ogni transazione.
+        @event.listens_for(async_engine.sync_engine, "begin")
+        def _set_statement_timeout(connection):
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+    if PROFILER_ENABLED:
+        attach_profiler(async_engine.sync_engine)
+    DbSession = Union[Session, AsyncSession]
+else:
+    DbSession = Session
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_session():
+    """
+    Dependency per gli endpoint async: restituisce una AsyncSession se DB_ASYNC
+    è attivo, altrimenti una Session sincrona. In entrambi i casi le query
+    vanno eseguite tramite `run_db`.
+    """
+    if ASYNC_DB_ENABLED:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+
+
+async def run_db(db: DbSession, fn: Callable[..., Any], *args) -> Any:
+    """
+    Esegue `fn(session, *args)`, dove `session` è sempre una Session sincrona:
+    con asyncpg gira nel greenlet di SQLAlchemy senza bloccare l'event loop,
+    altrimenti nel threadpool. Le relazioni usate dopo il return vanno caricate
+    in anticipo (selectinload/joinedload), non in modo lazy.
+    """
+    if isinstance(db, Session):
+        return await run_in_threadpool(fn, db, *args)
+    return await db.run_sync(fn, *args)
@@ -1,21 +1,101 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from dotenv import load_dotenv
 
+from database.profiler import PROFILER_ENABLED, attach as attach_profiler
+
 load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# --- Configurazione del pool di connessioni ---
+# Le impostazioni valgono per singolo worker uvicorn: con N worker il numero
+# massimo di connessioni è N * (DB_POOL_SIZE + DB_MAX_OVERFLOW).
+# Se DB_POOL_SIZE non è impostato e DB_MAX_CONNECTIONS sì, il budget totale
+# viene diviso tra i WEB_CONCURRENCY worker.
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "0"))
+WEB_CONCURRENCY = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+
+
+def _default_pool_size() -> int:
+    if DB_MAX_CONNECTIONS > 0:
+        return max(DB_MAX_CONNECTIONS // WEB_CONCURRENCY, 1)
+    return 5
+
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(_default_pool_size())))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "0" if DB_MAX_CONNECTIONS > 0 else "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Modalità compatibile con PgBouncer (transaction pooling): niente pool lato
+# applicazione, il pooling lo fa PgBouncer. psycopg2 non usa prepared
+# statement lato server, quindi non serve altro.
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+# Timeout per singola query in millisecondi (0 = nessun limite)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
+
+def _engine_options(url) -> dict:
+    if url.get_backend_name() != "postgresql":
+        return {}
+
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if DB_PGBOUNCER:
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return options
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(make_url(SQLALCHEMY_DATABASE_URL)))
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+if DB_STATEMENT_TIMEOUT_MS > 0 and engine.dialect.name == "postgresql":
+    if DB_PGBOUNCER:
+        # In transaction pooling la connessione server cambia a ogni transazione:
+        # il timeout va reimpostato con SET LOCAL all'inizio di ognuna.
+        @event.listens_for(SessionLocal, "after_begin")
+        def _set_statement_timeout(session, transaction, connection):
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+    else:
+        @event.listens_for(engine, "connect")
+        def _set_statement_timeout(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"SET statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+            cursor.close()
+            dbapi_connection.commit()
+
+# Profiler SQL opzionale (DB_PROFILER=true, vedi database/profiler.py)
+if PROFILER_ENABLED:
+    attach_profiler(engine)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def get_pool_status() -> dict:
+    """Statistiche del pool di connessioni, esposte da /health."""
+    pool = engine.pool
+    status = {"pool_class": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            status[name] = method()
+    return status
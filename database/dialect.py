@@ -0,0 +1,15 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+
+def upsert_insert(db: Session, table):
+    """
+    `INSERT` del dialetto in uso, con supporto a ON CONFLICT
+    (`on_conflict_do_update` / `on_conflict_do_nothing`).
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"ON CONFLICT not supported for dialect {dialect}")
@@ -0,0 +1,241 @@
+# database/profiler.py
+#
+# Profiler SQL opzionale (DB_PROFILER=true). Per ogni query registra testo,
+# forma dei parametri (mai i valori), durata e route di provenienza, e
+# aggrega per statement normalizzato (letterali e placeholder sostituiti da
+# `?`, liste IN compattate). In più:
+#
+#   - slow-query log: le query oltre DB_SLOW_QUERY_MS millisecondi finiscono
+#     nel logger `database.slow_query` (WARNING);
+#   - N+1: a fine richiesta, gli statement normalizzati ripetuti più di
+#     DB_NPLUS1_THRESHOLD volte nella stessa richiesta vengono segnalati.
+#
+# Il riepilogo è su GET /admin/maintenance/query-profile.
+
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+from utils.metrics import route_template
+
+# Importato da database/database.py prima della configurazione: le variabili
+# DB_PROFILER* possono stare anche nel file .env
+load_dotenv()
+
+PROFILER_ENABLED = os.getenv("DB_PROFILER", "false").lower() == "true"
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+NPLUS1_THRESHOLD = int(os.getenv("DB_NPLUS1_THRESHOLD", "10"))
+# Statement distinti tenuti in memoria; oltre, i nuovi vengono solo contati
+MAX_STATEMENTS = int(os.getenv("DB_PROFILER_MAX_STATEMENTS", "500"))
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("database.slow_query")
+
+NO_ROUTE = "<no request>"
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<!:):\w+|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(statement: str) -> str:
+    """Forma canonica di uno statement: uguale per query che differiscono solo nei valori."""
+    statement = _STRING.sub("?", statement)
+    statement = _PLACEHOLDER.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _IN_LIST.sub("(?...)", statement)
+    return _SPACES.sub(" ", statement).strip()
+
+
+def parameters_shape(parameters, executemany: bool) -> str:
+    """Descrive i parametri senza riportarne i valori (es. `dict[3]`, `4 x tuple[2]`)."""
+    def shape(params):
+        if params is None:
+            return "none"
+        return f"{type(params).__name__}[{len(params)}]" if hasattr(params, "__len__") else type(params).__name__
+
+    # Con insertmanyvalues `executemany` resta True anche per il singolo batch già appiattito
+    if executemany and parameters and isinstance(parameters[0], (dict, list, tuple)):
+        return f"{len(parameters)} x {shape(parameters[0])}"
+    return shape(parameters)
+
+
+class StatementStats:
+    __slots__ = ("statement", "count", "total_ms", "max_ms", "slow", "nplus1", "routes", "parameters")
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.slow = 0
+        self.nplus1 = 0
+        self.routes = Counter()
+        self.parameters = None
+
+    def to_dict(self) -> dict:
+        return {
+            "statement": self.statement,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "slow": self.slow,
+            "nplus1_requests": self.nplus1,
+            "routes": dict(self.routes.most_common(5)),
+            "parameters": self.parameters,
+        }
+
+
+class QueryProfile:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.statements = {}
+            self.untracked = 0
+            self.nplus1_events = deque(maxlen=100)
+            self.started_at = time.time()
+
+    def record(self, normalized: str, route: str, duration_ms: float, parameters: str):
+        with self._lock:
+            stats = self.statements.get(normalized)
+            if stats is None:
+                if len(self.statements) >= MAX_STATEMENTS:
+                    self.untracked += 1
+                    return
+                stats = self.statements[normalized] = StatementStats(normalized)
+            stats.count += 1
+            stats.total_ms += duration_ms
+            stats.max_ms = max(stats.max_ms, duration_ms)
+            stats.routes[route] += 1
+            stats.parameters = parameters
+            if duration_ms >= SLOW_QUERY_MS:
+                stats.slow += 1
+
+    def record_nplus1(self, route: str, normalized: str, count: int):
+        with self._lock:
+            stats = self.statements.get(normalized)
+            if stats is not None:
+                stats.nplus1 += 1
+            self.nplus1_events.append(
+                {"at": time.time(), "route": route, "statement": normalized, "count": count}
+            )
+
+    def summary(self, order_by: str = "total_ms", limit: int = 50) -> dict:
+        with self._lock:
+            statements = [stats.to_dict() for stats in self.statements.values()]
+            events = list(self.nplus1_events)
+            untracked = self.untracked
+            started_at = self.started_at
+        statements.sort(key=lambda item: item.get(order_by, 0), reverse=True)
+        return {
+            "since": started_at,
+            "slow_query_ms": SLOW_QUERY_MS,
+            "nplus1_threshold": NPLUS1_THRESHOLD,
+            "statements": statements[:limit],
+            "untracked_queries": untracked,
+            "nplus1": events[::-1],
+        }
+
+
+profile = QueryProfile()
+
+
+class _RequestQueries:
+    __slots__ = ("scope", "route", "counts")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.route = None
+        self.counts = Counter()
+
+    def resolve_route(self) -> str:
+        # Le query partono dall'endpoint, quando il router ha già riempito lo scope
+        if self.route is None and "endpoint" in self.scope:
+            self.route = f'{self.scope["method"]} {route_template(self.scope)}'
+        return self.route or f'{self.scope["method"]} {self.scope["path"]}'
+
+
+_current_request: contextvars.ContextVar[Optional[_RequestQueries]] = contextvars.ContextVar(
+    "profiler_request", default=None
+)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("profiler_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("profiler_query_start")
+    if not started:
+        return
+    duration_ms = (time.perf_counter() - started.pop()) * 1000
+
+    normalized = normalize(statement)
+    request = _current_request.get()
+    route = request.resolve_route() if request is not None else NO_ROUTE
+    shape = parameters_shape(parameters, executemany)
+    profile.record(normalized, route, duration_ms, shape)
+    if request is not None:
+        request.counts[normalized] += 1
+
+    if duration_ms >= SLOW_QUERY_MS:
+        slow_query_logger.warning(
+            "Slow query (%.1f ms)", duration_ms,
+            extra={"duration_ms": round(duration_ms, 3), "statement": statement[:2000],
+                   "parameters": shape, "route": route},
+        )
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    started = connection.info.get("profiler_query_start") if connection is not None else None
+    if started:
+        started.pop()
+
+
+def attach(engine):
+    """Aggancia il profiler a un engine sync (per l'async: `async_engine.sync_engine`)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class QueryProfilerMiddleware:
+    """Middleware ASGI: raccoglie le query di ogni richiesta e segnala i pattern N+1."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = _RequestQueries(scope)
+        token = _current_request.set(request)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_request.reset(token)
+            for normalized, count in request.counts.items():
+                if count > NPLUS1_THRESHOLD:
+                    route = request.resolve_route()
+                    profile.record_nplus1(route, normalized, count)
+                    logger.warning(
+                        "Possible N+1: statement repeated %d times in one request", count,
+                        extra={"route": route, "statement": normalized[:2000], "count": count},
+                    )
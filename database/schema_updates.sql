@@ -0,0 +1,65 @@
+-- database/schema_updates.sql
+--
+-- Tabelle e indici aggiunti allo schema iniziale, per PostgreSQL. Su un
+-- database nuovo li crea anche Base.metadata.create_all(); su uno esistente
+-- va applicato questo file (idempotente, si può rieseguire):
+--
+--   psql "$DATABASE_URL" -f database/schema_updates.sql
+--
+-- Poi vanno eseguiti i backfill indicati in ogni sezione (vedi README.md).
+
+
+-- Aggregati delle recensioni per corso (services/course_ratings.py).
+-- Backfill: python -m services.course_ratings
+CREATE TABLE IF NOT EXISTS course_rating_stats (
+    course_id INTEGER NOT NULL,
+    review_count INTEGER NOT NULL DEFAULT 0,
+    sum_clarity INTEGER NOT NULL DEFAULT 0,
+    sum_feasibility INTEGER NOT NULL DEFAULT 0,
+    sum_availability INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (course_id),
+    FOREIGN KEY (course_id) REFERENCES courses (id) ON DELETE CASCADE
+);
+
+
+-- Riepilogo delle valutazioni per nota (services/note_ratings.py).
+-- Backfill: python -m services.note_ratings
+CREATE TABLE IF NOT EXISTS note_rating_stats (
+    note_id INTEGER NOT NULL,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    count_1 INTEGER NOT NULL DEFAULT 0,
+    count_2 INTEGER NOT NULL DEFAULT 0,
+    count_3 INTEGER NOT NULL DEFAULT 0,
+    count_4 INTEGER NOT NULL DEFAULT 0,
+    count_5 INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (note_id),
+    FOREIGN KEY (note_id) REFERENCES notes (id) ON DELETE CASCADE
+);
+
+
+-- Registro dei check-in: una riga per studente, lezione e giorno
+-- (services/checkin_counter.py). Lo storico precedente non esiste: il
+-- registro parte vuoto. Il riallineamento dei contatori al registro
+-- (python -m services.checkin_counter) va usato dal giorno dopo il deploy:
+-- quel giorno azzererebbe i check-in fatti prima della tabella.
+CREATE TABLE IF NOT EXISTS lesson_checkins (
+    id SERIAL NOT NULL,
+    lesson_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    checkin_date DATE NOT NULL,
+    checked_in_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    PRIMARY KEY (id),
+    CONSTRAINT uq_lesson_checkins_lesson_user_date UNIQUE (lesson_id, user_id, checkin_date),
+    FOREIGN KEY (lesson_id) REFERENCES lessons (id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS ix_lesson_checkins_lesson_date ON lesson_checkins (lesson_id, checkin_date);
+CREATE INDEX IF NOT EXISTS ix_lesson_checkins_user_id ON lesson_checkins (user_id);
+
+
+-- "Lezioni in corso adesso" con TIMETABLE_INDEX_BACKEND=db
+-- (services/timetable_index.py): `day_of_week` si confronta in minuscolo.
+-- CONCURRENTLY non blocca le scritture sulle lezioni (psql -f lavora in
+-- autocommit, fuori da una transazione); nessun backfill.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_lessons_day_start ON lessons (lower(day_of_week), start_time);
@@ -1,9 +1,19 @@
 # file: main.py
 
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from routers import users, faculty, course, notes, admin, location, lessons
+from utils.log import RequestContextMiddleware, configure_logging
+
+# Prima dei router: alcuni moduli (es. auth) loggano già all'import
+configure_logging()
+
+from routers import users, faculty, course, notes, admin, location, lessons, search
+from database.database import engine, get_pool_status
+from database.async_database import async_engine
+from database.profiler import PROFILER_ENABLED, QueryProfilerMiddleware
+from utils.metrics import METRICS_ENABLED, MetricsMiddleware, instrument_engine, registry, route_templates
 
 load_dotenv()
 
@@ -27,8 +37,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Link", "X-Next-Cursor", "X-Request-ID", "ETag", "Last-Modified"],  # Paginazione a cursore, correlazione log, cache
 )
 
+# --- Request id e livelli di log per route (vedi utils/log.py) ---
+app.add_middleware(RequestContextMiddleware)
+
+# --- Metriche per route e tempo SQL per richiesta (vedi utils/metrics.py) ---
+if METRICS_ENABLED:
+    instrument_engine(engine)
+    if async_engine is not None:
+        instrument_engine(async_engine.sync_engine)
+    app.add_middleware(MetricsMiddleware)
+
+# --- Profiler SQL e rilevamento N+1 (DB_PROFILER=true, vedi database/profiler.py) ---
+if PROFILER_ENABLED:
+    app.add_middleware(QueryProfilerMiddleware)
+
 # --- Inclusione dei Router ---
 app.include_router(users.router, prefix="/users", tags=["Users & Profiles"])
 app.include_router(faculty.router, prefix="/faculties", tags=["Faculties"])
@@ -37,6 +62,7 @@ app.include_router(notes.router, prefix="/notes", tags=["Notes"])
 app.include_router(admin.router, prefix="/admin", tags=["Admin"])
 app.include_router(location.router, prefix="/location", tags=["Location & Maps"])
 app.include_router(lessons.router, prefix="/lessons", tags=["Lessons"])
+app.include_router(search.router, prefix="/search", tags=["Search"])
 
 # --- Endpoint Radice ---
 @app.get("/", tags=["Root"])
@@ -51,11 +77,21 @@ def read_root():
             "Notes Sharing",
             "Reviews & Ratings",
             "Campus Maps & Navigation",
-            "Lessons"
+            "Lessons",
+            "Search"
         ]
     }
 
 @app.get("/health", tags=["Health"])
 def health_check():
     """Health check endpoint for monitoring."""
-    return {"status": "healthy", "version": "2.0.0"}
\ No newline at end of file
+    return {"status": "healthy", "version": "2.0.0", "database_pool": get_pool_status()}
+
+if METRICS_ENABLED:
+    @app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+    def metrics():
+        """Metriche per route in formato testo Prometheus."""
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+    # Dopo l'ultima route: serve il template anche per le richieste ancora in corso
+    route_templates.learn_app(app)
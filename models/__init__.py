@@ -6,3 +6,7 @@ from .note import Note
 from .review import Review 
 from .note_ratings import NoteRating # Aggiunto per la tabella delle recensioni dei corsi
 from .report import Report
+from .lesson import Lesson
+from .lesson_checkin import LessonCheckin
+from .course_rating_stats import CourseRatingStats
+from .note_rating_stats import NoteRatingStats
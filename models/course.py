@@ -23,6 +23,7 @@ class Course(Base):
     notes = relationship("Note", back_populates="course", cascade="all, delete-orphan")
     reviews = relationship("Review", back_populates="course", cascade="all, delete-orphan")
     lessons = relationship("Lesson", back_populates="course",cascade="all, delete-orphan")
+    rating_stats = relationship("CourseRatingStats", back_populates="course", uselist=False, cascade="all, delete-orphan")
 
     @property
     def teacher_name(self):
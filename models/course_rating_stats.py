@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, ForeignKey
+from sqlalchemy.orm import relationship
+from database.database import Base
+
+class CourseRatingStats(Base):
+    """
+    Aggregati delle recensioni di un corso, aggiornati in modo incrementale
+    a ogni scrittura su `reviews` (vedi services/course_ratings.py).
+    """
+    __tablename__ = "course_rating_stats"
+
+    course_id = Column(Integer, ForeignKey("courses.id", ondelete="CASCADE"), primary_key=True)
+    review_count = Column(Integer, nullable=False, default=0)
+    sum_clarity = Column(Integer, nullable=False, default=0)
+    sum_feasibility = Column(Integer, nullable=False, default=0)
+    sum_availability = Column(Integer, nullable=False, default=0)
+
+    course = relationship("Course", back_populates="rating_stats")
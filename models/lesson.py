@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Time, ForeignKey, Date
+from sqlalchemy import Column, Integer, String, Time, ForeignKey, Date, Index, func
 from sqlalchemy.orm import relationship
 from database.database import Base 
 from datetime import date
@@ -16,4 +16,10 @@ class Lesson(Base):
     last_checkin_date = Column(Date, nullable=True)
 
     # Relazione per recuperare il corso (e tramite lui, l'aula)
-    course = relationship("Course", back_populates="lessons")
\ No newline at end of file
+    course = relationship("Course", back_populates="lessons")
+    # Storico dei check-in: lo cancella il database (ON DELETE CASCADE) senza caricarlo
+    checkin_log = relationship("LessonCheckin", back_populates="lesson", cascade="all, delete-orphan", passive_deletes=True)
+
+# "Lezioni in corso adesso" (services/timetable_index.py): `day_of_week` è
+# testo libero e si confronta in minuscolo, quindi l'indice è sull'espressione.
+Index("ix_lessons_day_start", func.lower(Lesson.day_of_week), Lesson.start_time)
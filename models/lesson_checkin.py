@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, Date, DateTime, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.orm import relationship
+from database.database import Base
+
+class LessonCheckin(Base):
+    """
+    Registro dei check-in: una riga per studente, lezione e giorno (il vincolo
+    di unicità scarta i doppioni). `Lesson.checkins` ne è il conteggio del
+    giorno, aggiornato a ogni inserimento (vedi services/checkin_counter.py).
+    """
+    __tablename__ = "lesson_checkins"
+    __table_args__ = (
+        UniqueConstraint("lesson_id", "user_id", "checkin_date", name="uq_lesson_checkins_lesson_user_date"),
+        # Occupazione e storico di una lezione
+        Index("ix_lesson_checkins_lesson_date", "lesson_id", "checkin_date"),
+        Index("ix_lesson_checkins_user_id", "user_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    lesson_id = Column(Integer, ForeignKey("lessons.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    checkin_date = Column(Date, nullable=False)
+    checked_in_at = Column(DateTime, nullable=False)
+
+    lesson = relationship("Lesson", back_populates="checkin_log")
+    user = relationship("User", back_populates="checkins")
@@ -17,4 +17,5 @@ class Note(Base):
     course = relationship("Course", back_populates="notes")
     student = relationship("User", back_populates="notes")
     ratings = relationship("NoteRating", back_populates="note", cascade="all, delete-orphan")
-    reports = relationship("Report", back_populates="note", cascade="all, delete")
\ No newline at end of file
+    reports = relationship("Report", back_populates="note", cascade="all, delete")
+    rating_stats = relationship("NoteRatingStats", back_populates="note", uselist=False, cascade="all, delete-orphan")
\ No newline at end of file
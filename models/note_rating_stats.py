@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, ForeignKey
+from sqlalchemy.orm import relationship
+from database.database import Base
+
+class NoteRatingStats(Base):
+    """
+    Riepilogo delle valutazioni di una nota (numero, somma e istogramma 1-5),
+    aggiornato in modo incrementale a ogni scrittura su `note_ratings`
+    (vedi services/note_ratings.py).
+    """
+    __tablename__ = "note_rating_stats"
+
+    note_id = Column(Integer, ForeignKey("notes.id", ondelete="CASCADE"), primary_key=True)
+    rating_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    count_1 = Column(Integer, nullable=False, default=0)
+    count_2 = Column(Integer, nullable=False, default=0)
+    count_3 = Column(Integer, nullable=False, default=0)
+    count_4 = Column(Integer, nullable=False, default=0)
+    count_5 = Column(Integer, nullable=False, default=0)
+
+    note = relationship("Note", back_populates="rating_stats")
+
+    @property
+    def histogram(self) -> dict:
+        return {str(star): getattr(self, f"count_{star}") for star in range(1, 6)}
@@ -20,4 +20,5 @@ class User(Base):
     notes = relationship("Note", back_populates="student", cascade="all, delete-orphan")
     reviews = relationship("Review", back_populates="student", cascade="all, delete-orphan")  # Relazione con le recensioni scritte
     ratings = relationship("NoteRating", back_populates="student", cascade="all, delete-orphan")
-    reports = relationship("Report", back_populates="user")
\ No newline at end of file
+    reports = relationship("Report", back_populates="user")
+    checkins = relationship("LessonCheckin", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
\ No newline at end of file
@@ -1,9 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+import logging
+import os
+import tempfile
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from typing import List, Optional
 from sqlalchemy.orm import Session
 from firebase_admin import auth as firebase_auth, storage
 
 from database.database import get_db
+from database.async_database import DbSession, get_session, run_db
 from models.user import User
 from models.faculty import Faculty
 from models.course import Course
@@ -12,7 +20,8 @@ from models.note import Note
 from models.review import Review
 from models.report import Report
 from models.note_ratings import NoteRating
-from auth.auth import get_current_user
+from auth.auth import get_current_identity
+from auth.identity import UserIdentity, invalidate_identity
 from schemas.admin import (
     UserResponse, UserDeleteResponse,
     NoteResponse, NoteDeleteResponse,
@@ -22,12 +31,32 @@ from schemas.admin import (
     TeacherResponse, NoteRatingResponse, NoteRatingDeleteResponse, TeacherCreate,
 )
 from schemas.report import ReportResponse
-
+from schemas.timetable import TimetableImportReport
+from utils.pagination import PageParams, keyset, finish_page
+from utils.response_cache import ResponseCache, get_response_cache
+from services.search_index import search_index
+from services import course_ranking
+from services.catalog import courses_changed, faculties_changed
+from services.course_ratings import review_removed, reviews_of_student_removed, rebuild_course_rating_stats
+from services.note_ratings import rating_removed, ratings_of_student_removed, rebuild_note_rating_stats
+from services.timetable_import import TimetableFormatError, import_timetable, read_rows
+from database.profiler import PROFILER_ENABLED, profile as query_profile
+
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Import dell'orario: dimensione massima del corpo e formato dedotto dal Content-Type
+TIMETABLE_IMPORT_MAX_BYTES = int(os.getenv("TIMETABLE_IMPORT_MAX_BYTES", str(50 * 1024 * 1024)))
+TIMETABLE_IMPORT_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/json": "json",
+}
+
 # 1. Gestione utenti
 @router.get("/users/{user_id}", response_model=UserResponse)
-def get_user_detail(user_id: int, db: Session = Depends(get_db), admin: User = Depends(get_current_user)):
+def get_user_detail(user_id: int, db: Session = Depends(get_db), admin: UserIdentity = Depends(get_current_identity)):
     if not admin.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
     
@@ -38,7 +67,7 @@ def get_user_detail(user_id: int, db: Session = Depends(get_db), admin: User = D
     return user
 
 @router.delete("/users/{user_id}", response_model=UserDeleteResponse)
-def delete_user(user_id: int, db: Session = Depends(get_db), admin: User = Depends(get_current_user)):
+def delete_user(user_id: int, db: Session = Depends(get_db), admin: UserIdentity = Depends(get_current_identity)):
     if not admin.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
     
@@ -52,29 +81,37 @@ def delete_user(user_id: int, db: Session = Depends(get_db), admin: User = Depen
     try:
         firebase_auth.delete_user(user.firebase_uid)
     except firebase_auth.UserNotFoundError:
-        print(f"Warning: User with UID {user.firebase_uid} not found in Firebase, but deleting from local DB.")
+        logger.warning("User with UID %s not found in Firebase, deleting from local DB only", user.firebase_uid)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error deleting user from Firebase: {e}")
 
+    firebase_uid = user.firebase_uid
+    reviews_of_student_removed(db, user.id)
+    ratings_of_student_removed(db, user.id)
     db.delete(user)
     db.commit()
+    invalidate_identity(firebase_uid)
+    search_index.invalidate()  # appunti dell'utente eliminati in cascata
+    course_ranking.invalidate()
     return {"message": "User deleted successfully"}
 
 @router.get("/users", response_model=List[UserResponse])
-def get_all_users(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_all_users(request: Request, response: Response, page: PageParams = Depends(), db: Session = Depends(get_db), current_user: UserIdentity = Depends(get_current_identity)):
     if not current_user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can view all users")
-    return db.query(User).all()
+    users = keyset(db.query(User), [(User.id, False)], page).all()
+    return finish_page(users, page, lambda u: [u.id], request, response)
 
 # 2. Gestione note e recensioni
 @router.get("/notes", response_model=List[NoteResponse])
-def get_notes(db: Session = Depends(get_db), admin: User = Depends(get_current_user)):
+def get_notes(request: Request, response: Response, page: PageParams = Depends(), db: Session = Depends(get_db), admin: UserIdentity = Depends(get_current_identity)):
     if not admin.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
-    return db.query(Note).all()
+    notes = keyset(db.query(Note), [(Note.id, False)], page).all()
+    return finish_page(notes, page, lambda n: [n.id], request, response)
 
 @router.delete("/notes/{note_id}", response_model=NoteDeleteResponse)
-def delete_note(note_id: int, db: Session = Depends(get_db), admin: User = Depends(get_current_user)):
+def delete_note(note_id: int, db: Session = Depends(get_db), admin: UserIdentity = Depends(get_current_identity)):
     if not admin.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
 
@@ -90,20 +127,24 @@ def delete_note(note_id: int, db: Session = Depends(get_db), admin: User = Depen
             if blob.exists():
                 blob.delete()
     except Exception as e:
-        print(f"Failed to delete file from Firebase Storage: {e}")
+        logger.warning("Failed to delete file from Firebase Storage: %s", e)
 
+    course_id = note.course_id
     db.delete(note)
     db.commit()
+    search_index.note_removed(note_id)
+    course_ranking.course_changed(db, course_id)
     return {"message": "Note deleted successfully"}
 
 @router.get("/reviews", response_model=List[ReviewResponse])
-def get_reviews(db: Session = Depends(get_db), admin: User = Depends(get_current_user)):
+def get_reviews(request: Request, response: Response, page: PageParams = Depends(), db: Session = Depends(get_db), admin: UserIdentity = Depends(get_current_identity)):
     if not admin.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
-    return db.query(Review).all()
+    reviews = keyset(db.query(Review), [(Review.id, False)], page).all()
+    return finish_page(reviews, page, lambda r: [r.id], request, response)
 
 @router.delete("/reviews/{review_id}", response_model=ReviewDeleteResponse)
-def delete_review(review_id: int, db: Session = Depends(get_db), admin: User = Depends(get_current_user)):
+def delete_review(review_id: int, db: Session = Depends(get_db), admin: UserIdentity = Depends(get_current_identity)):
     if not admin.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
 
@@ -111,8 +152,11 @@ def delete_review(review_id: int, db: Session = Depends(get_db), admin: User = D
     if not review:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Review not found")
 
+    course_id = review.course_id
+    review_removed(db, review)
     db.delete(review)
     db.commit()
+    course_ranking.course_changed(db, course_id)
     return {"message": "Review deleted successfully"}
 
 # 3. Gestione facoltà e corsi
@@ -121,17 +165,18 @@ def get_faculties(db: Session = Depends(get_db)):
     return db.query(Faculty).all()
 
 @router.post("/faculties", response_model=FacultyResponse)
-def add_faculty(faculty: FacultyCreate, db: Session = Depends(get_db), admin: User = Depends(get_current_user)):
+def add_faculty(faculty: FacultyCreate, db: Session = Depends(get_db), admin: UserIdentity = Depends(get_current_identity), cache: ResponseCache = Depends(get_response_cache)):
     if not admin.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
     new_faculty = Faculty(name=faculty.name)
     db.add(new_faculty)
     db.commit()
     db.refresh(new_faculty)
+    faculties_changed(cache)
     return new_faculty
 
 @router.delete("/faculties/{faculty_id}")
-def delete_faculty(faculty_id: int, db: Session = Depends(get_db), admin: User = Depends(get_current_user)):
+def delete_faculty(faculty_id: int, db: Session = Depends(get_db), admin: UserIdentity = Depends(get_current_identity), cache: ResponseCache = Depends(get_response_cache)):
     if not admin.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
     faculty = db.query(Faculty).filter(Faculty.id == faculty_id).first()
@@ -140,15 +185,21 @@ def delete_faculty(faculty_id: int, db: Session = Depends(get_db), admin: User =
     
     db.delete(faculty)
     db.commit()
+    faculties_changed(cache)
+    courses_changed(cache)  # corsi e lezioni eliminati in cascata
     return {"message": "Faculty deleted successfully"}
 
 # 4. Gestione insegnanti
+_teacher_list = TypeAdapter(List[TeacherResponse])
+
 @router.get("/teachers", response_model=List[TeacherResponse])
-def get_all_teachers(db: Session = Depends(get_db)):
-    return db.query(Teacher).all()
+async def get_all_teachers(request: Request, db: DbSession = Depends(get_session), cache: ResponseCache = Depends(get_response_cache)):
+    async def build(response):
+        return await run_db(db, lambda session: session.query(Teacher).all())
+    return await cache.serve(request, build, ("teachers",), _teacher_list)
 
 @router.post("/teachers", response_model=TeacherResponse)
-def add_teacher(teacher: TeacherCreate, db: Session = Depends(get_db), admin: User = Depends(get_current_user)):
+def add_teacher(teacher: TeacherCreate, db: Session = Depends(get_db), admin: UserIdentity = Depends(get_current_identity), cache: ResponseCache = Depends(get_response_cache)):
     if not admin.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
     
@@ -156,10 +207,11 @@ def add_teacher(teacher: TeacherCreate, db: Session = Depends(get_db), admin: Us
     db.add(new_teacher)
     db.commit()
     db.refresh(new_teacher)
+    courses_changed(cache)
     return new_teacher
 
 @router.delete("/teachers/{teacher_id}")
-def delete_teacher(teacher_id: int, db: Session = Depends(get_db), admin: User = Depends(get_current_user)):
+def delete_teacher(teacher_id: int, db: Session = Depends(get_db), admin: UserIdentity = Depends(get_current_identity), cache: ResponseCache = Depends(get_response_cache)):
     if not admin.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
     teacher = db.query(Teacher).filter(Teacher.id == teacher_id).first()
@@ -168,17 +220,18 @@ def delete_teacher(teacher_id: int, db: Session = Depends(get_db), admin: User =
 
     db.delete(teacher)
     db.commit()
+    courses_changed(cache)
     return {"message": "Teacher deleted successfully"}
 
 # 5. Gestione Corsi
 @router.get("/courses", response_model=List[CourseResponse])
-def get_courses(db: Session = Depends(get_db), admin: User = Depends(get_current_user)):
+def get_courses(db: Session = Depends(get_db), admin: UserIdentity = Depends(get_current_identity)):
     if not admin.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
     return db.query(Course).all()
 
 @router.post("/courses", response_model=CourseResponse)
-def add_course(course: CourseCreate, db: Session = Depends(get_db), admin: User = Depends(get_current_user)):
+def add_course(course: CourseCreate, db: Session = Depends(get_db), admin: UserIdentity = Depends(get_current_identity), cache: ResponseCache = Depends(get_response_cache)):
     if not admin.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
     
@@ -190,10 +243,11 @@ def add_course(course: CourseCreate, db: Session = Depends(get_db), admin: User
     db.add(new_course)
     db.commit()
     db.refresh(new_course)
+    courses_changed(cache, added=new_course)
     return new_course
 
 @router.delete("/courses/{course_id}")
-def delete_course(course_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def delete_course(course_id: int, db: Session = Depends(get_db), current_user: UserIdentity = Depends(get_current_identity), cache: ResponseCache = Depends(get_response_cache)):
     if not current_user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
 
@@ -203,17 +257,106 @@ def delete_course(course_id: int, db: Session = Depends(get_db), current_user: U
 
     db.delete(course)
     db.commit()
+    courses_changed(cache, removed=course_id)
     return {"message": "Course deleted successfully"}
 
-# 6. Gestione Altro
+# 6. Manutenzione aggregati
+@router.post("/maintenance/course-ratings/rebuild")
+def rebuild_course_ratings(dry_run: bool = False, db: Session = Depends(get_db), admin: UserIdentity = Depends(get_current_identity)):
+    if not admin.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
+    report = rebuild_course_rating_stats(db, fix=not dry_run)
+    if report["fixed"] and report["drifted"]:
+        course_ranking.invalidate()
+    return report
+
+@router.post("/maintenance/note-ratings/rebuild")
+def rebuild_note_ratings(dry_run: bool = False, db: Session = Depends(get_db), admin: UserIdentity = Depends(get_current_identity)):
+    if not admin.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
+    report = rebuild_note_rating_stats(db, fix=not dry_run)
+    if report["fixed"] and report["drifted"]:
+        course_ranking.invalidate()
+    return report
+
+@router.get("/maintenance/query-profile")
+def get_query_profile(order_by: str = "total_ms", limit: int = 50, admin: UserIdentity = Depends(get_current_identity)):
+    """Query aggregate per statement normalizzato e pattern N+1 rilevati (DB_PROFILER=true)."""
+    if not admin.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Query profiler is disabled (set DB_PROFILER=true)")
+    if order_by not in ("total_ms", "count", "max_ms", "avg_ms", "slow", "nplus1_requests"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid order_by")
+    return query_profile.summary(order_by=order_by, limit=limit)
+
+@router.delete("/maintenance/query-profile")
+def reset_query_profile(admin: UserIdentity = Depends(get_current_identity)):
+    if not admin.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
+    query_profile.reset()
+    return {"message": "Query profile reset"}
+
+# 6b. Import dell'orario
+@router.post("/timetable/import", response_model=TimetableImportReport)
+async def import_timetable_file(
+    request: Request,
+    fmt: Optional[str] = Query(None, alias="format", description="csv, ndjson or json (default: from Content-Type)"),
+    dry_run: bool = False,
+    skip_invalid: bool = False,
+    replace_lessons: bool = False,
+    db: Session = Depends(get_db),
+    admin: UserIdentity = Depends(get_current_identity),
+    cache: ResponseCache = Depends(get_response_cache),
+):
+    """
+    Import massivo dell'orario (vedi services/timetable_import.py): il corpo è
+    il file stesso (CSV, NDJSON o array JSON), letto a blocchi. Con errori di
+    validazione e senza `skip_invalid` non viene scritto nulla e la risposta
+    è 422 con gli errori per riga.
+    """
+    if not admin.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = fmt or TIMETABLE_IMPORT_CONTENT_TYPES.get(content_type)
+    if fmt is None:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Use text/csv, application/x-ndjson or application/json, or pass ?format=")
+
+    body = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    try:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > TIMETABLE_IMPORT_MAX_BYTES:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Timetable file too large")
+            body.write(chunk)
+        body.seek(0)
+        try:
+            report = await run_in_threadpool(
+                import_timetable, db, read_rows(body, fmt),
+                dry_run, skip_invalid, replace_lessons,
+            )
+        except TimetableFormatError as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    finally:
+        body.close()
+
+    if report["committed"]:
+        courses_changed(cache)
+    if report["rows_invalid"] and not skip_invalid:
+        return JSONResponse(status_code=422, content=report)
+    return report
+
+# 7. Gestione Altro
 @router.get("/note-ratings", response_model=List[NoteRatingResponse])
-def get_note_ratings(db: Session = Depends(get_db), admin: User = Depends(get_current_user)):
+def get_note_ratings(request: Request, response: Response, page: PageParams = Depends(), db: Session = Depends(get_db), admin: UserIdentity = Depends(get_current_identity)):
     if not admin.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
-    return db.query(NoteRating).all()
+    ratings = keyset(db.query(NoteRating), [(NoteRating.id, False)], page).all()
+    return finish_page(ratings, page, lambda r: [r.id], request, response)
 
 @router.delete("/note-ratings/{rating_id}", response_model=NoteRatingDeleteResponse)
-def delete_note_rating(rating_id: int, db: Session = Depends(get_db), admin: User = Depends(get_current_user)):
+def delete_note_rating(rating_id: int, db: Session = Depends(get_db), admin: UserIdentity = Depends(get_current_identity)):
     if not admin.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unauthorized")
 
@@ -221,18 +364,22 @@ def delete_note_rating(rating_id: int, db: Session = Depends(get_db), admin: Use
     if not rating:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Note rating not found")
 
+    note_id = rating.note_id
+    rating_removed(db, rating)
     db.delete(rating)
     db.commit()
+    course_ranking.note_ratings_changed(db, note_id)
     return {"message": "Note rating deleted successfully"}
 
 @router.get("/reports", response_model=List[ReportResponse])
-def get_all_reports(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_all_reports(request: Request, response: Response, page: PageParams = Depends(), db: Session = Depends(get_db), current_user: UserIdentity = Depends(get_current_identity)):
     if not current_user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can view reports.")
-    return db.query(Report).all()
+    reports = keyset(db.query(Report), [(Report.id_report, False)], page).all()
+    return finish_page(reports, page, lambda r: [r.id_report], request, response)
 
 @router.delete("/reports/{report_id}")
-def delete_report(report_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def delete_report(report_id: int, db: Session = Depends(get_db), current_user: UserIdentity = Depends(get_current_identity)):
     if not current_user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can delete reports.")
     
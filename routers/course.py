@@ -1,20 +1,33 @@
+import logging
 from datetime import datetime, date
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import TypeAdapter
 from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from database.database import get_db
+from database.async_database import DbSession, get_session, run_db
 from models.course import Course
 from models.review import Review
 from models.user import User
 from models.teacher import Teacher
 from models.report import Report
-from schemas.course import CourseCreate, CourseResponse
+from schemas.course import CourseCreate, CourseResponse, CourseRankingEntry, CourseSuggestion
 from schemas.review import ReviewCreate, ReviewResponse
 from schemas.report import ReportCreate, ReportResponse
-from auth.auth import get_current_user  # Per autenticazione admin
+from services.course_ratings import (
+    review_added, review_changed, review_removed, snapshot_ratings, get_course_rating_stats,
+)
+from services.course_autocomplete import course_name_index
+from services import course_ranking
+from auth.auth import get_current_identity  # Per autenticazione admin
+from auth.identity import UserIdentity
 from fastapi.encoders import jsonable_encoder
-from typing import List  # ✅ Per specificare il tipo di lista nel response_model
+from typing import List, Optional  # ✅ Per specificare il tipo di lista nel response_model
+from utils.pagination import PageParams, keyset, finish_page
+from utils.response_cache import ResponseCache, get_response_cache
+
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
 def reset_sequence(db: Session, table_name: str, column_name: str):
@@ -27,18 +40,53 @@ def reset_sequence(db: Session, table_name: str, column_name: str):
 
 
 # 📌 Ottenere tutti i corsi
+_course_list = TypeAdapter(list[CourseResponse])
+
 @router.get("/", response_model=list[CourseResponse])
-def get_courses(db: Session = Depends(get_db)):
-    courses = db.query(Course).all()
-    return courses
+async def get_courses(request: Request, page: PageParams = Depends(), db: DbSession = Depends(get_session), cache: ResponseCache = Depends(get_response_cache)):
+    async def build(response):
+        courses = await run_db(db, lambda session: keyset(session.query(Course), [(Course.id, False)], page).all())
+        return finish_page(courses, page, lambda c: [c.id], request, response)
+    return await cache.serve(request, build, ("courses",), _course_list)
 
 # 📌 Ottenere i corsi appartenenti a una specifica facoltà
 @router.get("/faculty/{faculty_id}", response_model=list[CourseResponse])
-def get_courses_by_faculty(faculty_id: int, db: Session = Depends(get_db)):
-    courses = db.query(Course).filter(Course.faculty_id == faculty_id).all()
-    if not courses:
+async def get_courses_by_faculty(faculty_id: int, request: Request, db: DbSession = Depends(get_session), cache: ResponseCache = Depends(get_response_cache)):
+    async def build(response):
+        courses = await run_db(db, lambda session: session.query(Course).filter(Course.faculty_id == faculty_id).all())
+        if not courses:
+            raise HTTPException(status_code=404, detail="No courses found for this faculty")
+        return courses
+    return await cache.serve(request, build, ("courses",), _course_list)
+
+# 🏆 Classifica dei corsi di una facoltà per voto (media bayesiana di
+#    recensioni e appunti, vedi services/course_ranking.py): una richiesta
+#    invece di /courses/{id}/ratings per ogni corso.
+@router.get("/faculty/{faculty_id}/ranking", response_model=List[CourseRankingEntry])
+async def get_faculty_ranking(faculty_id: int, limit: int = Query(20, ge=1, le=200), db: DbSession = Depends(get_session)):
+    ranking = await course_ranking.get_faculty_ranking(db, faculty_id)
+    if not ranking.courses:
         raise HTTPException(status_code=404, detail="No courses found for this faculty")
-    return courses
+    return ranking.courses[:limit]
+
+# 🔎 Autocompletamento dei nomi dei corsi (scelta del corso per gli appunti):
+#    corsi della facoltà dell'utente (o di `faculty_id`) il cui nome o una
+#    sua parola inizia con `q`. Servito dall'indice in memoria
+#    (services/course_autocomplete.py): il DB si usa solo per costruirlo.
+@router.get("/autocomplete", response_model=List[CourseSuggestion])
+async def autocomplete_courses(
+    q: str = Query(..., min_length=1, max_length=100),
+    faculty_id: Optional[int] = Query(None, description="Default: the user's faculty"),
+    limit: int = Query(10, ge=1, le=50),
+    db: DbSession = Depends(get_session),
+    current_user: UserIdentity = Depends(get_current_identity),
+):
+    faculty_id = faculty_id if faculty_id is not None else current_user.faculty_id
+    if faculty_id is None:
+        return []
+    if not course_name_index.ready():
+        await run_db(db, course_name_index.get)
+    return course_name_index.complete(faculty_id, q, limit)
 
 # 📌 Ottenere il professore di un corso
 @router.get("/{course_id}/teacher", response_model=dict)
@@ -55,7 +103,7 @@ def get_course_teacher(course_id: int, db: Session = Depends(get_db)):
 
 # 📌 Aggiungere una recensione con controllo del valore minimo
 @router.post("/{course_id}/reviews", response_model=ReviewResponse)
-def add_review(course_id: int, review: ReviewCreate, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+def add_review(course_id: int, review: ReviewCreate, db: Session = Depends(get_db), current_user: UserIdentity = Depends(get_current_identity)):
     student_id = current_user.id  # Ottieni l'ID dello studente loggato
 
     # Controllo che i voti siano almeno 1
@@ -77,12 +125,16 @@ def add_review(course_id: int, review: ReviewCreate, db: Session = Depends(get_d
 
     if existing_review:
         # Se una recensione esiste già, permetti di modificarla
+        old_ratings = snapshot_ratings(existing_review)
         existing_review.rating_clarity = review.rating_clarity
         existing_review.rating_feasibility = review.rating_feasibility
         existing_review.rating_availability = review.rating_availability
         existing_review.comment = review.comment
+        review_changed(db, course_id, old_ratings, existing_review)
         
         db.commit()
+        course_ranking.course_changed(db, course_id)
+        logger.debug("Review updated", extra={"review_id": existing_review.id, "course_id": course_id, "user_id": student_id})
         db.refresh(existing_review)
         
         return existing_review
@@ -98,21 +150,25 @@ def add_review(course_id: int, review: ReviewCreate, db: Session = Depends(get_d
         )
 
         db.add(new_review)
+        review_added(db, new_review)
         db.commit()
+        course_ranking.course_changed(db, course_id)
         db.refresh(new_review)
+        logger.debug("Review created", extra={"review_id": new_review.id, "course_id": course_id, "user_id": student_id})
 
         return new_review
 
 # 📌 Ottenere tutte le recensioni di un corso
 @router.get("/{course_id}/reviews", response_model=list[ReviewResponse])
-def get_course_reviews(course_id: int, db: Session = Depends(get_db)):
-    reviews = db.query(Review).filter(Review.course_id == course_id).all()
-    if not reviews:
+def get_course_reviews(course_id: int, request: Request, response: Response, page: PageParams = Depends(), db: Session = Depends(get_db)):
+    query = db.query(Review).filter(Review.course_id == course_id)
+    reviews = keyset(query, [(Review.id, False)], page).all()
+    if not reviews and not page.cursor:
         raise HTTPException(status_code=404, detail="No reviews found for this course.")
-    return reviews
+    return finish_page(reviews, page, lambda r: [r.id], request, response)
 
 @router.get("/my-reviews", response_model=list[ReviewResponse])
-def get_student_reviews(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+def get_student_reviews(db: Session = Depends(get_db), current_user: UserIdentity = Depends(get_current_identity)):
     reviews = db.query(Review).filter(Review.student_id == current_user.id).all()
     
     if not reviews:
@@ -123,7 +179,7 @@ def get_student_reviews(db: Session = Depends(get_db), current_user=Depends(get_
 
 # 📌 Modificare una recensione
 @router.put("/reviews/{review_id}", response_model=ReviewResponse)
-def update_review(review_id: int, updated_review: ReviewCreate, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+def update_review(review_id: int, updated_review: ReviewCreate, db: Session = Depends(get_db), current_user: UserIdentity = Depends(get_current_identity)):
     review = db.query(Review).filter(Review.id == review_id).first()
     
     if not review:
@@ -132,19 +188,22 @@ def update_review(review_id: int, updated_review: ReviewCreate, db: Session = De
     if review.student_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="You can only edit your own reviews.")
 
+    old_ratings = snapshot_ratings(review)
     review.rating_clarity = updated_review.rating_clarity
     review.rating_feasibility = updated_review.rating_feasibility
     review.rating_availability = updated_review.rating_availability
     review.comment = updated_review.comment
+    review_changed(db, review.course_id, old_ratings, review)
 
     db.commit()
+    course_ranking.course_changed(db, review.course_id)
     db.refresh(review)
 
     return review
 
 # 📌 Eliminare una recensione
 @router.delete("/reviews/{review_id}")
-def delete_review(review_id: int, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+def delete_review(review_id: int, db: Session = Depends(get_db), current_user: UserIdentity = Depends(get_current_identity)):
     review = db.query(Review).filter(Review.id == review_id).first()
     
     if not review:
@@ -153,8 +212,11 @@ def delete_review(review_id: int, db: Session = Depends(get_db), current_user=De
     if review.student_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="You can only delete your own reviews.")
 
+    course_id = review.course_id
+    review_removed(db, review)
     db.delete(review)
     db.commit()
+    course_ranking.course_changed(db, course_id)
 
     reset_sequence(db, "reviews", "id")
 
@@ -166,15 +228,16 @@ def round_up_half(value: float) -> float:
 
 # 📌 Ottenere la media dei voti di un corso con arrotondamento
 @router.get("/{course_id}/ratings")
-def get_course_ratings(course_id: int, db: Session = Depends(get_db)):
-    reviews = db.query(Review).filter(Review.course_id == course_id).all()
+async def get_course_ratings(course_id: int, db: DbSession = Depends(get_session)):
+    # Lettura per chiave primaria degli aggregati, non delle singole recensioni
+    stats = await run_db(db, get_course_rating_stats, course_id)
     
-    if not reviews:
+    if not stats or stats.review_count <= 0:
         raise HTTPException(status_code=404, detail="No ratings found for this course.")
 
-    avg_clarity = round_up_half(sum(r.rating_clarity for r in reviews) / len(reviews))
-    avg_feasibility = round_up_half(sum(r.rating_feasibility for r in reviews) / len(reviews))
-    avg_availability = round_up_half(sum(r.rating_availability for r in reviews) / len(reviews))
+    avg_clarity = round_up_half(stats.sum_clarity / stats.review_count)
+    avg_feasibility = round_up_half(stats.sum_feasibility / stats.review_count)
+    avg_availability = round_up_half(stats.sum_availability / stats.review_count)
 
     return {
         "course_id": course_id,
@@ -184,7 +247,7 @@ def get_course_ratings(course_id: int, db: Session = Depends(get_db)):
     }
 
 @router.post("/reports", response_model=ReportResponse)
-def create_report(report: ReportCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def create_report(report: ReportCreate, db: Session = Depends(get_db), current_user: UserIdentity = Depends(get_current_identity)):
     if not report.id_review and not report.id_note:
         raise HTTPException(status_code=400, detail="A report must be linked to either a review or a note.")
     
@@ -201,14 +264,14 @@ def create_report(report: ReportCreate, db: Session = Depends(get_db), current_u
     return new_report
 
 @router.get("/reports", response_model=List[ReportResponse])
-def get_all_reports(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_all_reports(db: Session = Depends(get_db), current_user: UserIdentity = Depends(get_current_identity)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Only admins can view reports.")
 
     return db.query(Report).all()
 
 @router.delete("/{report_id}")
-def delete_report(report_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def delete_report(report_id: int, db: Session = Depends(get_db), current_user: UserIdentity = Depends(get_current_identity)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Only admins can delete reports.")
     
@@ -221,8 +284,8 @@ def delete_report(report_id: int, db: Session = Depends(get_db), current_user: U
     return {"message": "Report deleted successfully."}
 
 @router.get("/{course_id}/details", response_model=CourseResponse)
-def get_course_detail(course_id: int, db: Session = Depends(get_db)):
-    course = db.query(Course).filter(Course.id == course_id).first()
+async def get_course_detail(course_id: int, db: DbSession = Depends(get_session)):
+    course = await run_db(db, lambda session: session.query(Course).filter(Course.id == course_id).first())
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     return course
\ No newline at end of file
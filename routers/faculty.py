@@ -1,18 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 from database.database import get_db
+from database.async_database import DbSession, get_session, run_db
 from models.faculty import Faculty
 from models.user import User
 from schemas.faculty import FacultyCreate, FacultyResponse
-from auth.auth import get_current_user  # Per autenticazione admin
+from auth.auth import get_current_user, get_current_identity  # Per autenticazione admin
+from auth.identity import UserIdentity, invalidate_identity
+from services.catalog import faculties_changed
+from utils.response_cache import ResponseCache, get_response_cache
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
 # ✅ **Ottenere tutte le facoltà disponibili**
+_faculty_list = TypeAdapter(list[FacultyResponse])
+
 @router.get("/", response_model=list[FacultyResponse])
-def get_faculties(db: Session = Depends(get_db)):
-    faculties = db.query(Faculty).all()
-    return faculties
+async def get_faculties(request: Request, db: DbSession = Depends(get_session), cache: ResponseCache = Depends(get_response_cache)):
+    async def build(response):
+        return await run_db(db, lambda session: session.query(Faculty).all())
+    return await cache.serve(request, build, ("faculties",), _faculty_list)
 
 
 # ✅ **Aggiungere una nuova facoltà (solo admin)**
@@ -20,7 +31,8 @@ def get_faculties(db: Session = Depends(get_db)):
 def create_faculty(
     faculty: FacultyCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)  # Solo admin
+    current_user: UserIdentity = Depends(get_current_identity),  # Solo admin
+    cache: ResponseCache = Depends(get_response_cache),
 ):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Permission denied")
@@ -29,6 +41,8 @@ def create_faculty(
     db.add(new_faculty)
     db.commit()
     db.refresh(new_faculty)
+    faculties_changed(cache)
+    logger.info("Faculty created", extra={"faculty_id": new_faculty.id, "user_id": current_user.id})
     return new_faculty
 
 
@@ -52,6 +66,7 @@ def enroll_in_faculty(
     current_user.faculty_id = faculty_id
     db.commit()
     db.refresh(current_user)
+    invalidate_identity(current_user.firebase_uid)
 
     return {"message": f"User successfully enrolled in faculty {faculty.name}"}
 
@@ -60,7 +75,7 @@ def enroll_in_faculty(
 @router.get("/my-faculty", response_model=FacultyResponse)
 def get_my_faculty(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)  # Ora usiamo l'utente autenticato
+    current_user: UserIdentity = Depends(get_current_identity)  # Ora usiamo l'utente autenticato
 ):
     # Controlliamo se l'utente è iscritto a una facoltà
     if current_user.faculty_id is None:
@@ -93,5 +108,6 @@ def change_faculty(
     current_user.faculty_id = faculty_id
     db.commit()
     db.refresh(current_user)
+    invalidate_identity(current_user.firebase_uid)
 
     return {"message": f"User successfully changed faculty to {faculty.name}"}
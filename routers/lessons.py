@@ -1,25 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-import math
-from datetime import date
+import json
+import logging
+import os
 
-from database.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import exists, func
+from sqlalchemy.orm import Session, joinedload
+from typing import List, Optional
+from datetime import date, datetime, timedelta
+
+from database.database import SessionLocal, get_db
+from database.async_database import DbSession, get_session, run_db
+from models.course import Course
+from models.lesson_checkin import LessonCheckin
+from auth.auth import get_current_identity
+from auth.identity import UserIdentity
+from utils.geo import calculate_distance, haversine_many
+from services.checkin_counter import checkin_buffer, current_occupancy, record_checkins
+from services.occupancy_stream import hub as occupancy_hub, publish_occupancy
+from services.timetable_index import lesson_index
 import models.lesson as models
 import schemas.lesson as schemas
 from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
 router = APIRouter(
 )
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    R = 6371000 
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
-    a = math.sin(delta_phi / 2.0) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2.0) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+# Stream SSE dell'occupazione: lezioni seguibili da una connessione e
+# intervallo dei commenti keep-alive (tengono aperti proxy e load balancer)
+OCCUPANCY_STREAM_MAX_LESSONS = int(os.getenv("OCCUPANCY_STREAM_MAX_LESSONS", "50"))
+OCCUPANCY_STREAM_HEARTBEAT = float(os.getenv("OCCUPANCY_STREAM_HEARTBEAT", "15"))
 
 class CheckInRequest(BaseModel):
     latitude: float
@@ -31,40 +43,240 @@ def create_lesson(lesson: schemas.LessonCreate, db: Session = Depends(get_db)):
     db.add(db_lesson)
     db.commit()
     db.refresh(db_lesson)
+    lesson_index.invalidate()
     return db_lesson
 
+def _lessons_by_course(db: Session, course_id: int):
+    # Corso e professore vanno caricati subito: lo schema li legge dopo la chiusura della sessione
+    return (
+        db.query(models.Lesson)
+        .options(joinedload(models.Lesson.course).joinedload(Course.teacher))
+        .filter(models.Lesson.course_id == course_id)
+        .all()
+    )
+
 @router.get("/course/{course_id}", response_model=List[schemas.Lesson])
-def get_lessons_by_course(course_id: int, db: Session = Depends(get_db)):
-    # SQLAlchemy caricherà automaticamente il corso associato se definito nello schema
-    return db.query(models.Lesson).filter(models.Lesson.course_id == course_id).all()
+async def get_lessons_by_course(course_id: int, db: DbSession = Depends(get_session)):
+    return await run_db(db, _lessons_by_course, course_id)
 
-@router.post("/{lesson_id}/check-in")
-def check_in_lesson(lesson_id: int, location: CheckInRequest, db: Session = Depends(get_db)):
-    lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
+# 🔹 Lezioni in corso o che iniziano entro `within_minutes` (schermata home),
+#    opzionalmente solo quelle entro `radius_meters` dalla posizione indicata.
+#    È una ricerca sull'indice dell'orario (services/timetable_index.py).
+def _lessons_now(db: Session, at: datetime, within_minutes: int, latitude: Optional[float],
+                 longitude: Optional[float], radius_meters: float, faculty_id: Optional[int], limit: int):
+    found = lesson_index.active(db, at, within_minutes)
+    if faculty_id is not None:
+        found = [item for item in found if item[2]["faculty_id"] == faculty_id]
+
+    distances = [None] * len(found)
+    if latitude is not None and longitude is not None:
+        located = [item for item in found if item[2]["latitude"] is not None and item[2]["longitude"] is not None]
+        if located:
+            dist = haversine_many(
+                latitude, longitude,
+                [item[2]["latitude"] for item in located],
+                [item[2]["longitude"] for item in located],
+            )
+            pairs = [(d, item) for d, item in zip(dist.tolist(), located) if d <= radius_meters]
+        else:
+            pairs = []
+        distances = [round(d, 1) for d, _ in pairs]
+        found = [item for _, item in pairs]
+
+    return [
+        {
+            **payload,
+            "starts_at": start,
+            "ends_at": end,
+            "in_progress": start <= at,
+            "starts_in_minutes": max(int((start - at).total_seconds() // 60), 0),
+            "distance_meters": distance,
+        }
+        for (start, end, payload), distance in zip(found[:limit], distances[:limit])
+    ]
+
+@router.get("/now", response_model=List[schemas.LessonNow])
+async def get_lessons_now(
+    within_minutes: int = Query(30, ge=0, le=720, description="Include lessons starting within this many minutes"),
+    latitude: Optional[float] = Query(None),
+    longitude: Optional[float] = Query(None),
+    radius_meters: float = Query(1000, gt=0, le=20000),
+    faculty_id: Optional[int] = Query(None),
+    at: Optional[datetime] = Query(None, description="Reference time (default: now, server local time)"),
+    limit: int = Query(50, ge=1, le=200),
+    db: DbSession = Depends(get_session),
+):
+    if (latitude is None) != (longitude is None):
+        raise HTTPException(status_code=400, detail="latitude and longitude must be provided together")
+    at = (at or datetime.now()).replace(tzinfo=None, microsecond=0)
+    return await run_db(db, _lessons_now, at, within_minutes, latitude, longitude, radius_meters, faculty_id, limit)
+
+def _check_in(db: Session, lesson_id: int, user_id: int, location: CheckInRequest):
+    now = datetime.now()
+    today = now.date()
+    already = exists().where(
+        LessonCheckin.lesson_id == lesson_id,
+        LessonCheckin.user_id == user_id,
+        LessonCheckin.checkin_date == today,
+    )
+    lesson = (
+        db.query(
+            models.Lesson.checkins, models.Lesson.last_checkin_date,
+            Course.latitude, Course.longitude, already.label("already_checked_in"),
+        )
+        .join(Course, models.Lesson.course_id == Course.id)
+        .filter(models.Lesson.id == lesson_id)
+        .first()
+    )
     if not lesson:
         raise HTTPException(status_code=404, detail="Lesson not found")
     
     # 1. Verifica Distanza
-    course = lesson.course
-    if not course.latitude or not course.longitude:
+    if not lesson.latitude or not lesson.longitude:
         raise HTTPException(status_code=400, detail="Course location not set")
 
-    dist = calculate_distance(location.latitude, location.longitude, course.latitude, course.longitude)
+    dist = calculate_distance(location.latitude, location.longitude, lesson.latitude, lesson.longitude)
     if dist > 150: 
+        logger.debug("Check-in rejected: too far", extra={"lesson_id": lesson_id, "distance_m": int(dist)})
         raise HTTPException(status_code=400, detail=f"Too far ({int(dist)}m). Get closer!")
 
-    # 2. LOGICA LAZY RESET
-    today = date.today()
-    
-    # Se l'ultimo check-in non è di oggi (o è nullo), resettiamo a 1 (nuovo giorno)
-    if lesson.last_checkin_date != today:
-        lesson.checkins = 1
-        lesson.last_checkin_date = today
+    # 2. Un check-in per studente al giorno: il doppione non cambia l'occupazione
+    if lesson.already_checked_in:
+        db.rollback()
+        occupancy = current_occupancy(lesson_id, lesson.checkins, lesson.last_checkin_date, today)
+        return {"message": "Already checked in today", "new_occupancy": occupancy, "already_checked_in": True}
+
+    # 3. Registro + incremento atomico del contatore (vedi services/checkin_counter.py)
+    if checkin_buffer is not None:
+        # Lezioni molto affollate: il check-in resta in memoria fino al prossimo flush
+        # chiudiamo subito la transazione di lettura: la connessione torna al pool
+        db.rollback()
+        added, _ = checkin_buffer.add(lesson_id, user_id, now)
+        occupancy = current_occupancy(lesson_id, lesson.checkins, lesson.last_checkin_date, today)
     else:
-        # Se è lo stesso giorno, incrementiamo
-        lesson.checkins += 1
+        occupancy = record_checkins(db, [(lesson_id, user_id, now)]).get((lesson_id, today))
+        added = occupancy is not None
+        db.commit()
+        if not added:
+            # Check-in concorrente dello stesso studente, già registrato: rileggiamo il contatore
+            occupancy = _occupancy(db, lesson_id)["occupancy"]
+    logger.debug("Check-in", extra={"lesson_id": lesson_id, "occupancy": occupancy, "added": added})
 
-    db.commit()
-    db.refresh(lesson)
+    if not added:
+        return {"message": "Already checked in today", "new_occupancy": occupancy, "already_checked_in": True}
+    publish_occupancy(lesson_id, today, occupancy)
+    return {"message": "Check-in successful", "new_occupancy": occupancy, "already_checked_in": False}
+
+@router.post("/{lesson_id}/check-in")
+async def check_in_lesson(
+    lesson_id: int,
+    location: CheckInRequest,
+    db: DbSession = Depends(get_session),
+    current_user: UserIdentity = Depends(get_current_identity),
+):
+    return await run_db(db, _check_in, lesson_id, current_user.id, location)
+
+# 🔹 Occupazione attuale (schermata "quanto è piena l'aula"): una sola riga letta
+def _occupancy(db: Session, lesson_id: int):
+    lesson = (
+        db.query(models.Lesson.checkins, models.Lesson.last_checkin_date)
+        .filter(models.Lesson.id == lesson_id)
+        .first()
+    )
+    if not lesson:
+        raise HTTPException(status_code=404, detail="Lesson not found")
+    today = date.today()
+    return {
+        "lesson_id": lesson_id,
+        "date": today,
+        "occupancy": current_occupancy(lesson_id, lesson.checkins, lesson.last_checkin_date, today),
+    }
+
+@router.get("/{lesson_id}/occupancy", response_model=schemas.LessonOccupancy)
+async def get_lesson_occupancy(lesson_id: int, db: DbSession = Depends(get_session)):
+    return await run_db(db, _occupancy, lesson_id)
+
+# 🔹 Storico: check-in per giorno negli ultimi `days` giorni, dal registro
+def _checkin_history(db: Session, lesson_id: int, days: int):
+    if db.query(models.Lesson.id).filter(models.Lesson.id == lesson_id).first() is None:
+        raise HTTPException(status_code=404, detail="Lesson not found")
+    since = date.today() - timedelta(days=days - 1)
+    rows = (
+        db.query(LessonCheckin.checkin_date, func.count(LessonCheckin.id))
+        .filter(LessonCheckin.lesson_id == lesson_id, LessonCheckin.checkin_date >= since)
+        .group_by(LessonCheckin.checkin_date)
+        .order_by(LessonCheckin.checkin_date)
+        .all()
+    )
+    return [{"date": day, "checkins": count} for day, count in rows]
+
+@router.get("/{lesson_id}/checkins/history", response_model=List[schemas.CheckinHistoryDay])
+async def get_checkin_history(
+    lesson_id: int,
+    days: int = Query(30, ge=1, le=366),
+    db: DbSession = Depends(get_session),
+    current_user: UserIdentity = Depends(get_current_identity),
+):
+    return await run_db(db, _checkin_history, lesson_id, days)
+
+# 🔹 Occupazione in tempo reale (Server-Sent Events) al posto del polling:
+#    GET /lessons/occupancy/stream?lesson_id=1&lesson_id=2
+#    Prima un evento per lezione con il valore attuale, poi un evento a ogni
+#    cambiamento, al massimo uno per lezione ogni OCCUPANCY_STREAM_INTERVAL_MS.
+#    Richiede il token come le altre rotte, e al più OCCUPANCY_STREAM_MAX_LESSONS lezioni.
+def _occupancy_snapshot(lesson_ids: List[int]):
+    # Sessione propria e chiusa subito: lo stream può restare aperto per ore
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(models.Lesson.id, models.Lesson.checkins, models.Lesson.last_checkin_date)
+            .filter(models.Lesson.id.in_(lesson_ids))
+            .all()
+        )
+    finally:
+        db.close()
+    today = date.today()
+    return {
+        row.id: (today.isoformat(), current_occupancy(row.id, row.checkins, row.last_checkin_date, today))
+        for row in rows
+    }
+
+def _sse_event(lesson_id: int, value) -> str:
+    day, occupancy = value
+    data = json.dumps({"lesson_id": lesson_id, "date": day, "occupancy": occupancy})
+    return f"event: occupancy\nid: {lesson_id}:{day}:{occupancy}\ndata: {data}\n\n"
+
+@router.get("/occupancy/stream")
+async def stream_occupancy(
+    lesson_ids: List[int] = Query(..., alias="lesson_id"),
+    current_user: UserIdentity = Depends(get_current_identity),
+):
+    lesson_ids = sorted(set(lesson_ids))
+    if len(lesson_ids) > OCCUPANCY_STREAM_MAX_LESSONS:
+        raise HTTPException(status_code=400, detail=f"Too many lessons (max {OCCUPANCY_STREAM_MAX_LESSONS})")
+    snapshot = await run_in_threadpool(_occupancy_snapshot, lesson_ids)
+    if not snapshot:
+        raise HTTPException(status_code=404, detail="Lesson not found")
+
+    subscription = occupancy_hub.subscribe(snapshot.keys(), snapshot)
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            for lesson_id, value in snapshot.items():
+                yield _sse_event(lesson_id, value)
+            while True:
+                batch = await subscription.next_batch(OCCUPANCY_STREAM_HEARTBEAT)
+                if not batch:
+                    yield ": keep-alive\n\n"
+                for lesson_id, value in batch.items():
+                    yield _sse_event(lesson_id, value)
+        finally:
+            # Client disconnesso: Starlette cancella il generatore
+            occupancy_hub.unsubscribe(subscription)
 
-    return {"message": "Check-in successful", "new_occupancy": lesson.checkins}
\ No newline at end of file
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
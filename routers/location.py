@@ -1,57 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+import logging
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
-from math import radians, cos, sin, asin, sqrt
+from datetime import datetime
+from sqlalchemy import func, or_
 
-from database.database import get_db
+from database.async_database import DbSession, get_session, run_db
 from models.faculty import Faculty
 from models.course import Course
-from models.teacher import Teacher
-from auth.auth import get_current_user
-from models.user import User
+from models.lesson import Lesson
+from schemas.location import BatchNavigationRequest
+from services.spatial_index import course_index, faculty_index
+from utils.geo import calculate_distance, calculate_walking_time, haversine_many, plan_walking_route
+from utils.timetable import weekday_aliases
+from auth.auth import get_current_identity
+from auth.identity import UserIdentity
+from utils.response_cache import ResponseCache, get_response_cache
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# ============================================
-# UTILITY FUNCTION: Haversine Distance
-# ============================================
-
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """
-    Calculate the great circle distance between two points 
-    on the earth (specified in decimal degrees).
-    Returns distance in meters.
-    """
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    
-    r = 6371000  # Radius of earth in meters
-    return c * r
-
-def calculate_walking_time(distance_meters: float) -> int:
-    """
-    Calculate walking time in minutes.
-    Assumes average walking speed of 5 km/h (83.33 m/min)
-    """
-    walking_speed_m_per_min = 83.33
-    return int(distance_meters / walking_speed_m_per_min) + 1
+# Navigazione con today=true: numero massimo di lezioni restituite
+BATCH_NAVIGATION_MAX_STOPS = int(os.getenv("BATCH_NAVIGATION_MAX_STOPS", "50"))
 
 # ============================================
 # ENDPOINT 1: Get All Faculties with Locations
 # ============================================
 
-@router.get("/faculties/map")
-def get_faculties_for_map(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """
-    Get all faculties with location data for displaying on campus map.
-    """
+def _faculties_for_map(db: Session):
     faculties = db.query(Faculty).filter(
         Faculty.latitude.isnot(None),
         Faculty.longitude.isnot(None)
@@ -68,19 +46,25 @@ def get_faculties_for_map(
         for f in faculties
     ]
 
+@router.get("/faculties/map")
+async def get_faculties_for_map(
+    request: Request,
+    db: DbSession = Depends(get_session),
+    current_user: UserIdentity = Depends(get_current_identity),
+    cache: ResponseCache = Depends(get_response_cache),
+):
+    """
+    Get all faculties with location data for displaying on campus map.
+    """
+    async def build(response):
+        return await run_db(db, _faculties_for_map)
+    return await cache.serve(request, build, ("faculties",), public=False)
+
 # ============================================
 # ENDPOINT 2: Get Faculty Location Details
 # ============================================
 
-@router.get("/faculties/{faculty_id}/location")
-def get_faculty_location(
-    faculty_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """
-    Get detailed location information for a specific faculty.
-    """
+def _faculty_location(db: Session, faculty_id: int):
     faculty = db.query(Faculty).filter(Faculty.id == faculty_id).first()
     if not faculty:
         raise HTTPException(status_code=404, detail="Faculty not found")
@@ -97,19 +81,22 @@ def get_faculty_location(
         "building_name": faculty.building_name
     }
 
+@router.get("/faculties/{faculty_id}/location")
+async def get_faculty_location(
+    faculty_id: int,
+    db: DbSession = Depends(get_session),
+    current_user: UserIdentity = Depends(get_current_identity)
+):
+    """
+    Get detailed location information for a specific faculty.
+    """
+    return await run_db(db, _faculty_location, faculty_id)
+
 # ============================================
 # ENDPOINT 3: Get All Courses with Locations
 # ============================================
 
-@router.get("/courses/map")
-def get_courses_for_map(
-    faculty_id: Optional[int] = Query(None, description="Filter by faculty ID"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """
-    Get all courses with location data for displaying on campus map.
-    """
+def _courses_for_map(db: Session, faculty_id: Optional[int]):
     query = db.query(Course).filter(
         Course.latitude.isnot(None),
         Course.longitude.isnot(None)
@@ -134,36 +121,34 @@ def get_courses_for_map(
         for c in courses
     ]
 
+@router.get("/courses/map")
+async def get_courses_for_map(
+    request: Request,
+    faculty_id: Optional[int] = Query(None, description="Filter by faculty ID"),
+    db: DbSession = Depends(get_session),
+    current_user: UserIdentity = Depends(get_current_identity),
+    cache: ResponseCache = Depends(get_response_cache),
+):
+    """
+    Get all courses with location data for displaying on campus map.
+    """
+    async def build(response):
+        return await run_db(db, _courses_for_map, faculty_id)
+    return await cache.serve(request, build, ("courses",), public=False)
+
 # ============================================
 # ENDPOINT 4: Get Course Location Details
 # ============================================
 
-@router.get("/courses/{course_id}/location")
-def get_course_location(
-    course_id: int,
-    user_latitude: Optional[float] = Query(None),
-    user_longitude: Optional[float] = Query(None),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """
-    Get detailed location information for a specific course.
-    If user location is provided, also returns distance and walking time.
-    """
-    course = db.query(Course).filter(Course.id == course_id).first()
+def _course_location(db: Session, course_id: int, user_latitude: Optional[float], user_longitude: Optional[float]):
+    # Il professore arriva nella stessa query (LEFT JOIN), senza una SELECT dedicata
+    course = db.query(Course).options(joinedload(Course.teacher)).filter(Course.id == course_id).first()
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
     if not course.latitude or not course.longitude:
         raise HTTPException(status_code=404, detail="Course location not available")
     
-    # Get teacher name
-    teacher_name = None
-    if course.teacher_id:
-        teacher = db.query(Teacher).filter(Teacher.id == course.teacher_id).first()
-        if teacher:
-            teacher_name = teacher.name
-    
     response = {
         "id": course.id,
         "name": course.name,
@@ -172,7 +157,7 @@ def get_course_location(
         "latitude": course.latitude,
         "longitude": course.longitude,
         "floor": course.floor,
-        "teacher_name": teacher_name
+        "teacher_name": course.teacher_name
     }
     
     # Calculate distance if user location is provided
@@ -188,100 +173,107 @@ def get_course_location(
     
     return response
 
+@router.get("/courses/{course_id}/location")
+async def get_course_location(
+    course_id: int,
+    user_latitude: Optional[float] = Query(None),
+    user_longitude: Optional[float] = Query(None),
+    db: DbSession = Depends(get_session),
+    current_user: UserIdentity = Depends(get_current_identity)
+):
+    """
+    Get detailed location information for a specific course.
+    If user location is provided, also returns distance and walking time.
+    """
+    return await run_db(db, _course_location, course_id, user_latitude, user_longitude)
+
 # ============================================
 # ENDPOINT 5: Get Nearby Courses
 # ============================================
 
+def _nearby_courses(db: Session, latitude: float, longitude: float, radius_meters: float,
+                    faculty_id: Optional[int], limit: Optional[int], k: Optional[int]):
+    # La ricerca passa dall'indice spaziale: vengono calcolate le distanze
+    # solo dei corsi nelle celle vicine, non di tutti i corsi geolocalizzati.
+    predicate = (lambda c: c["faculty_id"] == faculty_id) if faculty_id else None
+    found = course_index.search(db, latitude, longitude, radius_meters, k=k, limit=limit, predicate=predicate)
+
+    courses_with_distance = [
+        {
+            **course,
+            "distance_meters": round(distance, 1),
+            "walking_time_minutes": calculate_walking_time(distance)
+        }
+        for distance, course in found
+    ]
+    
+    return {
+        "user_location": {"latitude": latitude, "longitude": longitude},
+        "radius_meters": radius_meters,
+        "total_courses_found": len(courses_with_distance),
+        "courses": courses_with_distance
+    }
+
 @router.get("/courses/nearby")
-def get_nearby_courses(
+async def get_nearby_courses(
     latitude: float = Query(..., description="User's current latitude"),
     longitude: float = Query(..., description="User's current longitude"),
     radius_meters: float = Query(1000, description="Search radius in meters"),
     faculty_id: Optional[int] = Query(None),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Maximum number of courses returned"),
+    k: Optional[int] = Query(None, ge=1, le=100, description="Return only the k nearest courses within the radius"),
+    db: DbSession = Depends(get_session),
+    current_user: UserIdentity = Depends(get_current_identity)
 ):
     """
     Get all courses within a specified radius of the user's location.
     """
-    query = db.query(Course).filter(
-        Course.latitude.isnot(None),
-        Course.longitude.isnot(None)
-    )
-    
-    if faculty_id:
-        query = query.filter(Course.faculty_id == faculty_id)
-    
-    courses = query.all()
-    
-    courses_with_distance = []
-    for course in courses:
-        distance = calculate_distance(
-            latitude, longitude,
-            course.latitude, course.longitude
-        )
-        
-        if distance <= radius_meters:
-            walking_time = calculate_walking_time(distance)
-            
-            teacher_name = None
-            if course.teacher_id:
-                teacher = db.query(Teacher).filter(Teacher.id == course.teacher_id).first()
-                if teacher:
-                    teacher_name = teacher.name
-            
-            courses_with_distance.append({
-                "id": course.id,
-                "name": course.name,
-                "faculty_id": course.faculty_id,
-                "room_number": course.room_number,
-                "building_name": course.building_name,
-                "latitude": course.latitude,
-                "longitude": course.longitude,
-                "floor": course.floor,
-                "teacher_name": teacher_name,
-                "distance_meters": round(distance, 1),
-                "walking_time_minutes": walking_time
-            })
-    
-    courses_with_distance.sort(key=lambda x: x["distance_meters"])
-    
+    return await run_db(db, _nearby_courses, latitude, longitude, radius_meters, faculty_id, limit, k)
+
+# ============================================
+# ENDPOINT 5b: Get Nearby Faculties
+# ============================================
+
+def _nearby_faculties(db: Session, latitude: float, longitude: float, radius_meters: float,
+                      limit: Optional[int], k: Optional[int]):
+    found = faculty_index.search(db, latitude, longitude, radius_meters, k=k, limit=limit)
+
+    faculties_with_distance = [
+        {
+            **faculty,
+            "distance_meters": round(distance, 1),
+            "walking_time_minutes": calculate_walking_time(distance)
+        }
+        for distance, faculty in found
+    ]
+
     return {
         "user_location": {"latitude": latitude, "longitude": longitude},
         "radius_meters": radius_meters,
-        "total_courses_found": len(courses_with_distance),
-        "courses": courses_with_distance
+        "total_faculties_found": len(faculties_with_distance),
+        "faculties": faculties_with_distance
     }
 
+@router.get("/faculties/nearby")
+async def get_nearby_faculties(
+    latitude: float = Query(..., description="User's current latitude"),
+    longitude: float = Query(..., description="User's current longitude"),
+    radius_meters: float = Query(5000, description="Search radius in meters"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Maximum number of faculties returned"),
+    k: Optional[int] = Query(None, ge=1, le=100, description="Return only the k nearest faculties within the radius"),
+    db: DbSession = Depends(get_session),
+    current_user: UserIdentity = Depends(get_current_identity)
+):
+    """
+    Get all faculties within a specified radius of the user's location.
+    """
+    return await run_db(db, _nearby_faculties, latitude, longitude, radius_meters, limit, k)
+
 # ============================================
 # ENDPOINT 6: Get Navigation Info
 # ============================================
 
-@router.get("/navigate/{course_id}")
-def get_navigation_info(
-    course_id: int,
-    user_latitude: float = Query(...),
-    user_longitude: float = Query(...),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """
-    Get navigation information for a specific course.
-    Returns Google Maps URL and walking directions info.
-    """
-    course = db.query(Course).filter(Course.id == course_id).first()
-    if not course:
-        raise HTTPException(status_code=404, detail="Course not found")
-    
-    if not course.latitude or not course.longitude:
-        raise HTTPException(status_code=404, detail="Course location not available")
-    
-    distance = calculate_distance(
-        user_latitude, user_longitude,
-        course.latitude, course.longitude
-    )
-    walking_time = calculate_walking_time(distance)
-    
+def _navigation_entry(course: Course, user_latitude: float, user_longitude: float, distance: float) -> dict:
     google_maps_url = (
         f"https://www.google.com/maps/dir/?api=1"
         f"&origin={user_latitude},{user_longitude}"
@@ -302,7 +294,156 @@ def get_navigation_info(
             "floor": course.floor
         },
         "distance_meters": round(distance, 1),
-        "walking_time_minutes": walking_time,
+        "walking_time_minutes": calculate_walking_time(distance),
         "google_maps_url": google_maps_url,
         "waze_url": waze_url
-    }
\ No newline at end of file
+    }
+
+def _navigation_info(db: Session, course_id: int, user_latitude: float, user_longitude: float):
+    course = db.query(Course).filter(Course.id == course_id).first()
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+    
+    if not course.latitude or not course.longitude:
+        raise HTTPException(status_code=404, detail="Course location not available")
+    
+    distance = calculate_distance(
+        user_latitude, user_longitude,
+        course.latitude, course.longitude
+    )
+    return _navigation_entry(course, user_latitude, user_longitude, distance)
+
+@router.get("/navigate/{course_id}")
+async def get_navigation_info(
+    course_id: int,
+    user_latitude: float = Query(...),
+    user_longitude: float = Query(...),
+    db: DbSession = Depends(get_session),
+    current_user: UserIdentity = Depends(get_current_identity)
+):
+    """
+    Get navigation information for a specific course.
+    Returns Google Maps URL and walking directions info.
+    """
+    return await run_db(db, _navigation_info, course_id, user_latitude, user_longitude)
+
+
+# ============================================
+# ENDPOINT 7: Batch Navigation
+# ============================================
+
+def _batch_stops(db: Session, request: BatchNavigationRequest, faculty_id: Optional[int], now: datetime):
+    """Coppie (corso, lezione) da raggiungere, più gli id dei corsi non trovati."""
+    if request.course_ids:
+        course_ids = list(dict.fromkeys(request.course_ids))
+        courses = {c.id: c for c in db.query(Course).filter(Course.id.in_(course_ids)).all()}
+        stops = [(courses[cid], None) for cid in course_ids if cid in courses]
+        return stops, [cid for cid in course_ids if cid not in courses]
+
+    if faculty_id is None:
+        raise HTTPException(status_code=400, detail="User is not enrolled in any faculty")
+
+    lessons = (
+        db.query(Lesson)
+        .join(Course, Lesson.course_id == Course.id)
+        .options(joinedload(Lesson.course))
+        .filter(
+            Course.faculty_id == faculty_id,
+            func.lower(Lesson.day_of_week).in_(weekday_aliases(now.date())),
+            # Solo le lezioni non ancora finite (o che finiscono dopo la mezzanotte)
+            or_(Lesson.end_time.is_(None), Lesson.end_time > now.time(), Lesson.end_time <= Lesson.start_time),
+        )
+        .order_by(Lesson.start_time, Lesson.id)
+        .limit(BATCH_NAVIGATION_MAX_STOPS)
+        .all()
+    )
+    return [(lesson.course, lesson) for lesson in lessons], []
+
+def _itinerary(entries: list, order: list, user_latitude: float, user_longitude: float) -> dict:
+    legs = []
+    prev_lat, prev_lon, prev_id = user_latitude, user_longitude, None
+    for index in order:
+        entry = entries[index]
+        destination = entry["destination"]
+        distance = calculate_distance(prev_lat, prev_lon, destination["latitude"], destination["longitude"])
+        legs.append({
+            "from_course_id": prev_id,
+            "to_course_id": entry["course_id"],
+            "distance_meters": round(distance, 1),
+            "walking_time_minutes": calculate_walking_time(distance)
+        })
+        prev_lat, prev_lon, prev_id = destination["latitude"], destination["longitude"], entry["course_id"]
+
+    total = sum(leg["distance_meters"] for leg in legs)
+    return {
+        "order": [entries[index]["course_id"] for index in order],
+        "legs": legs,
+        "total_distance_meters": round(total, 1),
+        "total_walking_time_minutes": sum(leg["walking_time_minutes"] for leg in legs)
+    }
+
+def _batch_navigation(db: Session, request: BatchNavigationRequest, faculty_id: Optional[int]):
+    stops, not_found = _batch_stops(db, request, faculty_id, datetime.now())
+    located = [(course, lesson) for course, lesson in stops if course.latitude and course.longitude]
+    unavailable = [course.id for course, lesson in stops if not (course.latitude and course.longitude)]
+    logger.debug(
+        "Batch navigation",
+        extra={"stops": len(stops), "not_found": len(not_found), "unavailable": len(unavailable), "today": request.today},
+    )
+
+    distances = haversine_many(
+        request.latitude, request.longitude,
+        [course.latitude for course, _ in located],
+        [course.longitude for course, _ in located]
+    )
+
+    entries = []
+    for (course, lesson), distance in zip(located, distances):
+        entry = _navigation_entry(course, request.latitude, request.longitude, float(distance))
+        if lesson is not None:
+            entry["lesson_id"] = lesson.id
+            entry["start_time"] = lesson.start_time
+            entry["end_time"] = lesson.end_time
+        entries.append(entry)
+
+    response = {
+        "user_location": {"latitude": request.latitude, "longitude": request.longitude},
+        "destinations": entries,
+        "not_found_course_ids": not_found,
+        "location_unavailable_course_ids": unavailable
+    }
+
+    if request.course_ids and request.optimize:
+        order = plan_walking_route(
+            request.latitude, request.longitude,
+            [e["destination"]["latitude"] for e in entries],
+            [e["destination"]["longitude"] for e in entries]
+        )
+        response["itinerary"] = _itinerary(entries, order, request.latitude, request.longitude)
+    elif not request.course_ids:
+        # Le lezioni di oggi hanno già un ordine: quello degli orari
+        response["itinerary"] = _itinerary(entries, list(range(len(entries))), request.latitude, request.longitude)
+
+    return response
+
+@router.post("/navigate/batch")
+async def get_batch_navigation(
+    request: BatchNavigationRequest,
+    db: DbSession = Depends(get_session),
+    current_user: UserIdentity = Depends(get_current_identity)
+):
+    """
+    Navigation info for several destinations in a single request.
+    Destinations are either `course_ids` or, with `today=true`, the lessons
+    scheduled today for the user's faculty that have not ended yet (at most
+    BATCH_NAVIGATION_MAX_STOPS, returned in time order with an itinerary).
+    With `course_ids` and `optimize=true` an itinerary ordered to minimize
+    total walking distance is also returned.
+    """
+    if not request.course_ids and not request.today:
+        raise HTTPException(status_code=400, detail="Provide course_ids or set today=true")
+    if request.today and request.optimize:
+        # Le lezioni di oggi seguono l'orario: non c'è un ordine da ottimizzare
+        raise HTTPException(status_code=400, detail="optimize cannot be combined with today=true")
+
+    return await run_db(db, _batch_navigation, request, current_user.faculty_id)
@@ -1,66 +1,81 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import logging
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
+from sqlalchemy import Float, cast
 from sqlalchemy.sql import func
 from typing import List
 from firebase_admin import storage
 
 from database.database import get_db
+from database.async_database import DbSession, get_session, run_db
 from models.note import Note
 from models.course import Course
 from models.note_ratings import NoteRating
+from models.note_rating_stats import NoteRatingStats
 from models.user import User
 from models.report import Report
 from schemas.note import NoteCreate, NoteWithRatingResponse
 from schemas.rating import NoteRatingCreate, NoteRatingUpdate, NoteRatingResponse
 from schemas.report import ReportCreate, ReportResponse
-from auth.auth import get_current_user
-
+from auth.auth import get_current_identity
+from auth.identity import UserIdentity
+from utils.pagination import PageParams, keyset, finish_page
+from services.note_ratings import get_note_rating_stats, rating_added, rating_changed, rating_removed
+from services.search_index import search_index
+from services import course_ranking
+
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
 # 1. Ottenere gli appunti per un corso
-@router.get("/{course_id}", response_model=list[NoteWithRatingResponse])
-def get_notes(course_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+# Dal più recente; l'id rende l'ordinamento univoco a parità di data.
+# created_at è nullable (appunti vecchi senza data): nell'ORDER BY e nel
+# cursore vale NOTE_EPOCH, altrimenti un cursore con NULL salterebbe le righe
+NOTE_EPOCH = datetime(1970, 1, 1)
+note_created_at = func.coalesce(Note.created_at, NOTE_EPOCH)
+NOTE_ORDER = [(note_created_at, True), (Note.id, True)]
+
+def _note_cursor(note: Note) -> list:
+    return [note.created_at or NOTE_EPOCH, note.id]
+
+def _load_course_notes(db: Session, course_id: int, page: PageParams):
     course = db.query(Course).filter(Course.id == course_id).first()
     if not course:
-        raise HTTPException(status_code=404, detail="Course not found.")
+        return None
+    return keyset(db.query(Note).filter(Note.course_id == course_id), NOTE_ORDER, page).all()
 
-    notes = db.query(Note).filter(Note.course_id == course_id).all()
-    return notes
+@router.get("/{course_id}", response_model=list[NoteWithRatingResponse])
+async def get_notes(course_id: int, request: Request, response: Response, page: PageParams = Depends(), db: DbSession = Depends(get_session), current_user: UserIdentity = Depends(get_current_identity)):
+    notes = await run_db(db, _load_course_notes, course_id, page)
+    if notes is None:
+        raise HTTPException(status_code=404, detail="Course not found.")
+    return finish_page(notes, page, _note_cursor, request, response)
 
 # 2. Caricare un nuovo appunto
 @router.post("/", response_model=NoteWithRatingResponse)
 def upload_note(
     note_data: NoteCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserIdentity = Depends(get_current_identity)
 ):
-    
-    # 🔍 DEBUG - Log ricevuti
-    print("=" * 50)
-    print("📤 UPLOAD NOTE REQUEST")
-    print(f"📊 User ID: {current_user.id}")
-    print(f"📊 User Email: {current_user.email}")
-    print(f"📊 User Faculty ID: {current_user.faculty_id}")
-    print(f"📊 Requested Course ID: {note_data.course_id}")
-    print(f"📊 Description: {note_data.description}")
-    print(f"📊 File ID: {note_data.file_id}")
-    print("=" * 50)
+    logger.debug(
+        "Upload note request",
+        extra={"user_id": current_user.id, "faculty_id": current_user.faculty_id, "course_id": note_data.course_id},
+    )
 
     course = db.query(Course).filter(Course.id == note_data.course_id).first()
     if not course:
-        print("❌ Course not found!")
         raise HTTPException(status_code=404, detail="Course not found.")
-    
-    print(f"📊 Course Faculty ID: {course.faculty_id}")
-    print(f"📊 Faculty Match: {course.faculty_id == current_user.faculty_id}")
-    print(f"📊 Faculty Types: user={type(current_user.faculty_id)}, course={type(course.faculty_id)}")
 
     if course.faculty_id != current_user.faculty_id:
-        print("❌ Faculty mismatch - 403!")
+        logger.info(
+            "Note upload rejected: faculty mismatch",
+            extra={"user_id": current_user.id, "user_faculty_id": current_user.faculty_id, "course_faculty_id": course.faculty_id},
+        )
         raise HTTPException(status_code=403, detail="You are not authorized to upload notes for this course.")
 
-    print("✅ All checks passed, creating note...") # Debug
-
     new_note = Note(
         course_id=note_data.course_id,
         student_id=current_user.id,
@@ -71,30 +86,27 @@ def upload_note(
     db.add(new_note)
     db.commit()
     db.refresh(new_note)
+    search_index.note_changed(new_note)
 
-    print("✅ Note created successfully!")
-    print("=" * 50)
-    print(f"📊 Created Note ID: {new_note.id}")
-    print(f"📊 Created Note Description: {new_note.description}")
-    print(f"📊 Created Note File ID: {new_note.file_id}")
-    print("=" * 50)
+    logger.info("Note created", extra={"note_id": new_note.id, "course_id": new_note.course_id, "user_id": current_user.id})
 
     return new_note
 
 # 3. Modificare un appunto
 @router.put("/{note_id}")
-def update_note(note_id: int, description: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def update_note(note_id: int, description: str, db: Session = Depends(get_db), current_user: UserIdentity = Depends(get_current_identity)):
     note = db.query(Note).filter(Note.id == note_id, Note.student_id == current_user.id).first()
     if not note:
         raise HTTPException(status_code=404, detail="Note not found or unauthorized.")
 
     note.description = description
     db.commit()
+    search_index.note_changed(note)
     return {"message": "Note updated successfully."}
 
 # 4. Eliminare un appunto
 @router.delete("/{note_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_note(note_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def delete_note(note_id: int, db: Session = Depends(get_db), current_user: UserIdentity = Depends(get_current_identity)):
     note = db.query(Note).filter(Note.id == note_id).first()
     if not note:
         raise HTTPException(status_code=404, detail="Note not found.")
@@ -110,10 +122,13 @@ def delete_note(note_id: int, db: Session = Depends(get_db), current_user: User
             if blob.exists():
                 blob.delete()
     except Exception as e:
-        print(f"Failed to delete file from Firebase Storage: {e}")
+        logger.warning("Failed to delete file from Firebase Storage: %s", e)
 
+    course_id = note.course_id
     db.delete(note)
     db.commit()
+    search_index.note_removed(note_id)
+    course_ranking.course_changed(db, course_id)  # le valutazioni dell'appunto non contano più
     
     return
 
@@ -122,7 +137,7 @@ def delete_note(note_id: int, db: Session = Depends(get_db), current_user: User
 def add_rating(
     rating_data: NoteRatingCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserIdentity = Depends(get_current_identity)
 ):
     note = db.query(Note).filter(Note.id == rating_data.note_id).first()
     if not note:
@@ -149,7 +164,10 @@ def add_rating(
     )
 
     db.add(new_rating)
+    db.flush()
+    rating_added(db, new_rating)
     db.commit()
+    course_ranking.course_changed(db, note.course_id)
     db.refresh(new_rating)
 
     return new_rating
@@ -160,7 +178,7 @@ def update_rating(
     rating_id: int,
     rating_data: NoteRatingUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserIdentity = Depends(get_current_identity)
 ):
     rating = db.query(NoteRating).filter(
         NoteRating.id == rating_id,
@@ -170,9 +188,12 @@ def update_rating(
     if not rating:
         raise HTTPException(status_code=404, detail="Rating not found or unauthorized.")
 
+    old_rating = rating.rating
     rating.rating = rating_data.rating
     rating.comment = rating_data.comment
+    rating_changed(db, rating.note_id, old_rating, rating.rating)
     db.commit()
+    course_ranking.note_ratings_changed(db, rating.note_id)
     db.refresh(rating)
 
     return rating
@@ -182,7 +203,7 @@ def update_rating(
 def delete_rating(
     rating_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserIdentity = Depends(get_current_identity)
 ):
     rating = db.query(NoteRating).filter(
         NoteRating.id == rating_id,
@@ -192,8 +213,11 @@ def delete_rating(
     if not rating:
         raise HTTPException(status_code=404, detail="Rating not found or unauthorized.")
 
+    note_id = rating.note_id
+    rating_removed(db, rating)
     db.delete(rating)
     db.commit()
+    course_ranking.note_ratings_changed(db, note_id)
 
     return {"message": "Rating deleted successfully."}
 
@@ -209,44 +233,39 @@ def get_course_notes_average(course_id: int, db: Session = Depends(get_db)):
     return {"course_id": course_id, "average_rating": round(avg_rating, 2)}
 
 # 9. Ottenere la lista ordinata degli appunti di un corso
-@router.get("/{course_id}/notes-sorted", response_model=list[NoteWithRatingResponse])
-def get_sorted_notes(course_id: int, order: str = "desc", db: Session = Depends(get_db)):
-    print(f"🔍 GET /notes/{course_id}/notes-sorted called with order={order}")
-    
-    notes_query = (
-        db.query(Note, func.coalesce(func.avg(NoteRating.rating), -1).label("average_rating"))
-        .outerjoin(NoteRating, Note.id == NoteRating.note_id)
-        .filter(Note.course_id == course_id)
-        .group_by(Note.id)
+def _sorted_notes(db: Session, course_id: int, order: str, page: PageParams):
+    # Media e numero di valutazioni arrivano dal riepilogo precalcolato:
+    # una sola query, niente GROUP BY su note_ratings e niente COUNT per nota.
+    average = func.coalesce(
+        cast(NoteRatingStats.rating_sum, Float) / func.nullif(NoteRatingStats.rating_count, 0), -1
     )
+    descending = order.lower() != "asc"
+    sort_order = [(average, descending), *NOTE_ORDER]
 
-    if order.lower() == "asc":
-        notes_query = notes_query.order_by(func.coalesce(func.avg(NoteRating.rating), -1).asc(), Note.created_at.desc())
-    else:
-        notes_query = notes_query.order_by(func.coalesce(func.avg(NoteRating.rating), -1).desc(), Note.created_at.desc())
+    query = (
+        db.query(Note, average.label("average_rating"), NoteRatingStats.rating_count)
+        .outerjoin(NoteRatingStats, Note.id == NoteRatingStats.note_id)
+        .filter(Note.course_id == course_id)
+    )
+    rows = keyset(query, sort_order, page).all()
 
-    notes_with_ratings = notes_query.all()
-    print(f"📊 Query returned {len(notes_with_ratings)} notes")
-    
     result = []
-    for note, avg_rating in notes_with_ratings:
-        print(f"   📝 Note ID={note.id}, avg_rating={avg_rating}, type={type(avg_rating).__name__}")
-        
-        # Check ratings count for this note
-        ratings_count = db.query(NoteRating).filter(NoteRating.note_id == note.id).count()
-        print(f"      ✅ This note has {ratings_count} ratings in DB")
-        
-        note_dict = note.__dict__
+    for note, avg_rating, ratings_count in rows:
+        note_dict = note.__dict__.copy()
         note_dict['average_rating'] = round(avg_rating, 2) if avg_rating != -1 else None
-        print(f"      ➡️ Final average_rating in response: {note_dict['average_rating']}")
+        note_dict['rating_count'] = ratings_count or 0
+        note_dict['_sort_key'] = [avg_rating, *_note_cursor(note)]
         result.append(note_dict)
-
-    print(f"🎉 Returning {len(result)} notes")
     return result
 
+@router.get("/{course_id}/notes-sorted", response_model=list[NoteWithRatingResponse])
+async def get_sorted_notes(course_id: int, request: Request, response: Response, order: str = "desc", page: PageParams = Depends(), db: DbSession = Depends(get_session)):
+    notes = await run_db(db, _sorted_notes, course_id, order, page)
+    return finish_page(notes, page, lambda n: n['_sort_key'], request, response)
+
 # 10. Ottenere gli appunti di un utente
 @router.get("/usr/my-notes", response_model=list[NoteWithRatingResponse])
-def get_my_notes(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_my_notes(db: Session = Depends(get_db), current_user: UserIdentity = Depends(get_current_identity)):
     
     user_notes_query = (
         db.query(
@@ -274,7 +293,7 @@ def get_my_notes(db: Session = Depends(get_db), current_user: User = Depends(get
 
 # 11. Ottenere le valutazioni di un utente
 @router.get("/usr/my-reviews", response_model=list[NoteRatingResponse])
-def get_my_reviews(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_my_reviews(db: Session = Depends(get_db), current_user: UserIdentity = Depends(get_current_identity)):
     user_reviews = db.query(NoteRating).filter(NoteRating.student_id == current_user.id).all()
     if not user_reviews:
         raise HTTPException(status_code=404, detail="You have not created any reviews.")
@@ -292,6 +311,23 @@ def get_note_average_rating(note_id: int, db: Session = Depends(get_db)):
     avg_rating = db.query(func.coalesce(func.avg(NoteRating.rating), 0)).filter(NoteRating.note_id == note_id).scalar()
     return {"note_id": note_id, "average_rating": round(avg_rating, 2)}
 
+# 13b. Riepilogo delle valutazioni di un singolo appunto (numero, media, istogramma)
+def _note_rating_summary(db: Session, note_id: int):
+    if db.query(Note.id).filter(Note.id == note_id).first() is None:
+        raise HTTPException(status_code=404, detail="Note not found.")
+    stats = get_note_rating_stats(db, note_id)
+    count = stats.rating_count if stats else 0
+    return {
+        "note_id": note_id,
+        "rating_count": count,
+        "average_rating": round(stats.rating_sum / count, 2) if count > 0 else None,
+        "histogram": stats.histogram if stats else {str(star): 0 for star in range(1, 6)},
+    }
+
+@router.get("/notes/{note_id}/rating-summary")
+async def get_note_rating_summary(note_id: int, db: DbSession = Depends(get_session)):
+    return await run_db(db, _note_rating_summary, note_id)
+
 # 14. Ordinare le recensioni di un singolo appunto
 @router.get("/notes/{note_id}/reviews-sorted", response_model=list[NoteRatingResponse])
 def get_sorted_reviews(note_id: int, order: str = "desc", db: Session = Depends(get_db)):
@@ -304,7 +340,7 @@ def get_sorted_reviews(note_id: int, order: str = "desc", db: Session = Depends(
 
 # 15. Creare un report
 @router.post("/reports", response_model=ReportResponse)
-def create_report(report: ReportCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def create_report(report: ReportCreate, db: Session = Depends(get_db), current_user: UserIdentity = Depends(get_current_identity)):
     if (report.id_review is None and report.id_note is None) or \
        (report.id_review is not None and report.id_note is not None):
         raise HTTPException(status_code=400, detail="You must provide either id_review or id_note, but not both.")
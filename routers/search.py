@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, Query
+from typing import List, Literal, Optional
+
+from database.async_database import DbSession, get_session, run_db
+from auth.auth import get_current_identity
+from auth.identity import UserIdentity
+from services.search_index import KINDS, search_index
+from schemas.search import SearchResponse
+
+router = APIRouter()
+
+# 🔎 **Ricerca su corsi, professori e appunti** (vedi services/search_index.py)
+# Pensata per la ricerca mentre si scrive: l'ultima parola vale anche come
+# prefisso e sono tollerati piccoli errori di battitura.
+@router.get("/", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=1, max_length=100, description="Search text"),
+    type: Optional[List[Literal["course", "teacher", "note"]]] = Query(None, description="Restrict to these result types"),
+    faculty_id: Optional[int] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    db: DbSession = Depends(get_session),
+    current_user: UserIdentity = Depends(get_current_identity),
+):
+    found = await run_db(db, search_index.search, q, type or KINDS, faculty_id, limit)
+    return {
+        "query": q,
+        "results": [{**payload, "score": round(score, 4)} for score, payload in found],
+    }
@@ -1,5 +1,7 @@
 # file: routers/users.py
 
+import logging
+
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from firebase_admin import auth as firebase_auth
@@ -9,8 +11,14 @@ from database.database import get_db
 from models.user import User
 from schemas.user import UserProfileCreate, UserProfileUpdate, UserResponse
 from auth.auth import get_current_user, verify_firebase_token
+from auth.identity import invalidate_identity
+from services.course_ratings import reviews_of_student_removed
+from services.note_ratings import ratings_of_student_removed
+from services.search_index import search_index
+from services import course_ranking
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 auth_scheme = HTTPBearer()
 
@@ -75,19 +83,12 @@ def get_my_profile(current_user: User = Depends(get_current_user), db: Session =
     """
     Restituisce il profilo dell'utente attualmente loggato.
     """
-    print("=" * 50)
-    print("📡 GET /users/me endpoint called")
-    print(f"👤 User ID: {current_user.id}")
-    print(f"👤 User Email: {current_user.email}")
-    print(f"🏫 Faculty ID: {current_user.faculty_id}")
-    
     # ✅ Costruisci manualmente la risposta con faculty_name
-    if current_user.faculty:
-        print(f"✅ Faculty found: {current_user.faculty.name}")
-        faculty_name = current_user.faculty.name
-    else:
-        print("⚠️ No faculty assigned to this user")
-        faculty_name = None
+    faculty_name = current_user.faculty.name if current_user.faculty else None
+    logger.debug(
+        "GET /users/me",
+        extra={"user_id": current_user.id, "faculty_id": current_user.faculty_id, "faculty_name": faculty_name},
+    )
     
     user_response = UserResponse(
         id=current_user.id,
@@ -101,10 +102,7 @@ def get_my_profile(current_user: User = Depends(get_current_user), db: Session =
         faculty_id=current_user.faculty_id,
         faculty_name=faculty_name  # ✅ Popola faculty_name
     )
-    
-    print(f"📤 Sending response with faculty_name: {faculty_name}")
-    print("=" * 50)
-    
+
     return user_response
 
 
@@ -125,6 +123,7 @@ def update_my_profile(
 
     db.commit()
     db.refresh(current_user)
+    invalidate_identity(current_user.firebase_uid)
     
     return UserResponse(
         id=current_user.id,
@@ -160,16 +159,26 @@ def delete_my_account(
         #    impostato sulla tabella 'profiles' (se l'hai creata in quel modo).
         #    Se non hai una tabella profiles separata, ma l'UID è in 'users',
         #    la cancellazione del record scatenerà le altre cascade.
+        reviews_of_student_removed(db, current_user.id)
+        ratings_of_student_removed(db, current_user.id)
         db.delete(current_user)
         db.commit()
+        invalidate_identity(firebase_uid)
+        search_index.invalidate()
+        course_ranking.invalidate()
 
         return {"message": "User account deleted successfully from all systems."}
 
     except firebase_auth.UserNotFoundError:
         # L'utente non esiste più su Firebase, ma esiste ancora nel nostro DB.
         # È un caso di dati non allineati. Procediamo a pulire il nostro DB.
+        reviews_of_student_removed(db, current_user.id)
+        ratings_of_student_removed(db, current_user.id)
         db.delete(current_user)
         db.commit()
+        invalidate_identity(firebase_uid)
+        search_index.invalidate()
+        course_ranking.invalidate()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found in Firebase, but was cleaned up from local DB."
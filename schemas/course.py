@@ -33,4 +33,23 @@ class CourseResponse(BaseModel):
     floor: Optional[int] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# Suggerimento dell'autocompletamento dei corsi
+class CourseSuggestion(BaseModel):
+    id: int
+    name: str
+
+# Posizione di un corso nella classifica della facoltà.
+# Le medie sono None se il corso non ha ancora voti.
+class CourseRankingEntry(BaseModel):
+    rank: int
+    course_id: int
+    name: str
+    score: float
+    review_count: int
+    average_clarity: Optional[float] = None
+    average_feasibility: Optional[float] = None
+    average_availability: Optional[float] = None
+    note_rating_count: int
+    average_note_rating: Optional[float] = None
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from datetime import time,date
+from datetime import time,date,datetime
 from typing import Optional
 
 # --- DEFINIZIONE "LITE" DEL CORSO (Per evitare circular imports) ---
@@ -38,4 +38,32 @@ class Lesson(LessonBase):
     last_checkin_date: Optional[date] = None
 
     class Config:
-        from_attributes = True # Fix per Pydantic V2
\ No newline at end of file
+        from_attributes = True # Fix per Pydantic V2
+
+class LessonOccupancy(BaseModel):
+    lesson_id: int
+    date: date
+    occupancy: int
+
+class CheckinHistoryDay(BaseModel):
+    date: date
+    checkins: int
+
+class LessonNow(BaseModel):
+    id: int
+    course_id: int
+    course_name: Optional[str] = None
+    day_of_week: str
+    start_time: time
+    end_time: time
+    starts_at: datetime
+    ends_at: datetime
+    in_progress: bool
+    starts_in_minutes: int
+    room_number: Optional[str] = None
+    building_name: Optional[str] = None
+    floor: Optional[int] = None
+    faculty_id: Optional[int] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    distance_meters: Optional[float] = None
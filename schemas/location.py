@@ -0,0 +1,12 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+# Schema per la navigazione verso più destinazioni in una sola richiesta
+class BatchNavigationRequest(BaseModel):
+    latitude: float
+    longitude: float
+    # Corsi da raggiungere; se assente si usano le lezioni di oggi della facoltà dell'utente
+    course_ids: Optional[List[int]] = Field(None, max_length=50)
+    today: bool = False
+    # Ordina le destinazioni per minimizzare la distanza totale a piedi
+    optimize: bool = False
@@ -18,8 +18,9 @@ class NoteWithRatingResponse(BaseModel):
     student_id: int
     description: Optional[str]
     file_id: str
-    created_at: datetime
+    created_at: Optional[datetime]  # NULL negli appunti più vecchi
     average_rating: Optional[float] = None
+    rating_count: Optional[int] = None
     course_name: Optional[str] = None
 
     class Config:
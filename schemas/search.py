@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+# 📌 Risultato della ricerca: un corso, un professore o un appunto.
+#    `title` è il nome (o l'inizio della descrizione per gli appunti).
+class SearchResult(BaseModel):
+    type: str
+    id: int
+    title: str
+    score: float
+    course_id: Optional[int] = None
+    course_name: Optional[str] = None
+    faculty_id: Optional[int] = None
+    teacher_name: Optional[str] = None
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchResult]
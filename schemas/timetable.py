@@ -0,0 +1,70 @@
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import Optional, List
+from datetime import time
+
+from utils.timetable import parse_weekday
+
+# 📌 Riga dell'import dell'orario: un corso (con aula e coordinate) e,
+#    opzionalmente, una sua lezione settimanale. Lo stesso corso può comparire
+#    su più righe, una per lezione.
+class TimetableRow(BaseModel):
+    course_name: str = Field(..., min_length=1)
+    faculty_id: Optional[int] = None
+    faculty_name: Optional[str] = None
+    teacher_name: Optional[str] = None
+    room_number: Optional[str] = None
+    building_name: Optional[str] = None
+    floor: Optional[int] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+    day_of_week: Optional[str] = None
+    start_time: Optional[time] = None
+    end_time: Optional[time] = None
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def empty_as_none(cls, value):
+        # Le celle vuote di un CSV arrivano come stringhe vuote
+        if isinstance(value, str):
+            value = value.strip()
+            return value or None
+        return value
+
+    @field_validator("day_of_week")
+    @classmethod
+    def known_weekday(cls, value):
+        if value is not None and parse_weekday(value) is None:
+            raise ValueError(f"unknown day of week '{value}'")
+        return value
+
+    @model_validator(mode="after")
+    def consistent(self):
+        lesson_fields = (self.day_of_week, self.start_time, self.end_time)
+        if any(v is not None for v in lesson_fields) and any(v is None for v in lesson_fields):
+            raise ValueError("day_of_week, start_time and end_time must be given together")
+        if (self.latitude is None) != (self.longitude is None):
+            raise ValueError("latitude and longitude must be given together")
+        return self
+
+    @property
+    def has_lesson(self) -> bool:
+        return self.day_of_week is not None
+
+class TimetableRowError(BaseModel):
+    row: int
+    course_name: Optional[str] = None
+    errors: List[str]
+
+class TimetableImportReport(BaseModel):
+    rows_read: int
+    rows_invalid: int
+    committed: bool
+    dry_run: bool
+    teachers_created: int = 0
+    courses_created: int = 0
+    courses_updated: int = 0
+    lessons_created: int = 0
+    lessons_updated: int = 0
+    lessons_unchanged: int = 0
+    lessons_deleted: int = 0
+    errors: List[TimetableRowError] = []
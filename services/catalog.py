@@ -0,0 +1,41 @@
+# services/catalog.py
+#
+# Cosa invalidare dopo le scritture sul catalogo (facoltà, corsi, professori,
+# orario importato): indici in memoria, classifica dei corsi e risposte in
+# cache. Gli endpoint chiamano questi hook invece di tenere ognuno la
+# propria lista.
+
+from typing import Optional
+
+from models.course import Course
+from services import course_ranking
+from services.course_autocomplete import course_name_index
+from services.search_index import search_index
+from services.spatial_index import course_index, faculty_index
+from services.timetable_index import lesson_index
+from utils.response_cache import ResponseCache
+
+
+def faculties_changed(cache: ResponseCache):
+    """Dopo il commit di una facoltà nuova o eliminata."""
+    faculty_index.invalidate()
+    cache.invalidate("faculties")
+
+
+def courses_changed(cache: ResponseCache, added: Optional[Course] = None, removed: Optional[int] = None):
+    """
+    Dopo il commit di una scrittura su corsi o professori (o di un import
+    dell'orario). Con `added` (corso appena creato) o `removed` (id del corso
+    eliminato) l'indice dei nomi si aggiorna in place invece di ricostruirsi.
+    """
+    course_index.invalidate()
+    lesson_index.invalidate()
+    search_index.invalidate()
+    if added is not None:
+        course_name_index.course_added(added)
+    elif removed is not None:
+        course_name_index.course_removed(removed)
+    else:
+        course_name_index.invalidate()
+    course_ranking.invalidate()
+    cache.invalidate("courses", "teachers")
@@ -0,0 +1,271 @@
+# services/checkin_counter.py
+#
+# Check-in delle lezioni. Ogni check-in è una riga di `lesson_checkins`
+# (studente, lezione, giorno, ora) inserita con ON CONFLICT DO NOTHING, così
+# lo stesso studente conta una volta sola al giorno; `Lesson.checkins` è il
+# conteggio del giorno, incrementato solo per le righe davvero inserite, e
+# resta l'unica cosa da leggere per sapere quanto è piena l'aula.
+#
+# Due modalità:
+#
+#   - default: inserimento e incremento nella transazione della richiesta,
+#     l'incremento è un singolo UPDATE atomico
+#       SET checkins = CASE WHEN last_checkin_date = oggi THEN checkins + n ELSE n END
+#     con RETURNING, quindi niente read-modify-write e nessun aggiornamento perso;
+#   - CHECKIN_BUFFER_MS > 0: i check-in si accumulano in memoria (divisi in
+#     CHECKIN_BUFFER_SHARDS shard, ognuno col suo lock, già senza doppioni) e
+#     un thread li scrive ogni CHECKIN_BUFFER_MS millisecondi con un INSERT
+#     multiplo e un UPDATE per lezione. Utile per lezioni molto affollate;
+#     l'occupazione restituita è quella nel DB più i check-in locali non
+#     ancora scritti, e un crash del processo perde al massimo un intervallo.
+#
+# L'incremento conta solo le righe inserite, quindi più worker con il proprio
+# buffer restano corretti (al più un doppione tra worker diversi viene
+# mostrato per un intervallo, prima che il vincolo di unicità lo scarti).
+#
+# `rebuild_lesson_occupancy` riallinea i contatori al registro:
+#   python -m services.checkin_counter [--date 2026-01-31] [--dry-run]
+
+import atexit
+import json
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import date, datetime
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import case, func, update
+from sqlalchemy.orm import Session
+
+from database.dialect import upsert_insert
+from models.lesson import Lesson
+from models.lesson_checkin import LessonCheckin
+
+CHECKIN_BUFFER_MS = int(os.getenv("CHECKIN_BUFFER_MS", "0"))
+CHECKIN_BUFFER_SHARDS = max(int(os.getenv("CHECKIN_BUFFER_SHARDS", "16")), 1)
+# Righe per INSERT multiplo (4 parametri a riga, ben sotto i limiti di SQLite)
+INSERT_CHUNK = 500
+
+logger = logging.getLogger(__name__)
+
+
+def _increment(count: int, day: date) -> dict:
+    """
+    Valori dell'UPDATE che somma `count` check-in del giorno `day`: il
+    contatore riparte se l'ultimo check-in è di un giorno precedente, e un
+    delta arrivato in ritardo (giorno già passato) non tocca quello di oggi.
+    """
+    newer = Lesson.last_checkin_date > day
+    return {
+        "checkins": case(
+            (Lesson.last_checkin_date == day, func.coalesce(Lesson.checkins, 0) + count),
+            (newer, Lesson.checkins),
+            else_=count,
+        ),
+        "last_checkin_date": case((newer, Lesson.last_checkin_date), else_=day),
+    }
+
+
+def add_checkins(db: Session, lesson_id: int, count: int, day: date):
+    """
+    Somma `count` check-in con un solo UPDATE atomico e restituisce il nuovo
+    valore (None se la lezione non esiste). Non fa commit.
+    """
+    stmt = (
+        update(Lesson)
+        .where(Lesson.id == lesson_id)
+        .values(**_increment(count, day))
+        .returning(Lesson.checkins)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(stmt).scalar_one_or_none()
+
+
+def record_checkins(db: Session, rows: Iterable[Tuple[int, int, datetime]]) -> Dict[Tuple[int, date], int]:
+    """
+    Registra i check-in `(lesson_id, user_id, checked_in_at)` scartando quelli
+    già presenti per lo stesso giorno, poi incrementa i contatori delle lezioni
+    delle sole righe inserite. Restituisce la nuova occupazione per
+    (lezione, giorno) toccati; i doppioni non compaiono. Non fa commit.
+    """
+    values = [
+        {"lesson_id": lesson_id, "user_id": user_id, "checkin_date": at.date(), "checked_in_at": at}
+        for lesson_id, user_id, at in rows
+    ]
+    inserted = Counter()
+    for start in range(0, len(values), INSERT_CHUNK):
+        stmt = (
+            upsert_insert(db, LessonCheckin.__table__)
+            .values(values[start:start + INSERT_CHUNK])
+            .on_conflict_do_nothing(index_elements=["lesson_id", "user_id", "checkin_date"])
+            .returning(LessonCheckin.lesson_id, LessonCheckin.checkin_date)
+        )
+        inserted.update((row.lesson_id, row.checkin_date) for row in db.execute(stmt))
+
+    # In ordine di giorno e lezione: più worker aggiornano le righe nello stesso ordine
+    return {
+        key: add_checkins(db, key[0], count, key[1])
+        for key, count in sorted(inserted.items(), key=lambda item: (item[0][1], item[0][0]))
+    }
+
+
+class CheckinBuffer:
+    """
+    Check-in in memoria per (lezione, giorno) -> {studente: ora}, divisi in
+    shard per ridurre la contesa sui lock.
+    """
+
+    def __init__(self, interval_ms: int, shards: int):
+        self.interval = interval_ms / 1000
+        self._shards = [(threading.Lock(), {}) for _ in range(shards)]
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _shard(self, lesson_id: int):
+        return self._shards[lesson_id % len(self._shards)]
+
+    def add(self, lesson_id: int, user_id: int, at: datetime) -> Tuple[bool, int]:
+        """
+        Registra un check-in; restituisce se è nuovo (non già nel buffer) e
+        quanti check-in locali non ancora scritti ha la lezione quel giorno.
+        """
+        self._ensure_started()
+        lock, pending = self._shard(lesson_id)
+        with lock:
+            users = pending.setdefault((lesson_id, at.date()), {})
+            added = user_id not in users
+            if added:
+                users[user_id] = at
+            return added, len(users)
+
+    def pending(self, lesson_id: int, day: date) -> int:
+        lock, pending = self._shard(lesson_id)
+        with lock:
+            return len(pending.get((lesson_id, day), ()))
+
+    def _drain(self) -> Dict[Tuple[int, date], Dict[int, datetime]]:
+        drained = {}
+        for lock, pending in self._shards:
+            with lock:
+                drained.update(pending)
+                pending.clear()
+        return drained
+
+    def _restore(self, drained: Dict[Tuple[int, date], Dict[int, datetime]]):
+        for (lesson_id, day), users in drained.items():
+            lock, pending = self._shard(lesson_id)
+            with lock:
+                current = pending.setdefault((lesson_id, day), {})
+                for user_id, at in users.items():
+                    current.setdefault(user_id, at)
+
+    def flush(self):
+        """Scrive nel DB i check-in accumulati."""
+        drained = self._drain()
+        if not drained:
+            return
+        from database.database import SessionLocal
+
+        rows = [
+            (lesson_id, user_id, at)
+            for (lesson_id, _), users in drained.items()
+            for user_id, at in users.items()
+        ]
+        db = SessionLocal()
+        try:
+            record_checkins(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            self._restore(drained)
+            logger.exception("Check-in buffer flush failed, %d check-ins kept in memory", len(rows))
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="checkin-buffer", daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+
+checkin_buffer = CheckinBuffer(CHECKIN_BUFFER_MS, CHECKIN_BUFFER_SHARDS) if CHECKIN_BUFFER_MS > 0 else None
+
+
+def current_occupancy(lesson_id: int, stored: int, last_checkin_date, day: date) -> int:
+    """Occupazione del giorno: contatore nel DB (se è di quel giorno) più i check-in ancora nel buffer."""
+    occupancy = (stored or 0) if last_checkin_date == day else 0
+    if checkin_buffer is not None:
+        occupancy += checkin_buffer.pending(lesson_id, day)
+    return occupancy
+
+
+def rebuild_lesson_occupancy(db: Session, day: date = None, fix: bool = True) -> dict:
+    """
+    Confronta i contatori delle lezioni con il registro dei check-in del
+    giorno `day` (default: oggi) e, se `fix`, li riallinea.
+    """
+    day = day or date.today()
+    expected = dict(
+        db.query(LessonCheckin.lesson_id, func.count(LessonCheckin.id))
+        .filter(LessonCheckin.checkin_date == day)
+        .group_by(LessonCheckin.lesson_id)
+        .all()
+    )
+    stored = {
+        row.id: row.checkins or 0
+        for row in db.query(Lesson.id, Lesson.checkins).filter(Lesson.last_checkin_date == day)
+    }
+
+    drift = []
+    for lesson_id in sorted(set(expected) | set(stored)):
+        wanted, actual = expected.get(lesson_id, 0), stored.get(lesson_id, 0)
+        if wanted == actual:
+            continue
+        drift.append({"lesson_id": lesson_id, "expected": wanted, "actual": actual})
+        if fix:
+            db.query(Lesson).filter(Lesson.id == lesson_id).update(
+                {Lesson.checkins: wanted, Lesson.last_checkin_date: day}, synchronize_session=False
+            )
+
+    if fix:
+        db.commit()
+
+    return {
+        "date": day.isoformat(),
+        "lessons_checked": len(set(expected) | set(stored)),
+        "drifted": len(drift),
+        "fixed": fix,
+        "drift": drift,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import models  # noqa: F401  (registra tutti i mapper)
+    from database.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Riallinea l'occupazione delle lezioni al registro dei check-in")
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="giorno da ricontare (default: oggi)")
+    parser.add_argument("--dry-run", action="store_true", help="riporta le differenze senza correggerle")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        print(json.dumps(rebuild_lesson_occupancy(db, args.date, fix=not args.dry_run), indent=2))
+    finally:
+        db.close()
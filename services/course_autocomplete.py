@@ -0,0 +1,155 @@
+# services/course_autocomplete.py
+#
+# Autocompletamento dei nomi dei corsi per facoltà (scelta del corso nel
+# caricamento degli appunti). Per ogni facoltà due array ordinati di chiavi
+# normalizzate (accenti e maiuscole ignorati, come in services/search_index.py):
+#   - il nome intero: "analisi matematica 1";
+#   - il nome da ogni parola successiva: "matematica 1", "1";
+# così "mat" trova anche "Analisi Matematica". I nomi che iniziano con un
+# prefisso sono un tratto contiguo dell'array (bisezione) e i primi k si
+# leggono senza scorrere il resto: prima i nomi che iniziano con il
+# prefisso, poi quelli con una parola successiva che inizia con il
+# prefisso, in ordine alfabetico.
+#
+# L'indice si costruisce alla prima richiesta (una query sui corsi) e poi
+# si aggiorna in place con `course_added` / `course_removed`. Le modifiche
+# in blocco (import dell'orario, eliminazione di una facoltà) usano
+# `invalidate()` e la ricostruzione lazy, come gli altri indici in memoria.
+# Con più worker gli aggiornamenti in place restano locali: gli altri
+# processi ricevono un'invalidazione e ricostruiscono (services/lazy_index.py).
+
+import os
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from models.course import Course
+from services.lazy_index import LazyIndex
+from services.search_index import tokenize
+
+COURSE_AUTOCOMPLETE_MAX_AGE = int(os.getenv("COURSE_AUTOCOMPLETE_MAX_AGE", "300"))
+
+
+def _keys(name: str) -> List[str]:
+    """Chiave del nome intero seguita da quelle che partono dalle parole successive."""
+    words = tokenize(name)
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+class _Faculty:
+    def __init__(self):
+        self.names: List[Tuple[str, int]] = []  # (nome normalizzato, id corso)
+        self.words: List[Tuple[str, int]] = []  # (nome dalla parola i-esima, id corso)
+
+
+def _scan(entries: List[Tuple[str, int]], prefix: str, limit: int, found: List[int], seen: set):
+    i = bisect_left(entries, (prefix,))
+    while i < len(entries) and len(found) < limit:
+        key, course_id = entries[i]
+        if not key.startswith(prefix):
+            return
+        if course_id not in seen:
+            seen.add(course_id)
+            found.append(course_id)
+        i += 1
+
+
+class _Names:
+    def __init__(self):
+        self.faculties: Dict[int, _Faculty] = {}
+        self.courses: Dict[int, Tuple[int, str, List[str]]] = {}  # id -> (facoltà, nome, chiavi)
+
+    def remove(self, course_id: int):
+        entry = self.courses.pop(course_id, None)
+        if entry is None:
+            return
+        faculty_id, _, keys = entry
+        partition = self.faculties[faculty_id]
+        del partition.names[bisect_left(partition.names, (keys[0], course_id))]
+        for key in keys[1:]:
+            del partition.words[bisect_left(partition.words, (key, course_id))]
+
+
+class CourseNameIndex(LazyIndex):
+    """
+    Nomi dei corsi partizionati per facoltà, ricostruiti in modo lazy (vedi
+    services/lazy_index.py). Thread-safe: le letture e gli aggiornamenti
+    incrementali prendono un lock per pochi microsecondi.
+    """
+
+    def __init__(self):
+        super().__init__("course-names", COURSE_AUTOCOMPLETE_MAX_AGE)
+        self._lock = threading.Lock()
+
+    def apply_invalidate(self):
+        with self._lock:
+            super().apply_invalidate()
+
+    def _store(self, data: _Names, generation: int):
+        with self._lock:
+            super()._store(data, generation)
+
+    def _build(self, db: Session) -> _Names:
+        names = _Names()
+        for course_id, faculty_id, name in db.query(Course.id, Course.faculty_id, Course.name).all():
+            keys = _keys(name or "")
+            if not keys:
+                continue
+            partition = names.faculties.setdefault(faculty_id, _Faculty())
+            partition.names.append((keys[0], course_id))
+            partition.words.extend((key, course_id) for key in keys[1:])
+            names.courses[course_id] = (faculty_id, name, keys)
+        for partition in names.faculties.values():
+            partition.names.sort()
+            partition.words.sort()
+        return names
+
+    def course_added(self, course: Course):
+        """Da chiamare dopo il commit di un corso nuovo (o rinominato)."""
+        with self._lock:
+            self.changed()
+            names = self._data
+            if names is None:
+                return
+            names.remove(course.id)
+            keys = _keys(course.name or "")
+            if not keys:
+                return
+            partition = names.faculties.setdefault(course.faculty_id, _Faculty())
+            insort(partition.names, (keys[0], course.id))
+            for key in keys[1:]:
+                insort(partition.words, (key, course.id))
+            names.courses[course.id] = (course.faculty_id, course.name, keys)
+
+    def course_removed(self, course_id: int):
+        with self._lock:
+            self.changed()
+            if self._data is not None:
+                self._data.remove(course_id)
+
+    def complete(self, faculty_id: int, query: str, limit: int) -> List[dict]:
+        """
+        Fino a `limit` corsi della facoltà il cui nome (o una sua parola)
+        inizia con `query`. Con uno spazio finale l'ultima parola è completa.
+        """
+        prefix = " ".join(tokenize(query))
+        if not prefix:
+            return []
+        if query[-1:].isspace():
+            prefix += " "
+        found: List[int] = []
+        with self._lock:
+            names = self._data
+            partition = names.faculties.get(faculty_id) if names is not None else None
+            if partition is None:
+                return []
+            seen: set = set()
+            _scan(partition.names, prefix, limit, found, seen)
+            _scan(partition.words, prefix, limit, found, seen)
+            return [{"id": course_id, "name": names.courses[course_id][1]} for course_id in found]
+
+
+# Da aggiornare dopo ogni scrittura sui corsi
+course_name_index = CourseNameIndex()
@@ -0,0 +1,189 @@
+# services/course_ranking.py
+#
+# Classifica dei corsi di una facoltà ("i corsi migliori della mia
+# facoltà"): una query aggregata sugli aggregati già mantenuti
+# (course_rating_stats, note_rating_stats) invece di una chiamata a
+# /courses/{id}/ratings per ogni corso.
+#
+# Punteggio (media bayesiana, da 1 a 5): per ognuno dei tre voti delle
+# recensioni e per il voto degli appunti
+#
+#   (m * media_facoltà + somma_voti) / (m + numero_voti)
+#
+# cioè la media del corso "tirata" verso quella della facoltà con il peso
+# di m voti fittizi: un corso con due recensioni da 5 non supera uno con
+# cinquanta recensioni da 4.8. I tre voti delle recensioni pesano uguale;
+# la media degli appunti pesa RANKING_NOTE_WEIGHT. Un corso senza voti ha
+# il punteggio medio della facoltà.
+#
+# La classifica sta nel sottosistema cache/ (namespace "course-ranking"),
+# una voce per facoltà con i conteggi di ogni corso. Dopo una scrittura su
+# recensioni o valutazioni degli appunti `course_changed(db, course_id)`
+# rilegge i conteggi del solo corso e aggiorna la voce della facoltà
+# (niente ricalcolo completo); le modifiche in blocco usano `invalidate()`.
+# Con un backend condiviso due aggiornamenti contemporanei della stessa
+# facoltà possono perdersi a vicenda: la voce resta indietro al più
+# RANKING_CACHE_TTL secondi.
+
+import os
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from cache import make_cache
+from database.async_database import DbSession, run_db
+from models.course import Course
+from models.course_rating_stats import CourseRatingStats
+from models.note import Note
+from models.note_rating_stats import NoteRatingStats
+from services.course_ratings import RATING_FIELDS
+
+RANKING_CACHE_SIZE = int(os.getenv("RANKING_CACHE_SIZE", "256"))
+RANKING_CACHE_TTL = int(os.getenv("RANKING_CACHE_TTL", "300"))
+# Voti fittizi (alla media della facoltà) aggiunti a ogni corso
+RANKING_PRIOR_REVIEWS = float(os.getenv("RANKING_PRIOR_REVIEWS", "5"))
+RANKING_PRIOR_NOTE_RATINGS = float(os.getenv("RANKING_PRIOR_NOTE_RATINGS", "10"))
+# Peso della media degli appunti rispetto alle recensioni (0-1)
+RANKING_NOTE_WEIGHT = float(os.getenv("RANKING_NOTE_WEIGHT", "0.25"))
+
+
+class CourseCounts(NamedTuple):
+    name: str
+    review_count: int
+    sum_clarity: int
+    sum_feasibility: int
+    sum_availability: int
+    note_rating_count: int
+    note_rating_sum: int
+
+
+class FacultyRanking(NamedTuple):
+    counts: Dict[int, CourseCounts]
+    courses: List[dict]  # in ordine di classifica
+
+
+_cache = make_cache("course-ranking", RANKING_CACHE_SIZE, RANKING_CACHE_TTL)
+
+
+def _counts_query(condition):
+    # Conteggi delle valutazioni degli appunti, per corso, solo per i corsi selezionati
+    note_totals = (
+        select(
+            Note.course_id,
+            func.sum(NoteRatingStats.rating_count).label("rating_count"),
+            func.sum(NoteRatingStats.rating_sum).label("rating_sum"),
+        )
+        .join(NoteRatingStats, NoteRatingStats.note_id == Note.id)
+        .join(Course, Course.id == Note.course_id)
+        .where(condition)
+        .group_by(Note.course_id)
+        .subquery()
+    )
+    return (
+        select(
+            Course.id, Course.faculty_id, Course.name,
+            CourseRatingStats.review_count, CourseRatingStats.sum_clarity,
+            CourseRatingStats.sum_feasibility, CourseRatingStats.sum_availability,
+            note_totals.c.rating_count, note_totals.c.rating_sum,
+        )
+        .outerjoin(CourseRatingStats, CourseRatingStats.course_id == Course.id)
+        .outerjoin(note_totals, note_totals.c.course_id == Course.id)
+        .where(condition)
+    )
+
+
+def _counts(row) -> CourseCounts:
+    return CourseCounts(row.name, *(int(value or 0) for value in row[3:]))
+
+
+def _bayesian(total: int, count: int, prior_mean: float, prior_weight: float) -> float:
+    return (prior_weight * prior_mean + total) / (prior_weight + count)
+
+
+def _mean(total: int, count: int) -> Optional[float]:
+    return round(total / count, 2) if count > 0 else None
+
+
+def _rank(counts: Dict[int, CourseCounts]) -> FacultyRanking:
+    reviews = sum(c.review_count for c in counts.values())
+    note_ratings = sum(c.note_rating_count for c in counts.values())
+    # Medie della facoltà; 3 (metà scala) se non c'è ancora nessun voto
+    priors = {
+        field: sum(getattr(c, f"sum_{field}") for c in counts.values()) / reviews if reviews else 3.0
+        for field in RATING_FIELDS
+    }
+    note_prior = sum(c.note_rating_sum for c in counts.values()) / note_ratings if note_ratings else 3.0
+
+    scored = []
+    for course_id, c in counts.items():
+        review_score = sum(
+            _bayesian(getattr(c, f"sum_{field}"), c.review_count, priors[field], RANKING_PRIOR_REVIEWS)
+            for field in RATING_FIELDS
+        ) / len(RATING_FIELDS)
+        note_score = _bayesian(c.note_rating_sum, c.note_rating_count, note_prior, RANKING_PRIOR_NOTE_RATINGS)
+        score = (1 - RANKING_NOTE_WEIGHT) * review_score + RANKING_NOTE_WEIGHT * note_score
+        scored.append((score, course_id, c))
+    scored.sort(key=lambda item: (-item[0], -item[2].review_count, item[1]))
+
+    courses = [
+        {
+            "rank": position,
+            "course_id": course_id,
+            "name": c.name,
+            "score": round(score, 3),
+            "review_count": c.review_count,
+            "average_clarity": _mean(c.sum_clarity, c.review_count),
+            "average_feasibility": _mean(c.sum_feasibility, c.review_count),
+            "average_availability": _mean(c.sum_availability, c.review_count),
+            "note_rating_count": c.note_rating_count,
+            "average_note_rating": _mean(c.note_rating_sum, c.note_rating_count),
+        }
+        for position, (score, course_id, c) in enumerate(scored, start=1)
+    ]
+    return FacultyRanking(counts, courses)
+
+
+def load_faculty_ranking(db: Session, faculty_id: int) -> FacultyRanking:
+    rows = db.execute(_counts_query(Course.faculty_id == faculty_id)).all()
+    return _rank({row.id: _counts(row) for row in rows})
+
+
+async def get_faculty_ranking(db: DbSession, faculty_id: int) -> FacultyRanking:
+    """Classifica della facoltà dalla cache o, se manca, con una query (una sola anche con richieste concorrenti)."""
+    return await _cache.aget_or_set(
+        faculty_id, lambda: run_db(db, load_faculty_ranking, faculty_id), tags=(f"faculty:{faculty_id}",)
+    )
+
+
+def course_changed(db: Session, course_id: int):
+    """
+    Da chiamare dopo il commit di una scrittura che cambia i voti del corso
+    (recensioni, valutazioni degli appunti, appunti eliminati) o dopo la
+    creazione di un corso: aggiorna la classifica della facoltà se è in cache.
+    """
+    row = db.execute(_counts_query(Course.id == course_id)).first()
+    if row is None:
+        return
+    tag = f"faculty:{row.faculty_id}"
+    ranking: Optional[FacultyRanking] = _cache.get(row.faculty_id)
+    # L'invalidazione scarta anche una classifica in calcolo con i conteggi
+    # vecchi e le copie degli altri worker
+    _cache.invalidate(tag)
+    if ranking is None:
+        return
+    counts = dict(ranking.counts)  # le voci in cache non vanno modificate
+    counts[course_id] = _counts(row)
+    _cache.set(row.faculty_id, _rank(counts), tags=(tag,))
+
+
+def note_ratings_changed(db: Session, note_id: int):
+    """Come `course_changed`, per il corso dell'appunto."""
+    course_id = db.scalar(select(Note.course_id).where(Note.id == note_id))
+    if course_id is not None:
+        course_changed(db, course_id)
+
+
+def invalidate():
+    """Dopo modifiche in blocco (corsi o facoltà eliminati, utenti eliminati, aggregati ricostruiti)."""
+    _cache.clear()
@@ -0,0 +1,153 @@
+# services/course_ratings.py
+#
+# Aggregati per corso (numero di recensioni e somme dei tre voti) mantenuti
+# in modo incrementale nella stessa transazione della scrittura sulla
+# recensione. `rebuild_course_rating_stats` li ricalcola da zero e riporta
+# le differenze trovate: si può lanciare da riga di comando con
+#
+#   python -m services.course_ratings
+
+import json
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database.dialect import upsert_insert
+from models.course_rating_stats import CourseRatingStats
+from models.review import Review
+
+RATING_FIELDS = ("clarity", "feasibility", "availability")
+
+
+def snapshot_ratings(review) -> dict:
+    """I tre voti di una recensione; da leggere prima di modificarla."""
+    return {field: int(getattr(review, f"rating_{field}")) for field in RATING_FIELDS}
+
+
+def apply_review_delta(db: Session, course_id: int, count: int = 0,
+                       clarity: int = 0, feasibility: int = 0, availability: int = 0):
+    """
+    Somma un delta agli aggregati del corso con un unico UPSERT atomico
+    (niente read-modify-write: le scritture concorrenti non si perdono).
+    Non fa commit: va chiamata prima del commit della recensione.
+    """
+    table = CourseRatingStats.__table__
+    stmt = upsert_insert(db, table).values(
+        course_id=course_id,
+        review_count=count,
+        sum_clarity=clarity,
+        sum_feasibility=feasibility,
+        sum_availability=availability,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.course_id],
+        set_={
+            "review_count": table.c.review_count + count,
+            "sum_clarity": table.c.sum_clarity + clarity,
+            "sum_feasibility": table.c.sum_feasibility + feasibility,
+            "sum_availability": table.c.sum_availability + availability,
+        },
+    )
+    db.execute(stmt)
+
+
+def review_added(db: Session, review):
+    apply_review_delta(db, review.course_id, 1, **snapshot_ratings(review))
+
+
+def review_removed(db: Session, review):
+    apply_review_delta(db, review.course_id, -1, **{k: -v for k, v in snapshot_ratings(review).items()})
+
+
+def review_changed(db: Session, course_id: int, old_ratings: dict, review):
+    new_ratings = snapshot_ratings(review)
+    apply_review_delta(db, course_id, 0, **{k: new_ratings[k] - old_ratings[k] for k in RATING_FIELDS})
+
+
+def reviews_of_student_removed(db: Session, student_id: int):
+    """Da chiamare prima di eliminare un utente: le sue recensioni spariscono in cascade."""
+    rows = (
+        db.query(
+            Review.course_id,
+            func.count(Review.id),
+            func.sum(Review.rating_clarity),
+            func.sum(Review.rating_feasibility),
+            func.sum(Review.rating_availability),
+        )
+        .filter(Review.student_id == student_id)
+        .group_by(Review.course_id)
+        .all()
+    )
+    for course_id, count, clarity, feasibility, availability in rows:
+        apply_review_delta(db, course_id, -count, -int(clarity), -int(feasibility), -int(availability))
+
+
+def get_course_rating_stats(db: Session, course_id: int) -> Optional[CourseRatingStats]:
+    return db.get(CourseRatingStats, course_id)
+
+
+def rebuild_course_rating_stats(db: Session, fix: bool = True) -> dict:
+    """
+    Ricalcola gli aggregati di tutti i corsi dalla tabella `reviews` e li
+    confronta con quelli salvati. Con `fix=True` corregge le differenze.
+    """
+    expected = {
+        course_id: (count, int(clarity), int(feasibility), int(availability))
+        for course_id, count, clarity, feasibility, availability in (
+            db.query(
+                Review.course_id,
+                func.count(Review.id),
+                func.sum(Review.rating_clarity),
+                func.sum(Review.rating_feasibility),
+                func.sum(Review.rating_availability),
+            )
+            .group_by(Review.course_id)
+            .all()
+        )
+    }
+    stored = {stats.course_id: stats for stats in db.query(CourseRatingStats).all()}
+
+    drift = []
+    for course_id in sorted(set(expected) | set(stored)):
+        stats = stored.get(course_id)
+        actual = (
+            (stats.review_count, stats.sum_clarity, stats.sum_feasibility, stats.sum_availability)
+            if stats else (0, 0, 0, 0)
+        )
+        wanted = expected.get(course_id, (0, 0, 0, 0))
+        if actual == wanted:
+            continue
+        drift.append({"course_id": course_id, "expected": list(wanted), "actual": list(actual)})
+        if fix:
+            if stats is None:
+                stats = CourseRatingStats(course_id=course_id)
+                db.add(stats)
+            stats.review_count, stats.sum_clarity, stats.sum_feasibility, stats.sum_availability = wanted
+
+    if fix:
+        db.commit()
+
+    return {
+        "courses_checked": len(set(expected) | set(stored)),
+        "drifted": len(drift),
+        "fixed": fix,
+        "drift": drift,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import models  # noqa: F401  (registra tutti i mapper)
+    from database.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Ricostruisce gli aggregati delle recensioni dei corsi")
+    parser.add_argument("--dry-run", action="store_true", help="riporta le differenze senza correggerle")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        print(json.dumps(rebuild_course_rating_stats(db, fix=not args.dry_run), indent=2))
+    finally:
+        db.close()
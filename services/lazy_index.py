@@ -0,0 +1,108 @@
+# services/lazy_index.py
+#
+# Base comune degli indici in memoria (spaziale, orario, ricerca, nomi dei
+# corsi). Il contenuto si costruisce con una query alla prima richiesta;
+# `invalidate()` dopo le scritture lo scarta e la richiesta successiva lo
+# ricostruisce.
+#
+# Invalidazione tra worker: `invalidate()` e `changed()` vengono pubblicati
+# sul canale "indexes" del broker (services/pubsub.py, PUBSUB_BACKEND=unix
+# con più worker) e gli altri processi scartano la propria copia. Un
+# aggiornamento in place resta locale: altrove diventa un'invalidazione.
+# `max_age` resta come rete di sicurezza per i messaggi persi.
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from services.pubsub import get_broker
+
+CHANNEL = "indexes"
+
+
+class LazyIndex:
+    """
+    Le sottoclassi implementano `_build(db)`, che restituisce il contenuto
+    dell'indice; `get(db)` lo costruisce se manca o è troppo vecchio.
+    `name` identifica l'indice nei messaggi tra worker.
+    """
+
+    def __init__(self, name: str, max_age: float):
+        self.name = name
+        self.max_age = max_age
+        self._data: Optional[Any] = None
+        self._built_at = 0.0
+        self._generation = 0
+        _indexes[name] = self
+
+    def invalidate(self):
+        """Scarta l'indice, in tutti i worker."""
+        self.apply_invalidate()
+        self._broadcast()
+
+    def changed(self):
+        """Da chiamare dopo un aggiornamento in place: una build in corso potrebbe non vederlo."""
+        self._generation += 1
+        self._broadcast()
+
+    def apply_invalidate(self):
+        self._generation += 1
+        self._data = None
+
+    def _broadcast(self):
+        get_broker().publish(CHANNEL, {"origin": os.getpid(), "index": self.name})
+
+    def ready(self) -> bool:
+        """True se l'indice può rispondere senza interrogare il database."""
+        return self._data is not None and time.monotonic() - self._built_at < self.max_age
+
+    def get(self, db: Session):
+        data = self._data
+        if data is not None and time.monotonic() - self._built_at < self.max_age:
+            return data
+
+        _listen()
+        # Niente lock attorno alla query: in modalità async girerebbe nell'event
+        # loop. Al peggio due richieste concorrenti ricostruiscono entrambe.
+        generation = self._generation
+        data = self._build(db)
+        self._store(data, generation)
+        return data
+
+    def _store(self, data, generation: int):
+        self._data = data
+        # Se è arrivata un'invalidazione durante la build, la prossima richiesta ricostruisce
+        self._built_at = time.monotonic() if generation == self._generation else float("-inf")
+
+    def _build(self, db: Session):
+        raise NotImplementedError
+
+
+# --- Invalidazione tra worker ---------------------------------------------
+
+_indexes: Dict[str, LazyIndex] = {}
+_listening = False
+_listen_lock = threading.Lock()
+
+
+def _on_message(message: dict):
+    if message.get("origin") == os.getpid():
+        return  # già applicata da chi l'ha pubblicata
+    index = _indexes.get(message.get("index"))
+    if index is not None:
+        index.apply_invalidate()
+
+
+def _listen():
+    # Alla prima build: un worker che non ha mai costruito un indice non ha
+    # nulla da invalidare (e non apre il socket del broker)
+    global _listening
+    if _listening:
+        return
+    with _listen_lock:
+        if not _listening:
+            get_broker().subscribe(CHANNEL, _on_message)
+            _listening = True
@@ -0,0 +1,134 @@
+# services/note_ratings.py
+#
+# Riepilogo per nota (numero di valutazioni, somma e istogramma 1-5)
+# mantenuto nella stessa transazione della scrittura su `note_ratings`.
+# Per ricostruirlo da zero (e vedere le differenze):
+#
+#   python -m services.note_ratings [--dry-run]
+
+import json
+from typing import Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from database.dialect import upsert_insert
+from models.note_rating_stats import NoteRatingStats
+from models.note_ratings import NoteRating
+
+STARS = range(1, 6)
+
+
+def apply_stats_delta(db: Session, note_id: int, count: int, total: int, histogram: dict):
+    """
+    Somma un delta al riepilogo della nota con un unico UPSERT atomico
+    (`histogram` = {voto: delta}). Non fa commit.
+    """
+    table = NoteRatingStats.__table__
+    values = {"note_id": note_id, "rating_count": count, "rating_sum": total}
+    values.update({f"count_{star}": histogram.get(star, 0) for star in STARS})
+
+    set_ = {
+        "rating_count": table.c.rating_count + count,
+        "rating_sum": table.c.rating_sum + total,
+    }
+    set_.update({f"count_{star}": table.c[f"count_{star}"] + delta for star, delta in histogram.items()})
+
+    stmt = upsert_insert(db, table).values(**values)
+    db.execute(stmt.on_conflict_do_update(index_elements=[table.c.note_id], set_=set_))
+
+
+def apply_rating_delta(db: Session, note_id: int, rating: int, sign: int):
+    """Aggiunge (sign=1) o toglie (sign=-1) una singola valutazione."""
+    apply_stats_delta(db, note_id, sign, sign * rating, {rating: sign})
+
+
+def rating_added(db: Session, rating: NoteRating):
+    apply_rating_delta(db, rating.note_id, int(rating.rating), 1)
+
+
+def rating_removed(db: Session, rating: NoteRating):
+    apply_rating_delta(db, rating.note_id, int(rating.rating), -1)
+
+
+def rating_changed(db: Session, note_id: int, old_rating: int, new_rating: int):
+    if old_rating == new_rating:
+        return
+    old_rating, new_rating = int(old_rating), int(new_rating)
+    apply_stats_delta(db, note_id, 0, new_rating - old_rating, {old_rating: -1, new_rating: 1})
+
+
+def _aggregates(query):
+    return query.with_entities(
+        NoteRating.note_id,
+        func.count(NoteRating.id),
+        func.sum(NoteRating.rating),
+        *[func.sum(case((NoteRating.rating == star, 1), else_=0)) for star in STARS],
+    ).group_by(NoteRating.note_id)
+
+
+def ratings_of_student_removed(db: Session, student_id: int):
+    """Da chiamare prima di eliminare un utente: le sue valutazioni spariscono in cascade."""
+    for note_id, count, total, *counts in _aggregates(db.query(NoteRating).filter(NoteRating.student_id == student_id)):
+        histogram = {star: -int(c) for star, c in zip(STARS, counts) if c}
+        apply_stats_delta(db, note_id, -int(count), -int(total), histogram)
+
+
+def get_note_rating_stats(db: Session, note_id: int) -> Optional[NoteRatingStats]:
+    return db.get(NoteRatingStats, note_id)
+
+
+def rebuild_note_rating_stats(db: Session, fix: bool = True) -> dict:
+    """
+    Ricalcola il riepilogo di tutte le note da `note_ratings` e lo confronta
+    con quello salvato. Con `fix=True` corregge le differenze.
+    """
+    columns = ["rating_count", "rating_sum"] + [f"count_{star}" for star in STARS]
+    expected = {
+        note_id: tuple(int(v) for v in values)
+        for note_id, *values in _aggregates(db.query(NoteRating))
+    }
+    stored = {stats.note_id: stats for stats in db.query(NoteRatingStats).all()}
+    empty = (0,) * len(columns)
+
+    drift = []
+    for note_id in sorted(set(expected) | set(stored)):
+        stats = stored.get(note_id)
+        actual = tuple(getattr(stats, c) for c in columns) if stats else empty
+        wanted = expected.get(note_id, empty)
+        if actual == wanted:
+            continue
+        drift.append({"note_id": note_id, "expected": list(wanted), "actual": list(actual)})
+        if fix:
+            if stats is None:
+                stats = NoteRatingStats(note_id=note_id)
+                db.add(stats)
+            for column, value in zip(columns, wanted):
+                setattr(stats, column, value)
+
+    if fix:
+        db.commit()
+
+    return {
+        "notes_checked": len(set(expected) | set(stored)),
+        "drifted": len(drift),
+        "fixed": fix,
+        "drift": drift,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import models  # noqa: F401  (registra tutti i mapper)
+    from database.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Ricostruisce il riepilogo delle valutazioni delle note")
+    parser.add_argument("--dry-run", action="store_true", help="riporta le differenze senza correggerle")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        print(json.dumps(rebuild_note_rating_stats(db, fix=not args.dry_run), indent=2))
+    finally:
+        db.close()
@@ -0,0 +1,124 @@
+# services/occupancy_stream.py
+#
+# Aggiornamenti in tempo reale dell'occupazione delle lezioni. Il check-in
+# pubblica la nuova occupazione sul canale "occupancy" del broker
+# (services/pubsub.py); `OccupancyHub` la riceve (anche dagli altri worker) e
+# la inoltra agli stream SSE iscritti a quella lezione.
+#
+# Coalescenza: gli aggiornamenti di una lezione si accumulano e vengono
+# consegnati al massimo una volta ogni OCCUPANCY_STREAM_INTERVAL_MS, con
+# l'ultimo valore; una raffica di check-in produce un solo messaggio.
+
+import asyncio
+import os
+import threading
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from services.pubsub import get_broker
+
+CHANNEL = "occupancy"
+OCCUPANCY_STREAM_INTERVAL_MS = int(os.getenv("OCCUPANCY_STREAM_INTERVAL_MS", "1000"))
+
+
+def publish_occupancy(lesson_id: int, day: date, occupancy: int):
+    """Pubblica la nuova occupazione di una lezione (chiamata dal check-in, da qualunque thread)."""
+    get_broker().publish(CHANNEL, {"lesson_id": lesson_id, "date": day.isoformat(), "occupancy": occupancy})
+
+
+def _newer(current: Optional[Tuple[str, int]], candidate: Tuple[str, int]) -> bool:
+    # Con più worker i messaggi possono arrivare fuori ordine: nello stesso
+    # giorno l'occupazione può solo crescere, quindi vince il valore più alto.
+    return current is None or candidate > current
+
+
+class Subscription:
+    """
+    Stato di uno stream: ultimo valore inviato e prossimo da inviare per ogni
+    lezione seguita. `initial` è lo stato già mandato al client (dal DB).
+    """
+
+    def __init__(self, lesson_ids: Iterable[int], initial: Optional[Dict[int, Tuple[str, int]]] = None):
+        self.lesson_ids = frozenset(lesson_ids)
+        self._sent: Dict[int, Tuple[str, int]] = dict(initial or {})
+        self._pending: Dict[int, Tuple[str, int]] = {}
+        self._event = asyncio.Event()
+
+    def offer(self, lesson_id: int, value: Tuple[str, int]):
+        if not _newer(self._sent.get(lesson_id), value):
+            return
+        self._sent[lesson_id] = value
+        self._pending[lesson_id] = value
+        self._event.set()
+
+    async def next_batch(self, timeout: float) -> Dict[int, Tuple[str, int]]:
+        """Aggiornamenti accumulati; dizionario vuoto se non arriva nulla entro `timeout`."""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        self._event.clear()
+        batch, self._pending = self._pending, {}
+        return batch
+
+
+class OccupancyHub:
+    """
+    Riceve gli aggiornamenti dal broker (in qualunque thread), tiene per ogni
+    lezione seguita l'ultimo valore e ogni `interval` secondi lo consegna
+    agli stream iscritti, dall'event loop.
+    """
+
+    def __init__(self, interval_ms: int = OCCUPANCY_STREAM_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self._subscribers: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._pending: Dict[int, Tuple[str, int]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._listening = False
+
+    def on_message(self, message: dict):
+        lesson_id = message["lesson_id"]
+        if lesson_id not in self._subscribers:
+            return
+        value = (message["date"], message["occupancy"])
+        with self._lock:
+            if _newer(self._pending.get(lesson_id), value):
+                self._pending[lesson_id] = value
+
+    def subscribe(self, lesson_ids: Iterable[int], initial: Optional[Dict[int, Tuple[str, int]]] = None) -> Subscription:
+        """Da chiamare nell'event loop che servirà lo stream."""
+        if not self._listening:
+            get_broker().subscribe(CHANNEL, self.on_message)
+            self._listening = True
+        subscription = Subscription(lesson_ids, initial)
+        for lesson_id in subscription.lesson_ids:
+            self._subscribers[lesson_id].add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._dispatch())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for lesson_id in subscription.lesson_ids:
+            subscribers = self._subscribers.get(lesson_id)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[lesson_id]
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for lesson_id, value in pending.items():
+            for subscription in self._subscribers.get(lesson_id, ()):
+                subscription.offer(lesson_id, value)
+
+    async def _dispatch(self):
+        while self._subscribers:
+            await asyncio.sleep(self.interval)
+            self._flush()
+
+
+hub = OccupancyHub()
@@ -0,0 +1,193 @@
+# services/pubsub.py
+#
+# Pub/sub minimale tra le parti dell'app (e tra i worker uvicorn). I
+# messaggi sono dizionari serializzabili in JSON, pubblicati su un canale;
+# gli handler registrati con `subscribe` vengono chiamati nel thread che
+# riceve il messaggio, quindi devono essere veloci e thread-safe.
+#
+# PUBSUB_BACKEND:
+#   - "memory" (default): consegna solo nel processo corrente;
+#   - "unix": in più ogni messaggio viene inviato come datagramma ai socket
+#     Unix degli altri worker della stessa macchina, in PUBSUB_SOCKET_DIR.
+#     Un worker apre il proprio socket solo quando qualcuno si iscrive.
+#
+# Un broker esterno (es. Redis) si aggiunge implementando `Broker.publish`
+# e chiamando `_deliver` per i messaggi ricevuti.
+
+import atexit
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory")
+PUBSUB_SOCKET_DIR = os.getenv("PUBSUB_SOCKET_DIR", os.path.join(tempfile.gettempdir(), "uniadvisor-pubsub"))
+# I datagrammi Unix hanno un limite di dimensione: i messaggi devono restare piccoli
+MAX_MESSAGE_BYTES = 16 * 1024
+# Ogni quanto rileggere la directory per scoprire worker nuovi o spariti (secondi)
+PEERS_REFRESH = 1.0
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], None]
+
+
+class Broker(ABC):
+    """Interfaccia comune dei broker: `publish` e `subscribe` per canale."""
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel: str, handler: Handler):
+        with self._lock:
+            self._handlers[channel].append(handler)
+
+    def unsubscribe(self, channel: str, handler: Handler):
+        with self._lock:
+            if handler in self._handlers.get(channel, ()):
+                self._handlers[channel].remove(handler)
+
+    @abstractmethod
+    def publish(self, channel: str, message: dict):
+        """Consegna `message` a tutti gli iscritti a `channel`."""
+
+    def _deliver(self, channel: str, message: dict):
+        with self._lock:
+            handlers = list(self._handlers.get(channel, ()))
+        for handler in handlers:
+            try:
+                handler(message)
+            except Exception:
+                logger.exception("Pub/sub handler failed", extra={"channel": channel})
+
+    def close(self):
+        pass
+
+
+class InMemoryBroker(Broker):
+    """Consegna sincrona agli iscritti dello stesso processo."""
+
+    def publish(self, channel: str, message: dict):
+        self._deliver(channel, message)
+
+
+class UnixDatagramBroker(Broker):
+    """
+    Broker tra i processi della stessa macchina: ogni worker iscritto ha un
+    socket Unix datagram `<pid>.sock` in `directory`; chi pubblica consegna
+    in locale e invia il messaggio a tutti gli altri socket. Consegna
+    best-effort: se il buffer di un worker è pieno il messaggio va perso.
+    """
+
+    def __init__(self, directory: str = PUBSUB_SOCKET_DIR):
+        super().__init__()
+        self.directory = directory
+        self._path = os.path.join(directory, f"{os.getpid()}.sock")
+        self._receiver = None
+        self._receiver_lock = threading.Lock()
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        self._peers: List[str] = []
+        self._peers_at = 0.0
+
+    def subscribe(self, channel: str, handler: Handler):
+        super().subscribe(channel, handler)
+        self._ensure_receiver()
+
+    def publish(self, channel: str, message: dict):
+        self._deliver(channel, message)
+        payload = json.dumps({"channel": channel, "message": message}, separators=(",", ":")).encode()
+        if len(payload) > MAX_MESSAGE_BYTES:
+            logger.warning("Pub/sub message too large, not sent to other workers", extra={"channel": channel})
+            return
+        for peer in self._current_peers():
+            try:
+                self._sender.sendto(payload, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Worker terminato senza ripulire: il socket è orfano
+                self._forget(peer)
+            except (BlockingIOError, OSError) as exc:
+                logger.debug("Pub/sub message dropped", extra={"peer": peer, "error": str(exc)})
+
+    def _current_peers(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._peers_at > PEERS_REFRESH:
+            try:
+                names = os.listdir(self.directory)
+            except FileNotFoundError:
+                names = []
+            self._peers = [
+                os.path.join(self.directory, name)
+                for name in names
+                if name.endswith(".sock") and os.path.join(self.directory, name) != self._path
+            ]
+            self._peers_at = now
+        return self._peers
+
+    def _forget(self, peer: str):
+        try:
+            os.unlink(peer)
+        except OSError:
+            pass
+        self._peers = [p for p in self._peers if p != peer]
+
+    def _ensure_receiver(self):
+        if self._receiver is not None:
+            return
+        with self._receiver_lock:
+            if self._receiver is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            if os.path.exists(self._path):
+                os.unlink(self._path)
+            receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            receiver.bind(self._path)
+            self._receiver = receiver
+            threading.Thread(target=self._receive, name="pubsub-receiver", daemon=True).start()
+            atexit.register(self.close)
+
+    def _receive(self):
+        while True:
+            try:
+                payload = self._receiver.recv(MAX_MESSAGE_BYTES)
+            except OSError:
+                return  # socket chiuso
+            try:
+                data = json.loads(payload)
+                self._deliver(data["channel"], data["message"])
+            except (ValueError, KeyError, TypeError):
+                logger.warning("Malformed pub/sub message ignored")
+
+    def close(self):
+        if self._receiver is not None:
+            self._receiver.close()
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> Broker:
+    """Broker del processo, scelto con PUBSUB_BACKEND."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                if PUBSUB_BACKEND == "unix":
+                    _broker = UnixDatagramBroker()
+                elif PUBSUB_BACKEND == "memory":
+                    _broker = InMemoryBroker()
+                else:
+                    raise ValueError(f"Unknown PUBSUB_BACKEND: {PUBSUB_BACKEND}")
+    return _broker
@@ -0,0 +1,386 @@
+# services/search_index.py
+#
+# Ricerca testuale su corsi (nome), professori (nome) e appunti
+# (descrizione), per la ricerca "mentre si scrive".
+#
+# SEARCH_BACKEND:
+#   - "memory" (default): indice invertito in memoria. Ogni parola della
+#     query può corrispondere esattamente, come prefisso (Anal -> Analisi) o
+#     con un errore di battitura (analsi -> analisi, parole di almeno
+#     SEARCH_FUZZY_MIN_LENGTH lettere). Accenti e maiuscole sono ignorati.
+#     Corsi e professori: ricostruzione lazy dopo `invalidate()`; appunti:
+#     aggiornamento incrementale con `note_changed` / `note_removed`.
+#   - "postgres": full-text di PostgreSQL (configurazione 'simple', prefissi
+#     con `parola:*`), con gli indici GIN:
+#       CREATE INDEX ix_courses_name_fts ON courses USING gin (to_tsvector('simple', name));
+#       CREATE INDEX ix_teachers_name_fts ON teachers USING gin (to_tsvector('simple', name));
+#       CREATE INDEX ix_notes_description_fts ON notes USING gin (to_tsvector('simple', coalesce(description, '')));
+#     Con SEARCH_TRIGRAM=true anche la similarità a trigrammi (errori di
+#     battitura), con l'estensione pg_trgm:
+#       CREATE EXTENSION IF NOT EXISTS pg_trgm;
+#       CREATE INDEX ix_courses_name_trgm ON courses USING gin (name gin_trgm_ops);
+#       CREATE INDEX ix_teachers_name_trgm ON teachers USING gin (name gin_trgm_ops);
+#       CREATE INDEX ix_notes_description_trgm ON notes USING gin (description gin_trgm_ops);
+#
+# Punteggio: per ogni parola della query la migliore corrispondenza nel
+# documento (esatta 1, prefisso 0.5-1 secondo quanto manca, errore 0.6)
+# pesata con l'IDF del termine; tutte le parole devono corrispondere. Il
+# totale è normalizzato sulla lunghezza del testo, moltiplicato per il peso
+# del tipo (corsi > professori > appunti) e aumentato se il testo inizia
+# con la query.
+
+import heapq
+import math
+import os
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session, joinedload
+
+from models.course import Course
+from models.note import Note
+from models.teacher import Teacher
+from services.lazy_index import LazyIndex
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "memory")
+SEARCH_TRIGRAM = os.getenv("SEARCH_TRIGRAM", "false").lower() == "true"
+# Età massima dell'indice, se un'invalidazione da un altro worker va persa
+SEARCH_INDEX_MAX_AGE = int(os.getenv("SEARCH_INDEX_MAX_AGE", "300"))
+# Parole più corte non vengono cercate con errori di battitura
+SEARCH_FUZZY_MIN_LENGTH = int(os.getenv("SEARCH_FUZZY_MIN_LENGTH", "4"))
+# Termini al massimo considerati per un prefisso (es. "a" su un vocabolario grande)
+SEARCH_MAX_EXPANSIONS = int(os.getenv("SEARCH_MAX_EXPANSIONS", "200"))
+
+KINDS = ("course", "teacher", "note")
+KIND_WEIGHTS = {"course": 3.0, "teacher": 2.0, "note": 1.0}
+EXACT, FUZZY = 1.0, 0.6
+# Peso della lunghezza del testo nel punteggio (come b in BM25)
+LENGTH_NORM = 0.5
+STARTS_WITH_BONUS = 0.5
+TITLE_LENGTH = 120
+
+_WORD = re.compile(r"[^\W_]+")
+
+DocKey = Tuple[str, int]
+
+
+def normalize(text: str) -> str:
+    """Minuscole e niente accenti: "Università" -> "universita"."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _WORD.findall(normalize(text)) if text else []
+
+
+def _deletes(term: str) -> Set[str]:
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """Distanza di Damerau (OSA) <= 1: una sostituzione, inserzione, cancellazione o scambio."""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diff = [i for i in range(la) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+    if la > lb:
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+class InvertedIndex:
+    """
+    Indice invertito termine -> documenti, con il vocabolario ordinato per
+    i prefissi (bisezione) e le cancellazioni di un carattere di ogni
+    termine per gli errori di battitura (schema "symmetric delete": due
+    parole a distanza 1 hanno sempre una cancellazione in comune).
+    Thread-safe; `add` e `remove` aggiornano l'indice in place.
+    """
+
+    def __init__(self, documents: Iterable[Tuple[DocKey, str, dict]] = ()):
+        # chiave -> (termini, testo normalizzato, payload)
+        self._docs: Dict[DocKey, Tuple[Tuple[str, ...], str, dict]] = {}
+        self._postings: Dict[str, Set[DocKey]] = {}
+        self._vocabulary: List[str] = []
+        self._variants: Dict[str, Set[str]] = defaultdict(set)
+        self._total_length = 0
+        self._lock = threading.RLock()
+        for key, text, payload in documents:
+            self._add(key, text, payload, keep_sorted=False)
+        self._vocabulary.sort()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _add(self, key: DocKey, text: str, payload: dict, keep_sorted: bool):
+        terms = tuple(tokenize(text))
+        if not terms:
+            return
+        self._docs[key] = (terms, " ".join(terms), payload)
+        self._total_length += len(terms)
+        for term in set(terms):
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = set()
+                if keep_sorted:
+                    insort(self._vocabulary, term)
+                else:
+                    self._vocabulary.append(term)
+                self._variants[term].add(term)
+                for variant in _deletes(term):
+                    self._variants[variant].add(term)
+            postings.add(key)
+
+    def _remove(self, key: DocKey):
+        entry = self._docs.pop(key, None)
+        if entry is None:
+            return
+        terms = entry[0]
+        self._total_length -= len(terms)
+        for term in set(terms):
+            postings = self._postings[term]
+            postings.discard(key)
+            if postings:
+                continue
+            del self._postings[term]
+            del self._vocabulary[bisect_left(self._vocabulary, term)]
+            for variant in _deletes(term) | {term}:
+                self._variants[variant].discard(term)
+                if not self._variants[variant]:
+                    del self._variants[variant]
+
+    def add(self, key: DocKey, text: Optional[str], payload: dict):
+        """Aggiunge (o sostituisce) un documento."""
+        with self._lock:
+            self._remove(key)
+            if text:
+                self._add(key, text, payload, keep_sorted=True)
+
+    def remove(self, key: DocKey):
+        with self._lock:
+            self._remove(key)
+
+    def _expand(self, token: str, prefix: bool) -> Dict[str, float]:
+        """Termini del vocabolario che corrispondono a `token`, con la qualità della corrispondenza."""
+        matches: Dict[str, float] = {}
+        if prefix:
+            start = bisect_left(self._vocabulary, token)
+            for term in self._vocabulary[start:start + SEARCH_MAX_EXPANSIONS]:
+                if not term.startswith(token):
+                    break
+                matches[term] = 0.5 + 0.5 * len(token) / len(term)
+        elif token in self._postings:
+            matches[token] = EXACT
+        if len(token) >= SEARCH_FUZZY_MIN_LENGTH:
+            candidates = set(self._variants.get(token, ()))
+            for variant in _deletes(token):
+                candidates.update(self._variants.get(variant, ()))
+            for term in candidates:
+                if term not in matches and _within_one_edit(token, term):
+                    matches[term] = FUZZY
+        return matches
+
+    def search(self, query: str, limit: int,
+               predicate: Optional[Callable[[DocKey, dict], bool]] = None) -> List[Tuple[float, dict]]:
+        """
+        Documenti che contengono tutte le parole di `query` (l'ultima anche
+        come prefisso, o tutte se la query finisce senza spazio), ordinati
+        per punteggio decrescente; coppie (punteggio, payload).
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        typing_last = not query[-1:].isspace()
+        with self._lock:
+            total = len(self._docs)
+            if not total:
+                return []
+            average_length = self._total_length / total
+
+            # Per ogni parola: termini corrispondenti come (qualità * IDF, documenti)
+            expansions = []
+            for position, token in enumerate(tokens):
+                prefix = typing_last or position < len(tokens) - 1
+                terms = [
+                    (quality * math.log(1 + total / len(self._postings[term])), self._postings[term])
+                    for term, quality in self._expand(token, prefix).items()
+                ]
+                if not terms:
+                    return []
+                expansions.append(terms)
+
+            # Candidati dalla parola più selettiva, poi intersezione (tra set,
+            # quindi in C) con le altre: le parole comuni non vengono scorse
+            expansions.sort(key=lambda terms: sum(len(postings) for _, postings in terms))
+            scores: Dict[DocKey, float] = {}
+            for value, postings in expansions[0]:
+                for key in postings:
+                    if value > scores.get(key, 0.0):
+                        scores[key] = value
+            for terms in expansions[1:]:
+                candidates = set(scores)
+                best: Dict[DocKey, float] = {}
+                for value, postings in terms:
+                    for key in postings & candidates:
+                        if value > best.get(key, 0.0):
+                            best[key] = value
+                if not best:
+                    return []
+                scores = {key: scores[key] + value for key, value in best.items()}
+
+            phrase = " ".join(tokens)
+            scored = []
+            for key, score in scores.items():
+                terms, text, payload = self._docs[key]
+                if predicate is not None and not predicate(key, payload):
+                    continue
+                score /= 1 - LENGTH_NORM + LENGTH_NORM * len(terms) / average_length
+                score *= KIND_WEIGHTS[key[0]]
+                if text.startswith(phrase):
+                    score *= 1 + STARTS_WITH_BONUS
+                scored.append((score, key, payload))
+        top = heapq.nsmallest(limit, scored, key=lambda item: (-item[0], KINDS.index(item[1][0]), item[1][1]))
+        return [(score, payload) for score, _, payload in top]
+
+
+def _course_doc(course: Course) -> Tuple[DocKey, str, dict]:
+    return ("course", course.id), course.name, {
+        "type": "course",
+        "id": course.id,
+        "title": course.name,
+        "course_id": course.id,
+        "course_name": course.name,
+        "faculty_id": course.faculty_id,
+        "teacher_name": course.teacher.name if course.teacher else None,
+    }
+
+
+def _teacher_doc(teacher: Teacher) -> Tuple[DocKey, str, dict]:
+    return ("teacher", teacher.id), teacher.name, {
+        "type": "teacher",
+        "id": teacher.id,
+        "title": teacher.name,
+        "teacher_name": teacher.name,
+        # Facoltà in cui insegna, per il filtro faculty_id
+        "faculty_ids": sorted({course.faculty_id for course in teacher.courses}),
+    }
+
+
+def _note_doc(note: Note) -> Tuple[DocKey, str, dict]:
+    course = note.course
+    description = note.description or ""
+    return ("note", note.id), description, {
+        "type": "note",
+        "id": note.id,
+        "title": description if len(description) <= TITLE_LENGTH else description[:TITLE_LENGTH - 1] + "…",
+        "course_id": note.course_id,
+        "course_name": course.name if course else None,
+        "faculty_id": course.faculty_id if course else None,
+    }
+
+
+def _matches_faculty(payload: dict, faculty_id: int) -> bool:
+    if payload["type"] == "teacher":
+        return faculty_id in payload["faculty_ids"]
+    return payload.get("faculty_id") == faculty_id
+
+
+class SearchIndex(LazyIndex):
+    """
+    Indice di ricerca ricostruito in modo lazy (vedi services/lazy_index.py):
+    `invalidate()` dopo le scritture su corsi e professori, la ricostruzione
+    avviene alla prima ricerca successiva (o comunque dopo SEARCH_INDEX_MAX_AGE
+    secondi). Gli appunti, scritti spesso, si aggiornano in place.
+    """
+
+    def __init__(self):
+        super().__init__("search", SEARCH_INDEX_MAX_AGE)
+
+    def _build(self, db: Session) -> InvertedIndex:
+        documents = [_course_doc(c) for c in db.query(Course).options(joinedload(Course.teacher)).all()]
+        documents += [_teacher_doc(t) for t in db.query(Teacher).options(joinedload(Teacher.courses)).all()]
+        documents += [
+            _note_doc(n)
+            for n in db.query(Note).options(joinedload(Note.course)).filter(Note.description.isnot(None)).all()
+        ]
+        return InvertedIndex(documents)
+
+    def note_changed(self, note: Note):
+        """Da chiamare dopo il commit di un appunto nuovo o modificato."""
+        index = self._data
+        self.changed()
+        if index is not None:
+            index.add(*_note_doc(note))
+
+    def note_removed(self, note_id: int):
+        index = self._data
+        self.changed()
+        if index is not None:
+            index.remove(("note", note_id))
+
+    def search(self, db: Session, query: str, kinds: Sequence[str] = KINDS,
+               faculty_id: Optional[int] = None, limit: int = 20) -> List[Tuple[float, dict]]:
+        """Risultati (punteggio, payload) ordinati per rilevanza."""
+        kinds = tuple(kind for kind in KINDS if kind in kinds)
+        if SEARCH_BACKEND == "postgres":
+            return self._search_postgres(db, query, kinds, faculty_id, limit)
+
+        def predicate(key: DocKey, payload: dict) -> bool:
+            return key[0] in kinds and (faculty_id is None or _matches_faculty(payload, faculty_id))
+
+        return self.get(db).search(query, limit, predicate)
+
+    def _search_postgres(self, db: Session, query: str, kinds: Tuple[str, ...],
+                         faculty_id: Optional[int], limit: int) -> List[Tuple[float, dict]]:
+        # Gli accenti restano (niente estensione unaccent): solo minuscole
+        tokens = _WORD.findall(query.casefold())
+        if not tokens:
+            return []
+        tsquery = func.to_tsquery("simple", " & ".join(f"{token}:*" for token in tokens))
+        text = " ".join(tokens)
+        found = []
+        for kind in kinds:
+            if kind == "course":
+                column, q = Course.name, db.query(Course).options(joinedload(Course.teacher))
+                if faculty_id is not None:
+                    q = q.filter(Course.faculty_id == faculty_id)
+                to_doc = _course_doc
+            elif kind == "teacher":
+                column, q = Teacher.name, db.query(Teacher).options(joinedload(Teacher.courses))
+                if faculty_id is not None:
+                    q = q.filter(Teacher.courses.any(Course.faculty_id == faculty_id))
+                to_doc = _teacher_doc
+            else:
+                column, q = Note.description, db.query(Note).options(joinedload(Note.course))
+                if faculty_id is not None:
+                    q = q.filter(Note.course.has(Course.faculty_id == faculty_id))
+                to_doc = _note_doc
+            vector = func.to_tsvector("simple", func.coalesce(column, ""))
+            condition = vector.op("@@")(tsquery)
+            rank = func.ts_rank(vector, tsquery)
+            if SEARCH_TRIGRAM:
+                condition = or_(condition, column.op("%")(text))
+                rank = func.greatest(rank, func.similarity(column, text))
+            rows = q.add_columns(rank.label("rank")).filter(condition).order_by(rank.desc()).limit(limit).all()
+            found += [(float(rank_value) * KIND_WEIGHTS[kind], to_doc(row)[2]) for row, rank_value in rows]
+        found.sort(key=lambda item: (-item[0], KINDS.index(item[1]["type"]), item[1]["id"]))
+        return found[:limit]
+
+
+# Da invalidare dopo ogni scrittura su corsi e professori
+search_index = SearchIndex()
@@ -0,0 +1,197 @@
+# services/spatial_index.py
+
+import math
+import os
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, literal
+from sqlalchemy.orm import Session, joinedload
+
+from models.course import Course
+from models.faculty import Faculty
+from services.lazy_index import LazyIndex
+from utils.geo import haversine_many
+
+METERS_PER_DEGREE = 111320
+
+# "memory" (default): griglia in memoria ricostruita dopo le scritture.
+# "earthdistance": query su PostgreSQL con le estensioni cube + earthdistance,
+# idealmente con un indice GiST:
+#   CREATE INDEX ix_courses_earth ON courses USING gist (ll_to_earth(latitude, longitude));
+#   CREATE INDEX ix_faculties_earth ON faculties USING gist (ll_to_earth(latitude, longitude));
+LOCATION_INDEX_BACKEND = os.getenv("LOCATION_INDEX_BACKEND", "memory")
+# Lato della cella della griglia, in metri
+LOCATION_INDEX_CELL_METERS = float(os.getenv("LOCATION_INDEX_CELL_METERS", "250"))
+# Età massima dell'indice, se un'invalidazione da un altro worker va persa
+LOCATION_INDEX_MAX_AGE = int(os.getenv("LOCATION_INDEX_MAX_AGE", "300"))
+
+
+class GridIndex:
+    """
+    Griglia regolare lat/lon: ogni punto finisce in una cella di circa
+    `cell_meters` di lato, e una ricerca per raggio visita solo le celle
+    che intersecano il bounding box del cerchio. Le coordinate di ogni cella
+    sono array NumPy, così le distanze si calcolano in un'unica chiamata.
+    """
+
+    def __init__(self, points: List[Tuple[float, float, dict]], cell_meters: float = LOCATION_INDEX_CELL_METERS):
+        self.size = len(points)
+        self.cell_lat = cell_meters / METERS_PER_DEGREE
+        mean_lat = sum(p[0] for p in points) / len(points) if points else 0.0
+        self.cell_lon = self.cell_lat / max(math.cos(math.radians(mean_lat)), 0.01)
+
+        grouped = defaultdict(list)
+        for point in points:
+            grouped[self._cell(point[0], point[1])].append(point)
+        self.cells: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray, List[dict]]] = {
+            cell: (
+                np.array([p[0] for p in cell_points], dtype=np.float64),
+                np.array([p[1] for p in cell_points], dtype=np.float64),
+                [p[2] for p in cell_points],
+            )
+            for cell, cell_points in grouped.items()
+        }
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_lat), math.floor(lon / self.cell_lon)
+
+    def _candidate_cells(self, lat: float, lon: float, radius_m: float):
+        dlat = radius_m / METERS_PER_DEGREE
+        dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+        lat_min, lon_min = self._cell(lat - dlat, lon - dlon)
+        lat_max, lon_max = self._cell(lat + dlat, lon + dlon)
+        box_cells = (lat_max - lat_min + 1) * (lon_max - lon_min + 1)
+        if box_cells >= len(self.cells):
+            # Raggio più grande dell'intera area indicizzata: basta scorrere le celle piene
+            return [
+                cell for (i, j), cell in self.cells.items()
+                if lat_min <= i <= lat_max and lon_min <= j <= lon_max
+            ]
+        return [
+            self.cells[(i, j)]
+            for i in range(lat_min, lat_max + 1)
+            for j in range(lon_min, lon_max + 1)
+            if (i, j) in self.cells
+        ]
+
+    def within(self, lat: float, lon: float, radius_m: float,
+               predicate: Optional[Callable[[dict], bool]] = None) -> List[Tuple[float, dict]]:
+        """Punti entro `radius_m` metri, ordinati per distanza crescente."""
+        cells = self._candidate_cells(lat, lon, radius_m)
+        if not cells:
+            return []
+        lats = np.concatenate([cell[0] for cell in cells])
+        lons = np.concatenate([cell[1] for cell in cells])
+        payloads = [payload for cell in cells for payload in cell[2]]
+
+        distances = haversine_many(lat, lon, lats, lons)
+        inside = np.flatnonzero(distances <= radius_m)
+        inside = inside[np.argsort(distances[inside], kind="stable")]
+        found = [(float(distances[i]), payloads[i]) for i in inside]
+        if predicate is not None:
+            found = [item for item in found if predicate(item[1])]
+        return found
+
+    def nearest(self, lat: float, lon: float, k: int, max_radius_m: float,
+                predicate: Optional[Callable[[dict], bool]] = None) -> List[Tuple[float, dict]]:
+        """
+        I `k` punti più vicini entro `max_radius_m`. Il raggio di ricerca parte
+        da una cella e raddoppia finché non contiene almeno k punti.
+        """
+        radius = min(self.cell_lat * METERS_PER_DEGREE, max_radius_m)
+        while True:
+            found = self.within(lat, lon, radius, predicate)
+            if len(found) >= k or radius >= max_radius_m:
+                return found[:k]
+            radius = min(radius * 2, max_radius_m)
+
+
+class LocationIndex(LazyIndex):
+    """
+    Indice spaziale ricostruito in modo lazy (vedi services/lazy_index.py):
+    `invalidate()` dopo le scritture sulla tabella, la ricostruzione avviene
+    alla prima ricerca successiva (o comunque dopo LOCATION_INDEX_MAX_AGE secondi).
+    """
+
+    def __init__(self, model, to_payload: Callable[[object], dict], query_options=()):
+        super().__init__(f"location:{model.__tablename__}", LOCATION_INDEX_MAX_AGE)
+        self.model = model
+        self.to_payload = to_payload
+        self.query_options = query_options
+
+    def _build(self, db: Session) -> GridIndex:
+        rows = (
+            db.query(self.model)
+            .options(*self.query_options)
+            .filter(self.model.latitude.isnot(None), self.model.longitude.isnot(None))
+            .all()
+        )
+        return GridIndex([(row.latitude, row.longitude, self.to_payload(row)) for row in rows])
+
+    def search(self, db: Session, latitude: float, longitude: float, radius_m: float,
+               k: Optional[int] = None, limit: Optional[int] = None,
+               predicate: Optional[Callable[[dict], bool]] = None) -> List[Tuple[float, dict]]:
+        """
+        Ricerca per raggio (o k-nearest se `k` è indicato), ordinata per distanza.
+        Restituisce coppie (distanza in metri, payload).
+        """
+        if LOCATION_INDEX_BACKEND == "earthdistance":
+            found = self._search_earthdistance(db, latitude, longitude, radius_m, k or limit, predicate)
+        elif k is not None:
+            found = self.get(db).nearest(latitude, longitude, k, radius_m, predicate)
+        else:
+            found = self.get(db).within(latitude, longitude, radius_m, predicate)
+        return found[:limit] if limit is not None else found
+
+    def _search_earthdistance(self, db: Session, latitude: float, longitude: float, radius_m: float,
+                              limit: Optional[int], predicate: Optional[Callable[[dict], bool]]):
+        origin = func.ll_to_earth(literal(latitude), literal(longitude))
+        point = func.ll_to_earth(self.model.latitude, self.model.longitude)
+        distance = func.earth_distance(origin, point)
+        query = (
+            db.query(self.model, distance.label("distance"))
+            .options(*self.query_options)
+            .filter(self.model.latitude.isnot(None), self.model.longitude.isnot(None))
+            .filter(func.earth_box(origin, radius_m).op("@>")(point))
+            .filter(distance <= radius_m)
+            .order_by(distance)
+        )
+        # Il predicate è applicato in Python: il LIMIT in SQL è sicuro solo senza filtri
+        if limit is not None and predicate is None:
+            query = query.limit(limit)
+        found = [(float(dist), self.to_payload(row)) for row, dist in query.all()]
+        if predicate is not None:
+            found = [item for item in found if predicate(item[1])]
+        return found
+
+
+def _course_payload(course: Course) -> dict:
+    return {
+        "id": course.id,
+        "name": course.name,
+        "faculty_id": course.faculty_id,
+        "room_number": course.room_number,
+        "building_name": course.building_name,
+        "latitude": course.latitude,
+        "longitude": course.longitude,
+        "floor": course.floor,
+        "teacher_name": course.teacher_name,
+    }
+
+
+def _faculty_payload(faculty: Faculty) -> dict:
+    return {
+        "id": faculty.id,
+        "name": faculty.name,
+        "latitude": faculty.latitude,
+        "longitude": faculty.longitude,
+        "address": faculty.address,
+        "building_name": faculty.building_name,
+    }
+
+
+# Da invalidare dopo ogni scrittura su corsi (o professori) e facoltà
+course_index = LocationIndex(Course, _course_payload, (joinedload(Course.teacher),))
+faculty_index = LocationIndex(Faculty, _faculty_payload)
@@ -0,0 +1,358 @@
+# services/timetable_import.py
+#
+# Import massivo dell'orario: corsi (aula, edificio, piano, coordinate,
+# professore) e lezioni settimanali da CSV, NDJSON o array JSON, una riga
+# per lezione (TimetableRow in schemas/timetable.py). Tutto in un'unica
+# transazione, con statement a blocchi:
+#   - corsi: INSERT ... ON CONFLICT (name) DO UPDATE multiplo; i campi
+#     vuoti nel file non sovrascrivono quelli già presenti;
+#   - professori mancanti: INSERT ... ON CONFLICT DO NOTHING;
+#   - lezioni, identificate da (corso, giorno, ora di inizio): INSERT e
+#     UPDATE per chiave primaria in executemany; con `replace_lessons` le
+#     lezioni dei corsi importati che non compaiono nel file vengono eliminate.
+#
+# Gli errori di validazione sono riportati per riga. Di default basta un
+# errore per non scrivere nulla; con `skip_invalid` si importano le righe
+# valide (un corso con errori esclude tutte le sue righe).
+#
+#   python -m services.timetable_import orario.csv [--format csv|ndjson|json]
+#                                      [--dry-run] [--skip-invalid] [--replace-lessons]
+
+import csv
+import io
+import json
+import logging
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import delete, func, update
+from sqlalchemy.orm import Session
+
+from database.dialect import upsert_insert
+from models.course import Course
+from models.faculty import Faculty
+from models.lesson import Lesson
+from models.lesson_checkin import LessonCheckin
+from models.teacher import Teacher
+from schemas.timetable import TimetableRow
+from utils.timetable import parse_weekday
+
+FORMATS = ("csv", "ndjson", "json")
+# Righe per statement (8 parametri a riga per i corsi)
+BATCH_SIZE = 500
+# Errori riportati per esteso; gli altri sono solo contati
+MAX_REPORTED_ERRORS = 1000
+
+COURSE_FIELDS = ("faculty_id", "teacher_id", "room_number", "building_name", "latitude", "longitude", "floor")
+
+logger = logging.getLogger(__name__)
+
+
+class TimetableFormatError(ValueError):
+    """Il file non è leggibile nel formato indicato (errore globale, non di riga)."""
+
+
+def read_rows(stream: BinaryIO, fmt: str) -> Iterator[Tuple[int, object]]:
+    """
+    Record grezzi del file, numerati da 1. Il CSV e l'NDJSON sono letti riga
+    per riga; una riga NDJSON non valida diventa un record ValueError, così
+    l'errore è riportato con il suo numero come gli altri.
+    """
+    if fmt not in FORMATS:
+        raise TimetableFormatError(f"Unknown format '{fmt}', expected one of {', '.join(FORMATS)}")
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            reader = csv.DictReader(text)
+            if reader.fieldnames is None or "course_name" not in reader.fieldnames:
+                raise TimetableFormatError("CSV header must include a 'course_name' column")
+            yield from enumerate(reader, start=1)
+        elif fmt == "ndjson":
+            number = 0
+            for line in text:
+                if not line.strip():
+                    continue
+                number += 1
+                try:
+                    yield number, json.loads(line)
+                except ValueError as exc:
+                    yield number, ValueError(f"invalid JSON: {exc}")
+        else:
+            try:
+                data = json.load(text)
+            except ValueError as exc:
+                raise TimetableFormatError(f"Invalid JSON: {exc}")
+            if isinstance(data, dict):
+                data = data.get("rows")
+            if not isinstance(data, list):
+                raise TimetableFormatError("JSON body must be an array of rows (or {\"rows\": [...]})")
+            yield from enumerate(data, start=1)
+    except UnicodeDecodeError as exc:
+        raise TimetableFormatError(f"File is not valid UTF-8: {exc}")
+    finally:
+        text.detach()
+
+
+def _validation_messages(exc: ValidationError) -> List[str]:
+    messages = []
+    for error in exc.errors():
+        location = ".".join(str(part) for part in error["loc"])
+        message = error["msg"].removeprefix("Value error, ")
+        messages.append(f"{location}: {message}" if location else message)
+    return messages
+
+
+class _Report:
+    def __init__(self):
+        self.counts = dict.fromkeys((
+            "teachers_created", "courses_created", "courses_updated",
+            "lessons_created", "lessons_updated", "lessons_unchanged", "lessons_deleted",
+        ), 0)
+        self.errors: List[dict] = []
+        self.invalid_rows = set()
+
+    def error(self, row: int, course_name: Optional[str], *messages: str):
+        self.invalid_rows.add(row)
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "course_name": course_name, "errors": list(messages)})
+
+
+def _chunks(items: list, size: int = BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _existing_by_name(db: Session, column, names, *columns):
+    found = {}
+    for chunk in _chunks(sorted(names)):
+        for row in db.query(column, *columns).filter(column.in_(chunk)):
+            found[row[0]] = row
+    return found
+
+
+def import_timetable(db: Session, records: Iterable[Tuple[int, object]], dry_run: bool = False,
+                     skip_invalid: bool = False, replace_lessons: bool = False) -> dict:
+    """
+    Valida e importa i record di `read_rows` in una sola transazione (commit
+    solo se non è un dry run e, senza `skip_invalid`, se non ci sono errori).
+    Restituisce il resoconto (TimetableImportReport).
+    """
+    report = _Report()
+
+    # 1. Validazione riga per riga (nessun accesso al DB)
+    rows: List[Tuple[int, TimetableRow]] = []
+    lesson_keys: Dict[Tuple[str, int, object], int] = {}
+    rows_read = 0
+    for number, record in records:
+        rows_read += 1
+        if isinstance(record, Exception):
+            report.error(number, None, str(record))
+            continue
+        if not isinstance(record, dict):
+            report.error(number, None, "row must be an object")
+            continue
+        try:
+            row = TimetableRow.model_validate(record)
+        except ValidationError as exc:
+            report.error(number, record.get("course_name"), *_validation_messages(exc))
+            continue
+        if row.has_lesson:
+            key = (row.course_name, parse_weekday(row.day_of_week), row.start_time)
+            if key in lesson_keys:
+                report.error(number, row.course_name, f"duplicate lesson (same course, day and start time as row {lesson_keys[key]})")
+                continue
+            lesson_keys[key] = number
+        rows.append((number, row))
+
+    # 2. Risoluzione di facoltà, professori e corsi esistenti
+    faculty_names = {row.faculty_name for _, row in rows if row.faculty_name}
+    faculty_ids = {row.faculty_id for _, row in rows if row.faculty_id is not None}
+    faculties_by_name = {name: r.id for name, r in _existing_by_name(db, Faculty.name, faculty_names, Faculty.id).items()}
+    known_faculty_ids = set(_existing_by_name(db, Faculty.id, faculty_ids))
+    existing_courses = _existing_by_name(db, Course.name, {row.course_name for _, row in rows}, Course.id, Course.faculty_id)
+
+    courses: Dict[str, dict] = {}
+    course_rows: Dict[str, List[int]] = {}
+    bad_courses = set()
+    for number, row in rows:
+        faculty_id = row.faculty_id
+        if faculty_id is not None and faculty_id not in known_faculty_ids:
+            report.error(number, row.course_name, f"faculty_id: unknown faculty {faculty_id}")
+            bad_courses.add(row.course_name)
+            continue
+        if row.faculty_name:
+            by_name = faculties_by_name.get(row.faculty_name)
+            if by_name is None:
+                report.error(number, row.course_name, f"faculty_name: unknown faculty '{row.faculty_name}'")
+                bad_courses.add(row.course_name)
+                continue
+            if faculty_id is not None and faculty_id != by_name:
+                report.error(number, row.course_name, "faculty_id and faculty_name refer to different faculties")
+                bad_courses.add(row.course_name)
+                continue
+            faculty_id = by_name
+
+        # Righe diverse dello stesso corso: i valori non vuoti più recenti vincono
+        course = courses.setdefault(row.course_name, dict.fromkeys(COURSE_FIELDS))
+        course_rows.setdefault(row.course_name, []).append(number)
+        values = {
+            "faculty_id": faculty_id, "teacher_name": row.teacher_name,
+            "room_number": row.room_number, "building_name": row.building_name,
+            "latitude": row.latitude, "longitude": row.longitude, "floor": row.floor,
+        }
+        course.update({k: v for k, v in values.items() if v is not None})
+
+    for name, course in courses.items():
+        existing = existing_courses.get(name)
+        if course["faculty_id"] is None:
+            if existing is None:
+                report.error(course_rows[name][0], name, "new course needs faculty_id or faculty_name")
+                bad_courses.add(name)
+                continue
+            course["faculty_id"] = existing.faculty_id
+
+    if bad_courses:
+        # Un corso con errori esclude tutte le sue righe
+        for number, row in rows:
+            if row.course_name in bad_courses and number not in report.invalid_rows:
+                report.error(number, row.course_name, "course has errors in another row")
+        rows = [(number, row) for number, row in rows if row.course_name not in bad_courses]
+        for name in bad_courses:
+            courses.pop(name, None)
+
+    result = {
+        "rows_read": rows_read,
+        "rows_invalid": len(report.invalid_rows),
+        "committed": False,
+        "dry_run": dry_run,
+    }
+    if report.invalid_rows and not skip_invalid:
+        db.rollback()
+        return {**result, **report.counts, "errors": report.errors}
+
+    try:
+        _write(db, rows, courses, existing_courses, replace_lessons, report)
+        if dry_run:
+            db.rollback()
+        else:
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    logger.info("Timetable import", extra={"rows": rows_read, "dry_run": dry_run, **report.counts})
+    return {**result, "committed": not dry_run, **report.counts, "errors": report.errors}
+
+
+def _write(db: Session, rows, courses: Dict[str, dict], existing_courses, replace_lessons: bool, report: _Report):
+    # Professori: quelli mancanti vengono creati
+    teacher_names = {c["teacher_name"] for c in courses.values() if c.get("teacher_name")}
+    teachers = {name: r.id for name, r in _existing_by_name(db, Teacher.name, teacher_names, Teacher.id).items()}
+    missing = sorted(teacher_names - set(teachers))
+    for chunk in _chunks(missing):
+        stmt = upsert_insert(db, Teacher.__table__).values([{"name": name} for name in chunk])
+        db.execute(stmt.on_conflict_do_nothing(index_elements=["name"]))
+    if missing:
+        teachers.update({name: r.id for name, r in _existing_by_name(db, Teacher.name, missing, Teacher.id).items()})
+        report.counts["teachers_created"] = len(missing)
+
+    # Corsi: upsert multiplo sul nome, senza sovrascrivere con valori vuoti
+    table = Course.__table__
+    course_values = []
+    for name, course in courses.items():
+        values = {field: course.get(field) for field in COURSE_FIELDS}
+        values["teacher_id"] = teachers.get(course.get("teacher_name"))
+        course_values.append({"name": name, **values})
+    course_ids: Dict[str, int] = {}
+    for chunk in _chunks(course_values):
+        stmt = upsert_insert(db, table).values(chunk)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["name"],
+            set_={field: func.coalesce(stmt.excluded[field], table.c[field]) for field in COURSE_FIELDS},
+        ).returning(table.c.id, table.c.name)
+        course_ids.update({row.name: row.id for row in db.execute(stmt)})
+    report.counts["courses_created"] = sum(1 for name in courses if name not in existing_courses)
+    report.counts["courses_updated"] = len(courses) - report.counts["courses_created"]
+
+    # Lezioni: chiave (corso, giorno, inizio); insert dei nuovi, update per id dei cambiati
+    existing: Dict[Tuple[int, int, object], Tuple[int, str, object]] = {}
+    untouched = set()
+    for chunk in _chunks(sorted(course_ids.values())):
+        for lesson in (
+            db.query(Lesson.id, Lesson.course_id, Lesson.day_of_week, Lesson.start_time, Lesson.end_time)
+            .filter(Lesson.course_id.in_(chunk))
+            .order_by(Lesson.id)
+        ):
+            key = (lesson.course_id, parse_weekday(lesson.day_of_week), lesson.start_time)
+            untouched.add(lesson.id)
+            existing.setdefault(key, (lesson.id, lesson.day_of_week, lesson.end_time))
+
+    inserts, updates = [], []
+    for _, row in rows:
+        if not row.has_lesson:
+            continue
+        course_id = course_ids[row.course_name]
+        match = existing.get((course_id, parse_weekday(row.day_of_week), row.start_time))
+        if match is None:
+            inserts.append({
+                "course_id": course_id, "day_of_week": row.day_of_week,
+                "start_time": row.start_time, "end_time": row.end_time, "checkins": 0,
+            })
+            continue
+        lesson_id, day_of_week, end_time = match
+        untouched.discard(lesson_id)
+        if (day_of_week, end_time) == (row.day_of_week, row.end_time):
+            report.counts["lessons_unchanged"] += 1
+        else:
+            updates.append({"id": lesson_id, "day_of_week": row.day_of_week, "end_time": row.end_time})
+
+    for chunk in _chunks(inserts):
+        db.execute(Lesson.__table__.insert(), chunk)
+    for chunk in _chunks(updates):
+        db.execute(update(Lesson), chunk)
+    report.counts["lessons_created"] = len(inserts)
+    report.counts["lessons_updated"] = len(updates)
+
+    if replace_lessons and untouched:
+        # Il registro dei check-in va eliminato esplicitamente: su SQLite le FK non cascadano
+        for chunk in _chunks(sorted(untouched)):
+            db.execute(delete(LessonCheckin).where(LessonCheckin.lesson_id.in_(chunk)))
+            db.execute(delete(Lesson).where(Lesson.id.in_(chunk)))
+        report.counts["lessons_deleted"] = len(untouched)
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import sys
+
+    import models  # noqa: F401  (registra tutti i mapper)
+    from database.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Importa l'orario (corsi, aule, lezioni) da CSV, NDJSON o JSON")
+    parser.add_argument("path", help="file da importare ('-' per lo standard input)")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="default: dall'estensione del file")
+    parser.add_argument("--dry-run", action="store_true", help="valida e simula senza salvare")
+    parser.add_argument("--skip-invalid", action="store_true", help="importa le righe valide anche se altre hanno errori")
+    parser.add_argument("--replace-lessons", action="store_true",
+                        help="elimina le lezioni dei corsi importati che non compaiono nel file")
+    args = parser.parse_args()
+
+    fmt = args.format or os.path.splitext(args.path)[1].lstrip(".").lower()
+    if fmt == "jsonl":
+        fmt = "ndjson"
+    stream = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+    db = SessionLocal()
+    try:
+        report = import_timetable(
+            db, read_rows(stream, fmt),
+            dry_run=args.dry_run, skip_invalid=args.skip_invalid, replace_lessons=args.replace_lessons,
+        )
+    except TimetableFormatError as exc:
+        sys.exit(f"error: {exc}")
+    finally:
+        db.close()
+        stream.close()
+    print(json.dumps(report, indent=2))
+    if report["rows_invalid"] and not args.skip_invalid:
+        sys.exit(1)
@@ -0,0 +1,178 @@
+# services/timetable_index.py
+#
+# "Lezioni in corso adesso": indice in memoria dell'orario settimanale.
+# Ogni lezione è un intervallo [inizio, fine) in secondi dall'inizio della
+# settimana (lunedì 00:00); gli intervalli sono ordinati per inizio, quindi
+# le lezioni in corso o che iniziano entro N minuti si trovano con una
+# bisezione sul solo tratto [adesso - durata massima, adesso + N].
+#
+# TIMETABLE_INDEX_BACKEND:
+#   - "memory" (default): indice ricostruito in modo lazy dopo le scritture
+#     su lezioni e corsi (`lesson_index.invalidate()`);
+#   - "db": query diretta, servita dall'indice ix_lessons_day_start.
+
+import os
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session, joinedload
+
+from models.lesson import Lesson
+from services.lazy_index import LazyIndex
+from utils.timetable import WEEKDAY_NAMES, parse_weekday
+
+TIMETABLE_INDEX_BACKEND = os.getenv("TIMETABLE_INDEX_BACKEND", "memory")
+# Età massima dell'indice, se un'invalidazione da un altro worker va persa
+TIMETABLE_INDEX_MAX_AGE = int(os.getenv("TIMETABLE_INDEX_MAX_AGE", "300"))
+
+DAY = 24 * 3600
+WEEK = 7 * DAY
+
+
+def _seconds(value) -> int:
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def week_seconds(at: datetime) -> int:
+    """Secondi trascorsi da lunedì 00:00 della settimana di `at`."""
+    return at.weekday() * DAY + _seconds(at)
+
+
+def lesson_interval(lesson: Lesson) -> Optional[Tuple[int, int]]:
+    """Intervallo settimanale della lezione, None se giorno o orari non sono utilizzabili."""
+    weekday = parse_weekday(lesson.day_of_week)
+    if weekday is None or lesson.start_time is None or lesson.end_time is None:
+        return None
+    start = weekday * DAY + _seconds(lesson.start_time)
+    end = weekday * DAY + _seconds(lesson.end_time)
+    if end <= start:
+        end += DAY  # lezione a cavallo della mezzanotte
+    return start, end
+
+
+def _lesson_payload(lesson: Lesson) -> dict:
+    course = lesson.course
+    return {
+        "id": lesson.id,
+        "course_id": lesson.course_id,
+        "course_name": course.name if course else None,
+        "day_of_week": lesson.day_of_week,
+        "start_time": lesson.start_time,
+        "end_time": lesson.end_time,
+        "room_number": course.room_number if course else None,
+        "building_name": course.building_name if course else None,
+        "floor": course.floor if course else None,
+        "faculty_id": course.faculty_id if course else None,
+        "latitude": course.latitude if course else None,
+        "longitude": course.longitude if course else None,
+    }
+
+
+class WeeklyIntervalIndex:
+    """
+    Intervalli settimanali ordinati per inizio. Ogni intervallo compare in tre
+    copie (settimana precedente, corrente e successiva) così le ricerche a
+    cavallo tra domenica e lunedì non richiedono casi particolari.
+    """
+
+    def __init__(self, entries: List[Tuple[int, int, dict]]):
+        self.size = len(entries)
+        self.max_duration = max((end - start for start, end, _ in entries), default=0)
+        shifted = [
+            (start + offset, end + offset, payload)
+            for start, end, payload in entries
+            for offset in (0, WEEK, 2 * WEEK)
+        ]
+        shifted.sort(key=lambda entry: (entry[0], entry[2]["id"]))
+        self.starts = [entry[0] for entry in shifted]
+        self.entries = shifted
+
+    def active(self, at_seconds: int, within_seconds: int) -> List[Tuple[int, int, dict]]:
+        """
+        Lezioni in corso all'istante `at_seconds` (secondi nella settimana) o
+        che iniziano entro `within_seconds`, come (inizio, fine, payload) con
+        orari relativi alla settimana corrente (possono uscire da [0, WEEK)).
+        """
+        now = at_seconds + WEEK
+        lo = bisect_left(self.starts, now - self.max_duration)
+        hi = bisect_right(self.starts, now + within_seconds)
+        found, seen = [], set()
+        for start, end, payload in self.entries[lo:hi]:
+            if end <= now or payload["id"] in seen:
+                continue
+            seen.add(payload["id"])
+            found.append((start - WEEK, end - WEEK, payload))
+        return found
+
+
+class LessonIndex(LazyIndex):
+    """
+    Indice dell'orario ricostruito in modo lazy (vedi services/lazy_index.py):
+    `invalidate()` dopo le scritture su lezioni o corsi, la ricostruzione
+    avviene alla prima ricerca successiva (o comunque dopo
+    TIMETABLE_INDEX_MAX_AGE secondi).
+    """
+
+    def __init__(self):
+        super().__init__("lessons", TIMETABLE_INDEX_MAX_AGE)
+
+    def _build(self, db: Session) -> WeeklyIntervalIndex:
+        lessons = db.query(Lesson).options(joinedload(Lesson.course)).all()
+        entries = []
+        for lesson in lessons:
+            interval = lesson_interval(lesson)
+            if interval is not None:
+                entries.append((interval[0], interval[1], _lesson_payload(lesson)))
+        return WeeklyIntervalIndex(entries)
+
+    def active(self, db: Session, at: datetime, within_minutes: int) -> List[Tuple[datetime, datetime, dict]]:
+        """
+        Lezioni in corso a `at` o che iniziano entro `within_minutes`, ordinate
+        per orario di inizio, come (inizio, fine, payload) con date assolute.
+        """
+        if TIMETABLE_INDEX_BACKEND == "db":
+            found = self._active_db(db, at, within_minutes)
+        else:
+            found = self.get(db).active(week_seconds(at), within_minutes * 60)
+        week_start = datetime.combine(at.date() - timedelta(days=at.weekday()), datetime.min.time())
+        return sorted(
+            (
+                (week_start + timedelta(seconds=start), week_start + timedelta(seconds=end), payload)
+                for start, end, payload in found
+            ),
+            key=lambda item: (item[0], item[2]["id"]),
+        )
+
+    def _active_db(self, db: Session, at: datetime, within_minutes: int):
+        # Candidati per giorno, con lo stesso confronto case-insensitive
+        # dell'indice ix_lessons_day_start: le lezioni di ieri che attraversano
+        # la mezzanotte, quelle di oggi iniziate entro l'orizzonte e, se
+        # l'orizzonte supera la mezzanotte, quelle di domani. Il filtro esatto
+        # sugli intervalli è lo stesso dell'indice in memoria.
+        horizon = at + timedelta(minutes=within_minutes)
+        day = func.lower(Lesson.day_of_week)
+        yesterday = (at.date() - timedelta(days=1)).weekday()
+        candidates = [and_(day.in_(WEEKDAY_NAMES[yesterday]), Lesson.end_time <= Lesson.start_time)]
+        if horizon.date() == at.date():
+            candidates.append(and_(day.in_(WEEKDAY_NAMES[at.weekday()]), Lesson.start_time <= horizon.time()))
+        else:
+            candidates.append(day.in_(WEEKDAY_NAMES[at.weekday()]))
+            candidates.append(and_(day.in_(WEEKDAY_NAMES[horizon.weekday()]), Lesson.start_time <= horizon.time()))
+        lessons = (
+            db.query(Lesson)
+            .options(joinedload(Lesson.course))
+            .filter(or_(*candidates), Lesson.start_time.isnot(None), Lesson.end_time.isnot(None))
+            .all()
+        )
+        entries = []
+        for lesson in lessons:
+            interval = lesson_interval(lesson)
+            if interval is not None:
+                entries.append((interval[0], interval[1], _lesson_payload(lesson)))
+        return WeeklyIntervalIndex(entries).active(week_seconds(at), within_minutes * 60)
+
+
+# Da invalidare dopo ogni scrittura su lezioni e corsi
+lesson_index = LessonIndex()
@@ -0,0 +1,89 @@
+# tests/conftest.py
+#
+# I test girano sull'app vera, con SQLite (file temporaneo, tabelle
+# ricreate a ogni test) e il Firebase finto dei benchmark
+# (benchmarks/firebase_stub.py): il token "bench-user-<n>" è l'utente n.
+# L'ambiente va impostato prima di importare l'app, e il database è sempre
+# quello temporaneo: le tabelle vengono eliminate a ogni test.
+#
+#   python -m pytest -q
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="uniadvisor-tests-"), "test.db")
+os.environ["DB_ASYNC"] = "false"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from benchmarks.firebase_stub import install, token_for
+
+install()
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import cache
+import main
+import models  # noqa: F401  (registra tutti i mapper)
+from database.database import Base, SessionLocal, engine
+from services.course_autocomplete import course_name_index
+from services.search_index import search_index
+from services.spatial_index import course_index, faculty_index
+from services.timetable_index import lesson_index
+
+PROFILE = {"first_name": "Test", "last_name": "User", "birth_date": "2000-01-01", "city": "Roma"}
+
+
+@pytest.fixture(autouse=True)
+def fresh_database():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    # Cache e indici in memoria conoscono gli id del database precedente
+    for namespace_cache in cache._caches.values():
+        namespace_cache.apply_clear()
+    for index in (course_index, faculty_index, lesson_index, search_index, course_name_index):
+        index.invalidate()
+    yield
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def auth(user: int) -> dict:
+    return {"Authorization": f"Bearer {token_for(user)}"}
+
+
+@pytest.fixture
+def signup(client):
+    """Crea il profilo dell'utente n (il primo profilo creato è admin) e ne restituisce gli header."""
+    def create(user: int) -> dict:
+        response = client.post("/users/profile", json=PROFILE, headers=auth(user))
+        assert response.status_code == 201, response.text
+        return auth(user)
+    return create
+
+
+@contextmanager
+def count_statements():
+    """Conta gli statement SQL eseguiti sull'engine sync: `with count_statements() as statements: ...`."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
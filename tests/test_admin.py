@@ -0,0 +1,89 @@
+import logging
+
+import pytest
+from firebase_admin import auth as firebase_auth, storage
+
+from models import Course, Faculty, Note, Teacher, User
+from services.course_autocomplete import course_name_index
+from services.search_index import search_index
+from services.spatial_index import course_index, faculty_index
+from services.timetable_index import lesson_index
+from tests.conftest import token_for
+
+
+def test_delete_user_missing_from_firebase_is_deleted_locally(client, signup, db, monkeypatch, caplog):
+    admin = signup(1)
+    signup(2)
+    user_id = db.query(User.id).filter(User.firebase_uid == token_for(2)).scalar()
+
+    def user_not_found(uid):
+        raise firebase_auth.UserNotFoundError(f"No user record found for {uid}")
+
+    monkeypatch.setattr(firebase_auth, "delete_user", user_not_found)
+    with caplog.at_level(logging.WARNING, logger="routers.admin"):
+        response = client.delete(f"/admin/users/{user_id}", headers=admin)
+
+    assert response.status_code == 200, response.text
+    assert db.get(User, user_id) is None
+    assert "not found in Firebase" in caplog.text
+
+
+def test_delete_note_when_storage_fails_still_deletes_the_note(client, signup, db, monkeypatch, caplog):
+    admin = signup(1)
+    faculty = Faculty(name="Ingegneria")
+    db.add(faculty)
+    db.flush()
+    course = Course(name="Analisi 1", faculty_id=faculty.id)
+    db.add(course)
+    db.flush()
+    note = Note(course_id=course.id, student_id=1, file_id="https://files/1")
+    db.add(note)
+    db.commit()
+    note_id = note.id
+
+    def storage_down(*args, **kwargs):
+        raise RuntimeError("storage unavailable")
+
+    monkeypatch.setattr(storage, "bucket", storage_down)
+    with caplog.at_level(logging.WARNING, logger="routers.admin"):
+        response = client.delete(f"/admin/notes/{note_id}", headers=admin)
+
+    assert response.status_code == 200, response.text
+    db.expire_all()
+    assert db.get(Note, note_id) is None
+    assert "storage unavailable" in caplog.text
+
+
+@pytest.mark.parametrize("method, path, body", [
+    ("post", "/admin/teachers", {"name": "Rossi"}),
+    ("delete", "/admin/teachers/{teacher_id}", None),
+    ("post", "/admin/courses", {"name": "Fisica 1", "faculty_id": "{faculty_id}"}),
+    ("delete", "/admin/courses/{course_id}", None),
+    ("delete", "/admin/faculties/{faculty_id}", None),
+])
+def test_catalog_writes_invalidate_every_index(client, signup, db, method, path, body):
+    admin = signup(1)
+    faculty = Faculty(name="Ingegneria")
+    db.add(faculty)
+    db.flush()
+    teacher = Teacher(name="Bianchi")
+    course = Course(name="Analisi 1", faculty_id=faculty.id, teacher=teacher)
+    db.add(course)
+    db.commit()
+    ids = {"faculty_id": faculty.id, "teacher_id": teacher.id, "course_id": course.id}
+    if body is not None:
+        body = {key: int(value.format(**ids)) if key.endswith("_id") else value for key, value in body.items()}
+    for index in (course_index, faculty_index, lesson_index, search_index, course_name_index):
+        index.get(db)
+
+    response = client.request(method, path.format(**ids), json=body, headers=admin)
+
+    assert response.status_code == 200, response.text
+    assert not any(index.ready() for index in (course_index, lesson_index, search_index))
+    # L'indice dei nomi si aggiorna in place quando cambia un solo corso
+    db.expire_all()
+    if course_name_index.ready():
+        for name in ("Analisi 1", "Fisica 1"):
+            expected = [{"id": c.id, "name": c.name} for c in db.query(Course).filter(Course.name == name)]
+            assert course_name_index.complete(faculty.id, name, 10) == expected
+    assert not faculty_index.ready() if "faculties" in path else faculty_index.ready()
@@ -0,0 +1,173 @@
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+
+from benchmarks.resp_stub import start_in_thread
+from cache.backends import CacheError, MemoryBackend
+from cache.core import Cache
+from cache.resp import RedisBackend, RespClient
+
+
+def garbage_server(reply: bytes) -> int:
+    """Server che risponde `reply` a qualunque comando; restituisce la porta."""
+    listener = socket.create_server(("127.0.0.1", 0))
+
+    def serve():
+        while True:
+            conn, _ = listener.accept()
+            with conn:
+                while conn.recv(65536):
+                    conn.sendall(reply)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return listener.getsockname()[1]
+
+
+@pytest.mark.parametrize("reply", [b":abc\r\n", b"$x\r\n", b"*?\r\n", b"!!\r\n"])
+def test_malformed_reply_is_a_cache_miss_and_drops_the_connection(reply):
+    client = RespClient(f"redis://127.0.0.1:{garbage_server(reply)}/0")
+    backend = RedisBackend(client, "test:")
+
+    with pytest.raises(CacheError):
+        backend.get("key")
+    assert client._idle == []  # connessione chiusa, non rimessa nel pool
+
+    assert Cache("garbled", backend, ttl=60).get("key", "miss") == "miss"
+
+
+def test_malformed_tag_version_is_a_cache_error():
+    # MGET delle versioni dei tag con un valore non numerico
+    port = garbage_server(b"*1\r\n$3\r\nabc\r\n")
+    client = RespClient(f"redis://127.0.0.1:{port}/0")
+    with pytest.raises(CacheError):
+        RedisBackend(client, "test:").tag_versions(("tag",))
+
+
+# --- RedisBackend sullo stand-in (benchmarks/resp_stub.py) -----------------
+
+@pytest.fixture(scope="module")
+def resp_url():
+    return f"redis://:secret@127.0.0.1:{start_in_thread(password='secret')}/1"
+
+
+@pytest.fixture
+def redis_cache(resp_url, request):
+    # Un prefisso per test: lo stand-in è condiviso da tutto il modulo
+    client = RespClient(resp_url)
+    cache = Cache("courses", RedisBackend(client, prefix=f"{request.node.name}:"), ttl=60)
+    yield cache
+    client.close()
+
+
+def test_redis_get_set_and_ttl(redis_cache):
+    redis_cache.set("course:1", {"name": "Analisi 1"})
+    redis_cache.set("short", "value", ttl=0.05)
+    assert redis_cache.get("course:1") == {"name": "Analisi 1"}
+    assert redis_cache.get("short") == "value"
+    time.sleep(0.1)
+    assert redis_cache.get("short") is None
+    assert redis_cache.get("missing", "default") == "default"
+
+
+def test_redis_tag_invalidation(redis_cache):
+    redis_cache.set("course:1", "one", tags=["faculty:1"])
+    redis_cache.set("course:2", "two", tags=["faculty:2"])
+    redis_cache.invalidate("faculty:1")
+    assert redis_cache.get("course:1") is None
+    assert redis_cache.get("course:2") == "two"
+    # Una voce nuova con lo stesso tag è valida
+    redis_cache.set("course:1", "again", tags=["faculty:1"])
+    assert redis_cache.get("course:1") == "again"
+
+
+def test_redis_clear_only_touches_the_namespace(redis_cache):
+    other = Cache("teachers", redis_cache.backend, ttl=60)
+    redis_cache.set("a", 1)
+    other.set("a", 2)
+    redis_cache.clear()
+    assert redis_cache.get("a") is None
+    assert other.get("a") == 2
+
+
+def test_redis_reconnects_after_a_dropped_connection(redis_cache):
+    client = redis_cache.backend.client
+    redis_cache.set("course:1", "one")
+    assert client._idle
+    for connection in client._idle:
+        connection.sock.shutdown(socket.SHUT_RDWR)  # come un server riavviato
+    assert redis_cache.get("course:1") == "one"
+
+
+def test_unreachable_server_is_a_cache_miss():
+    listener = socket.create_server(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    cache = Cache("down", RedisBackend(RespClient(f"redis://127.0.0.1:{port}/0"), "test:"), ttl=60)
+    cache.set("key", "value")
+    assert cache.get("key", "miss") == "miss"
+    assert cache.get_or_set("key", lambda: "loaded") == "loaded"
+
+
+# --- Cache su MemoryBackend --------------------------------------------------
+
+def test_get_or_set_loads_once_for_concurrent_threads():
+    cache = Cache("single-flight", MemoryBackend(10), ttl=60)
+    calls, results = [], []
+    start = threading.Barrier(10)
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.1)
+        return "value"
+
+    def worker():
+        start.wait()
+        results.append(cache.get_or_set("key", loader))
+
+    threads = [threading.Thread(target=worker) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == ["value"] * 10
+
+
+def test_aget_or_set_loads_once_for_concurrent_requests():
+    cache = Cache("async-single-flight", MemoryBackend(10), ttl=60)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def burst():
+        return await asyncio.gather(*(cache.aget_or_set("key", loader) for _ in range(10)))
+
+    assert asyncio.run(burst()) == ["value"] * 10
+    assert len(calls) == 1
+
+
+def test_memory_backend_evicts_the_least_recently_used_entry():
+    backend = MemoryBackend(2)
+    backend.set("a", 1, ttl=60)
+    backend.set("b", 2, ttl=60)
+    assert backend.get("a") == 1  # "b" diventa la meno recente
+    backend.set("c", 3, ttl=60)
+    assert (backend.get("a"), backend.get("b"), backend.get("c")) == (1, None, 3)
+    assert len(backend) == 2
+
+
+def test_token_cache_keeps_claims_until_their_exp():
+    from auth.token_cache import cache_claims, get_cached_claims
+
+    cache_claims("live-token", {"uid": "a", "exp": time.time() + 60})
+    cache_claims("expired-token", {"uid": "b", "exp": time.time() - 1})
+    cache_claims("no-exp-token", {"uid": "c"})
+    assert get_cached_claims("live-token")["uid"] == "a"
+    assert get_cached_claims("expired-token") is None
+    assert get_cached_claims("no-exp-token") is None
@@ -0,0 +1,158 @@
+# Check-in concorrenti (la versione automatica di benchmarks/bench_checkin.py):
+# centinaia di studenti fanno check-in nello stesso momento sulle stesse
+# lezioni, da thread che hanno ognuno la sua sessione e quindi la sua
+# connessione al database, e ogni studente arriva da due thread diversi.
+# Alla fine il contatore di ogni lezione deve essere uguale alle righe del
+# registro, e gli UPDATE devono aver restituito ogni valore una volta sola:
+# nessun incremento perso e nessun doppione contato.
+#
+# Su SQLite le scritture si mettono in fila sul lock del file, quindi un
+# aggiornamento perso non può capitare: il caso che conta è Postgres, su
+# TEST_POSTGRES_URL (un database di prova: le tabelle vengono create ed
+# eliminate). In CI il servizio Postgres c'è sempre (.github/workflows/tests.yml)
+# e senza TEST_POSTGRES_URL il test fallisce; in locale viene saltato.
+
+import os
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import database.database
+from database.database import Base
+from models import Course, Faculty, Lesson, LessonCheckin, User
+from services.checkin_counter import CheckinBuffer, rebuild_lesson_occupancy, record_checkins
+
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+THREADS = 50
+STUDENTS = 400  # check-in distinti per lezione, ognuno inviato due volte
+TODAY = datetime(2026, 3, 2, 9, 0)
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def sessions(request, monkeypatch):
+    """Fabbrica di sessioni del database in prova; il flush del buffer usa la stessa."""
+    if request.param == "sqlite":
+        yield database.database.SessionLocal
+        return
+    if not TEST_POSTGRES_URL:
+        if os.getenv("CI"):
+            pytest.fail("TEST_POSTGRES_URL must point at the CI Postgres service")
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    engine = create_engine(TEST_POSTGRES_URL, pool_size=THREADS, max_overflow=0)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(database.database, "SessionLocal", factory)
+    yield factory
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def db(sessions):
+    session = sessions()
+    yield session
+    session.close()
+
+
+def seed(db, lessons: int = 2) -> list:
+    faculty = Faculty(name="Ingegneria")
+    db.add(faculty)
+    db.flush()
+    course = Course(name="Analisi 1", faculty_id=faculty.id)
+    db.add(course)
+    db.add_all(
+        User(firebase_uid=f"student-{i}", email=f"student{i}@example.com", hashed_password="x",
+             first_name="Test", last_name="User", birth_date=date(2000, 1, 1), city="Roma")
+        for i in range(STUDENTS)
+    )
+    db.flush()
+    lesson_rows = [Lesson(course_id=course.id, day_of_week="Monday") for _ in range(lessons)]
+    db.add_all(lesson_rows)
+    db.commit()
+    return [lesson.id for lesson in lesson_rows]
+
+
+def students_of(user_ids: list, index: int) -> list:
+    # I thread i e i + THREADS/2 hanno gli stessi studenti
+    return user_ids[index % (THREADS // 2)::THREADS // 2]
+
+
+def run_threads(target):
+    errors = []
+    start = threading.Barrier(THREADS)
+
+    def worker(index):
+        try:
+            start.wait()
+            target(index)
+        except Exception as e:  # un errore in un thread deve far fallire il test
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=120)
+    assert not errors, errors
+
+
+def assert_counters_match_log(db, lesson_ids: list, expected: int, day: date):
+    db.expire_all()
+    for lesson_id in lesson_ids:
+        lesson = db.get(Lesson, lesson_id)
+        logged = db.query(LessonCheckin).filter(LessonCheckin.lesson_id == lesson_id).count()
+        assert (lesson.checkins, lesson.last_checkin_date, logged) == (expected, day, expected)
+    assert rebuild_lesson_occupancy(db, day, fix=False)["drifted"] == 0
+
+
+def test_concurrent_record_checkins_lose_no_update(db, sessions):
+    lesson_ids = seed(db)
+    user_ids = [user_id for user_id, in db.query(User.id)]
+    returned = defaultdict(list)
+
+    def check_in(index):
+        session = sessions()
+        try:
+            for user_id in students_of(user_ids, index):
+                rows = [(lesson_id, user_id, TODAY + timedelta(seconds=index)) for lesson_id in lesson_ids]
+                occupancy = record_checkins(session, rows)
+                session.commit()
+                for (lesson_id, _), value in occupancy.items():
+                    returned[lesson_id].append(value)
+        finally:
+            session.close()
+
+    run_threads(check_in)
+    # Ogni UPDATE ha visto il risultato del precedente, e i doppioni non ne hanno fatti
+    assert {lesson_id: sorted(values) for lesson_id, values in returned.items()} == {
+        lesson_id: list(range(1, STUDENTS + 1)) for lesson_id in lesson_ids
+    }
+    assert_counters_match_log(db, lesson_ids, STUDENTS, TODAY.date())
+
+
+def test_concurrent_buffered_checkins_and_flushes(db):
+    lesson_ids = seed(db)
+    user_ids = [user_id for user_id, in db.query(User.id)]
+    # Flush periodico ogni 5 ms più quelli espliciti dei thread, tutti in parallelo
+    buffer = CheckinBuffer(interval_ms=5, shards=4)
+
+    def check_in(index):
+        for position, user_id in enumerate(students_of(user_ids, index)):
+            for lesson_id in lesson_ids:
+                buffer.add(lesson_id, user_id, TODAY)
+            if position % 3 == index % 3:
+                buffer.flush()
+
+    run_threads(check_in)
+    buffer.stop()
+    buffer._thread.join(timeout=10)  # un flush periodico può essere ancora in corso
+    buffer.flush()  # e può aver rimesso in memoria i check-in di un tentativo fallito
+
+    assert all(buffer.pending(lesson_id, TODAY.date()) == 0 for lesson_id in lesson_ids)
+    assert_counters_match_log(db, lesson_ids, STUDENTS, TODAY.date())
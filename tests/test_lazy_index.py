@@ -0,0 +1,58 @@
+from services.lazy_index import CHANNEL, LazyIndex
+from services.pubsub import get_broker
+
+
+class CountingIndex(LazyIndex):
+    def __init__(self, max_age: float = 300):
+        super().__init__("counting", max_age)
+        self.builds = 0
+        self.on_build = None
+
+    def _build(self, db):
+        self.builds += 1
+        if self.on_build:
+            self.on_build()
+        return self.builds
+
+
+def test_builds_once_until_invalidated():
+    index = CountingIndex()
+    assert (index.get(None), index.get(None)) == (1, 1)
+    index.invalidate()
+    assert not index.ready()
+    assert index.get(None) == 2
+
+
+def test_invalidation_during_a_build_forces_the_next_rebuild():
+    index = CountingIndex()
+    index.on_build = index.invalidate
+    assert index.get(None) == 1  # chi ha chiesto la build riceve comunque un risultato
+    index.on_build = None
+    assert index.get(None) == 2
+
+
+def test_rebuilds_after_max_age():
+    index = CountingIndex(max_age=0)
+    assert (index.get(None), index.get(None)) == (1, 2)
+
+
+def test_invalidation_and_in_place_changes_reach_the_other_workers():
+    index = CountingIndex()
+    sent = []
+    get_broker().subscribe(CHANNEL, sent.append)
+    try:
+        index.get(None)
+        index.changed()
+        assert index.ready()  # qui l'aggiornamento è già applicato
+        index.invalidate()
+    finally:
+        get_broker().unsubscribe(CHANNEL, sent.append)
+    assert [message["index"] for message in sent] == ["counting", "counting"]
+
+
+def test_invalidation_from_another_worker_drops_the_index():
+    index = CountingIndex()
+    index.get(None)
+    get_broker().publish(CHANNEL, {"origin": -1, "index": "counting"})
+    assert not index.ready()
+    assert index.get(None) == 2
@@ -0,0 +1,95 @@
+import asyncio
+import queue
+import subprocess
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+import services.occupancy_stream
+from routers.lessons import OCCUPANCY_STREAM_MAX_LESSONS
+from services.occupancy_stream import OccupancyHub, publish_occupancy
+from services.pubsub import InMemoryBroker, UnixDatagramBroker
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def stream(client, lesson_ids, headers=None):
+    return client.get("/lessons/occupancy/stream", params={"lesson_id": lesson_ids}, headers=headers or {})
+
+
+def test_occupancy_stream_requires_a_token(client):
+    assert stream(client, [1]).status_code == 401
+
+
+def test_occupancy_stream_limits_the_number_of_lessons(client, signup):
+    headers = signup(1)
+    response = stream(client, list(range(1, OCCUPANCY_STREAM_MAX_LESSONS + 2)), headers)
+    assert response.status_code == 400
+    # I doppioni contano una volta: si arriva alla ricerca delle lezioni
+    assert stream(client, [999] * (OCCUPANCY_STREAM_MAX_LESSONS + 1), headers).status_code == 404
+
+
+def test_occupancy_hub_sends_at_most_one_update_per_interval(monkeypatch):
+    broker = InMemoryBroker()
+    monkeypatch.setattr(services.occupancy_stream, "get_broker", lambda: broker)
+    day = date(2026, 3, 2)
+    interval = 0.05
+
+    async def scenario():
+        hub = OccupancyHub(interval_ms=int(interval * 1000))
+        subscription = hub.subscribe([1, 2])
+        # Una raffica dentro lo stesso intervallo: un solo messaggio, con l'ultimo valore
+        for occupancy in range(1, 101):
+            publish_occupancy(1, day, occupancy)
+        publish_occupancy(2, day, 7)
+        publish_occupancy(3, day, 1)  # lezione non seguita
+        burst = await subscription.next_batch(timeout=1)
+
+        # Check-in continui per 10 intervalli, da un altro thread come dal threadpool
+        def check_ins():
+            for occupancy in range(101, 301):
+                publish_occupancy(1, day, occupancy)
+                time.sleep(interval / 20)
+
+        deliveries = []
+        publisher = asyncio.get_running_loop().run_in_executor(None, check_ins)
+        while True:
+            done = publisher.done()
+            batch = await subscription.next_batch(timeout=interval * 3)
+            if batch:
+                deliveries.append((time.monotonic(), batch))
+            elif done:
+                break
+        await publisher
+        hub.unsubscribe(subscription)
+        return burst, deliveries
+
+    burst, deliveries = asyncio.run(scenario())
+    assert burst == {1: ("2026-03-02", 100), 2: ("2026-03-02", 7)}
+    assert all(set(batch) == {1} for _, batch in deliveries)
+    assert deliveries[-1][1] == {1: ("2026-03-02", 300)}
+    gaps = [later - earlier for (earlier, _), (later, _) in zip(deliveries, deliveries[1:])]
+    assert min(gaps) >= interval * 0.8  # margine per il clock dell'event loop
+    assert len(deliveries) <= 12
+
+
+def test_unix_datagram_broker_delivers_to_another_process(tmp_path):
+    broker = UnixDatagramBroker(str(tmp_path))
+    received = queue.Queue()
+    broker.subscribe("occupancy", received.put)
+    try:
+        publisher = (
+            "import sys; from services.pubsub import UnixDatagramBroker; "
+            "UnixDatagramBroker(sys.argv[1]).publish('occupancy', {'lesson_id': 1, 'occupancy': 42})"
+        )
+        subprocess.run([sys.executable, "-c", publisher, str(tmp_path)], cwd=ROOT, check=True, timeout=30)
+        assert received.get(timeout=5) == {"lesson_id": 1, "occupancy": 42}
+
+        # Chi pubblica consegna anche in locale, senza rimandarlo a se stesso
+        broker.publish("occupancy", {"lesson_id": 2, "occupancy": 1})
+        assert received.get(timeout=1) == {"lesson_id": 2, "occupancy": 1}
+        time.sleep(0.1)
+        assert received.empty()
+    finally:
+        broker.close()
@@ -0,0 +1,110 @@
+# Regressione N+1: il professore dei corsi arriva con la stessa query dei
+# corsi, quindi il numero di statement non dipende da quanti corsi trova.
+
+from datetime import datetime, time
+
+import pytest
+
+import routers.location
+from models import Course, Faculty, Lesson, Teacher
+from services.spatial_index import course_index
+from tests.conftest import count_statements
+
+LATITUDE, LONGITUDE = 41.9, 12.5
+
+
+def seed_courses(db, count: int):
+    """Porta a `count` i corsi della facoltà, ognuno con un professore diverso."""
+    faculty = db.query(Faculty).first()
+    if faculty is None:
+        faculty = Faculty(name="Ingegneria", latitude=LATITUDE, longitude=LONGITUDE)
+        db.add(faculty)
+        db.flush()
+    # Con l'N+1 ogni professore sarebbe una SELECT in più
+    for i in range(db.query(Course).count(), count):
+        db.add(Course(
+            name=f"Course {i}", faculty_id=faculty.id, teacher=Teacher(name=f"Teacher {i}"),
+            latitude=LATITUDE + i * 0.0001, longitude=LONGITUDE,
+        ))
+    db.commit()
+    return [course.id for course in db.query(Course).order_by(Course.id)]
+
+
+def nearby_statements(client, headers, expected: int) -> int:
+    params = {"latitude": LATITUDE, "longitude": LONGITUDE, "radius_meters": 1000}
+    course_index.invalidate()  # ogni richiesta ricostruisce l'indice dal database
+    with count_statements() as statements:
+        response = client.get("/location/courses/nearby", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    courses = response.json()["courses"]
+    assert len(courses) == expected
+    assert all(course["teacher_name"].startswith("Teacher ") for course in courses)
+    return len(statements)
+
+
+def test_nearby_courses_statement_count_does_not_grow_with_results(client, signup, db):
+    headers = signup(1)
+    client.get("/users/me", headers=headers)  # identità in cache: si contano solo le query dell'endpoint
+
+    seed_courses(db, 1)
+    with_one = nearby_statements(client, headers, expected=1)
+
+    seed_courses(db, 25)
+    with_many = nearby_statements(client, headers, expected=25)
+
+    assert with_one == with_many == 1
+
+
+@pytest.mark.parametrize("with_teacher", [True, False])
+def test_course_location_loads_teacher_in_the_same_statement(client, signup, db, with_teacher):
+    headers = signup(1)
+    client.get("/users/me", headers=headers)
+    course_id = seed_courses(db, 1)[0]
+    if not with_teacher:
+        db.get(Course, course_id).teacher_id = None
+        db.commit()
+
+    with count_statements() as statements:
+        response = client.get(f"/location/courses/{course_id}/location", headers=headers)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["teacher_name"] == ("Teacher 0" if with_teacher else None)
+    assert len(statements) == 1
+
+
+class FixedDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2026, 3, 2, 10, 0)  # lunedì alle 10
+
+
+def batch_today(client, headers, **options):
+    body = {"latitude": LATITUDE, "longitude": LONGITUDE, "today": True, **options}
+    return client.post("/location/navigate/batch", json=body, headers=headers)
+
+
+def test_batch_navigation_today_keeps_the_lessons_not_ended_yet(client, signup, db, monkeypatch):
+    headers = signup(1)
+    course_id = seed_courses(db, 1)[0]
+    response = client.post(f"/faculties/enroll/{db.get(Course, course_id).faculty_id}", headers=headers)
+    assert response.status_code == 200, response.text
+    hours = [(8, 9), (9, 11), (11, 12), (12, 13), (23, 1)]  # l'ultima finisce dopo la mezzanotte
+    lessons = [Lesson(course_id=course_id, day_of_week="Monday", start_time=time(start), end_time=time(end))
+               for start, end in hours]
+    db.add_all(lessons)
+    db.commit()
+    monkeypatch.setattr(routers.location, "datetime", FixedDatetime)
+
+    response = batch_today(client, headers)
+    assert response.status_code == 200, response.text
+    assert [entry["lesson_id"] for entry in response.json()["destinations"]] == [lesson.id for lesson in lessons[1:]]
+
+    monkeypatch.setattr(routers.location, "BATCH_NAVIGATION_MAX_STOPS", 2)
+    response = batch_today(client, headers)
+    assert [entry["lesson_id"] for entry in response.json()["destinations"]] == [lessons[1].id, lessons[2].id]
+
+
+def test_batch_navigation_today_rejects_optimize(client, signup):
+    response = batch_today(client, signup(1), optimize=True)
+    assert response.status_code == 400
+    assert "optimize" in response.json()["detail"]
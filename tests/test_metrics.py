@@ -0,0 +1,19 @@
+from fastapi.routing import APIRoute
+
+from utils.metrics import UNMATCHED_ROUTE, route_template
+
+
+def test_route_template_is_the_matched_route_path():
+    route = APIRoute("/teachers/{name}", lambda name: name)
+    # Il valore del parametro coincide con un segmento fisso del path
+    scope = {"path": "/teachers/teachers", "path_params": {"name": "teachers"},
+             "endpoint": route.endpoint, "route": route}
+    assert route_template(scope) == "/teachers/{name}"
+    assert route_template({"path": "/missing"}) == UNMATCHED_ROUTE
+
+
+def test_metrics_label_requests_with_the_full_route_template(client, signup):
+    headers = signup(1)
+    client.get("/notes/notes/1/rating-summary", headers=headers)
+    body = client.get("/metrics").text
+    assert 'route="/notes/notes/{note_id}/rating-summary"' in body
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import Course, Faculty, Note
+from services.note_ratings import rebuild_note_rating_stats
+from tests.conftest import auth, count_statements
+
+
+def seed_course(db) -> int:
+    faculty = Faculty(name="Ingegneria")
+    db.add(faculty)
+    db.flush()
+    course = Course(name="Analisi 1", faculty_id=faculty.id)
+    db.add(course)
+    db.commit()
+    return course.id
+
+
+def seed_notes(db, course_id: int, student_id: int, created_at: list) -> list:
+    notes = [Note(course_id=course_id, student_id=student_id, file_id=f"https://files/{i}") for i in range(len(created_at))]
+    db.add_all(notes)
+    db.commit()
+    # Il default di created_at scatta anche con None: le date vanno scritte dopo
+    for note, value in zip(notes, created_at):
+        db.query(Note).filter(Note.id == note.id).update({Note.created_at: value})
+    db.commit()
+    return [note.id for note in notes]
+
+
+def all_pages(client, url: str, headers: dict, limit: int) -> list:
+    ids, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = client.get(url, params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        ids += [note["id"] for note in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("path", ["/notes/{}", "/notes/{}/notes-sorted"])
+def test_pages_include_notes_without_created_at(client, signup, db, path):
+    headers = signup(1)
+    course_id = seed_course(db)
+    now = datetime(2024, 5, 1)
+    # Gli appunti senza data finiscono in fondo, anche a cavallo di due pagine
+    created_at = [now, None, now - timedelta(days=1), None, now, None, None]
+    note_ids = seed_notes(db, course_id, 1, created_at)
+
+    ids = all_pages(client, path.format(course_id), headers, limit=2)
+
+    assert sorted(ids) == sorted(note_ids)
+    dated = {note_id for note_id, value in zip(note_ids, created_at) if value is not None}
+    assert set(ids[:len(dated)]) == dated
+
+
+def enroll(client, headers: dict, course_id: int, db) -> None:
+    faculty_id = db.get(Course, course_id).faculty_id
+    response = client.post(f"/faculties/enroll/{faculty_id}", headers=headers)
+    assert response.status_code == 200, response.text
+
+
+def rate(client, user: int, note_id: int, rating: int) -> int:
+    response = client.post("/notes/ratings", json={"note_id": note_id, "rating": rating}, headers=auth(user))
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def sorted_notes(client, course_id: int, order: str = "desc") -> list:
+    response = client.get(f"/notes/{course_id}/notes-sorted", params={"order": order})
+    assert response.status_code == 200, response.text
+    return [(note["id"], note["average_rating"], note["rating_count"]) for note in response.json()]
+
+
+def assert_no_drift(db) -> None:
+    db.expire_all()
+    report = rebuild_note_rating_stats(db, fix=False)
+    assert report["drifted"] == 0, report["drift"]
+
+
+def test_sorted_notes_use_one_query_whatever_the_number_of_notes(client, signup, db):
+    signup(1)
+    course_id = seed_course(db)
+    counts = []
+    for total in (1, 20):
+        seed_notes(db, course_id, 1, [datetime(2024, 5, 1)] * (total - db.query(Note).count()))
+        with count_statements() as statements:
+            assert len(sorted_notes(client, course_id)) == total
+        counts.append(len(statements))
+    assert counts == [1, 1]
+
+
+def test_rating_summary_follows_every_rating_change(client, signup, db):
+    course_id = seed_course(db)
+    for user in (1, 2, 3):  # l'utente 1 è admin
+        enroll(client, signup(user), course_id, db)
+    first, second, unrated = seed_notes(db, course_id, 1, [datetime(2024, 5, 1)] * 3)
+
+    ratings = {(user, note_id): rate(client, user, note_id, stars)
+               for user, note_id, stars in [(2, first, 5), (3, first, 2), (2, second, 4)]}
+    assert_no_drift(db)
+    assert sorted_notes(client, course_id) == [(second, 4.0, 1), (first, 3.5, 2), (unrated, None, 0)]
+
+    response = client.put(f"/notes/ratings/{ratings[3, first]}", json={"rating": 5}, headers=auth(3))
+    assert response.status_code == 200, response.text
+    assert_no_drift(db)
+    assert sorted_notes(client, course_id)[0] == (first, 5.0, 2)
+
+    response = client.delete(f"/notes/ratings/{ratings[2, first]}", headers=auth(2))
+    assert response.status_code == 200, response.text
+    assert_no_drift(db)
+    # In ordine crescente gli appunti senza valutazioni vengono per primi
+    assert sorted_notes(client, course_id, order="asc") == [(unrated, None, 0), (second, 4.0, 1), (first, 5.0, 1)]
+
+    response = client.delete(f"/admin/note-ratings/{ratings[2, second]}", headers=auth(1))
+    assert response.status_code == 200, response.text
+    assert_no_drift(db)
+    assert sorted_notes(client, course_id) == [(first, 5.0, 1), (unrated, None, 0), (second, None, 0)]
@@ -0,0 +1,81 @@
+# utils/geo.py
+
+import math
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000
+# Velocità media a piedi: 5 km/h
+WALKING_SPEED_M_PER_MIN = 83.33
+
+
+def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Distanza haversine in metri tra due punti (gradi decimali).
+    Versione scalare: per un solo punto è più veloce di quella NumPy.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def haversine_many(lat, lon, lats, lons) -> np.ndarray:
+    """
+    Distanze haversine in metri, vettorizzate con NumPy.
+
+    `lat`/`lon` sono il punto (o i punti) dell'utente, `lats`/`lons` i candidati.
+    Con un solo punto utente restituisce un array di forma (n,); con m punti
+    utente una matrice (m, n) con le distanze di ogni utente da ogni candidato.
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    if lat.ndim == 1:
+        lat = lat[:, np.newaxis]
+        lon = lon[:, np.newaxis]
+
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def calculate_walking_time(distance_meters: float) -> int:
+    """Tempo a piedi in minuti, arrotondato per eccesso."""
+    return int(distance_meters / WALKING_SPEED_M_PER_MIN) + 1
+
+
+def plan_walking_route(start_lat: float, start_lon: float, lats, lons) -> list:
+    """
+    Ordine di visita (indici in `lats`/`lons`) che parte dalla posizione
+    dell'utente e minimizza, in modo euristico, la distanza totale a piedi:
+    nearest neighbour seguito da miglioramenti 2-opt sul percorso aperto.
+    """
+    n = len(lats)
+    if n <= 1:
+        return list(range(n))
+
+    all_lats = np.concatenate([[start_lat], np.asarray(lats, dtype=np.float64)])
+    all_lons = np.concatenate([[start_lon], np.asarray(lons, dtype=np.float64)])
+    # Nodo 0 = posizione dell'utente, nodi 1..n = destinazioni
+    dist = haversine_many(all_lats, all_lons, all_lats, all_lons)
+
+    route = [0]
+    remaining = set(range(1, n + 1))
+    while remaining:
+        nearest = min(remaining, key=lambda j: dist[route[-1], j])
+        route.append(nearest)
+        remaining.remove(nearest)
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n):
+            for j in range(i + 1, n + 1):
+                # Inverte il tratto route[i..j]: cambiano solo gli archi ai due estremi
+                before = dist[route[i - 1], route[i]] + (dist[route[j], route[j + 1]] if j < n else 0.0)
+                after = dist[route[i - 1], route[j]] + (dist[route[i], route[j + 1]] if j < n else 0.0)
+                if after + 1e-6 < before:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    improved = True
+
+    return [node - 1 for node in route[1:]]
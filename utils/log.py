@@ -0,0 +1,212 @@
+# utils/log.py
+#
+# Logging dell'applicazione senza I/O sul percorso della richiesta: i moduli
+# usano `logging.getLogger(__name__)`, i record passano da una coda in memoria
+# e un thread dedicato (QueueListener) li scrive su stdout.
+#
+# Configurazione (variabili d'ambiente):
+#   LOG_LEVEL              livello globale (default INFO)
+#   LOG_FORMAT             "json" (default) o "text"
+#   LOG_ROUTE_LEVELS       livelli per prefisso di path, es. "/notes=DEBUG,/users/me=WARNING"
+#                          (vince il prefisso più lungo)
+#   LOG_DEBUG_SAMPLE_RATE  frazione delle richieste di cui tenere i record DEBUG (default 0.1)
+#   LOG_QUEUE_SIZE         record in coda oltre i quali i nuovi vengono scartati (default 10000)
+#
+# Ogni record porta il request id (header X-Request-ID, generato se assente),
+# che viene anche restituito nella risposta.
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+LOG_LEVEL = logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").upper())
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+REQUEST_ID_HEADER = "x-request-id"
+
+
+def _parse_route_levels(raw: str) -> Dict[str, int]:
+    levels = {}
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        prefix, _, level = item.partition("=")
+        value = logging.getLevelName(level.strip().upper())
+        if isinstance(value, int):
+            levels[prefix.strip()] = value
+    return levels
+
+
+LOG_ROUTE_LEVELS = _parse_route_levels(os.getenv("LOG_ROUTE_LEVELS", ""))
+
+# Contesto della richiesta corrente (si propaga anche nel threadpool e in run_sync)
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_request_var: contextvars.ContextVar[Optional[tuple]] = contextvars.ContextVar("log_request", default=None)
+
+# Attributi standard di LogRecord: tutto il resto è un campo `extra=` da riportare nel JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id", "method", "path"}
+
+
+def route_level(path: str) -> int:
+    best, level = -1, LOG_LEVEL
+    for prefix, prefix_level in LOG_ROUTE_LEVELS.items():
+        if path.startswith(prefix) and len(prefix) > best:
+            best, level = len(prefix), prefix_level
+    return level
+
+
+class ContextFilter(logging.Filter):
+    """
+    Applica il livello della route corrente e il campionamento dei DEBUG,
+    e aggiunge al record request id, metodo e path. Gira nel thread che
+    produce il log, quindi vede le contextvars della richiesta.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        current = _request_var.get()
+        if current is None:
+            level, sampled = LOG_LEVEL, random.random() < LOG_DEBUG_SAMPLE_RATE
+            record.method = record.path = None
+        else:
+            method, path, level, sampled = current
+            record.method, record.path = method, path
+        if record.levelno < level:
+            return False
+        if record.levelno <= logging.DEBUG and not sampled:
+            return False
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in ("request_id", "method", "path"):
+            if getattr(record, key, None) is not None:
+                entry[key] = getattr(record, key)
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "request_id"):
+            record.request_id = None
+        return super().format(record)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler che, a coda piena, scarta il record invece di bloccare la richiesta."""
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Il messaggio e l'eventuale traceback vengono risolti qui, nel thread
+        # della richiesta; la formattazione (JSON o testo) avviene nel listener.
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging():
+    """Installa la coda di logging sul root logger. Idempotente."""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JSONFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    # I record sotto questo livello non vengono nemmeno creati
+    root.setLevel(min([LOG_LEVEL, *LOG_ROUTE_LEVELS.values()]))
+
+    _listener = QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Svuota la coda e ferma il thread di scrittura."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RequestContextMiddleware:
+    """
+    Middleware ASGI: assegna il request id (riusa X-Request-ID se presente),
+    fissa livello di log e campionamento DEBUG per la richiesta e restituisce
+    l'id nell'header X-Request-ID della risposta.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == REQUEST_ID_HEADER.encode():
+                request_id = value.decode("latin-1")[:128]
+                break
+        request_id = request_id or uuid.uuid4().hex
+
+        path = scope.get("path", "")
+        id_token = request_id_var.set(request_id)
+        request_token = _request_var.set(
+            (scope.get("method"), path, route_level(path), random.random() < LOG_DEBUG_SAMPLE_RATE)
+        )
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(REQUEST_ID_HEADER.encode(), request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            _request_var.reset(request_token)
+            request_id_var.reset(id_token)
@@ -0,0 +1,251 @@
+# utils/metrics.py
+#
+# Metriche per route in formato testo Prometheus, esposte su /metrics:
+#
+#   http_requests_total{method,route,status}        richieste completate
+#   http_request_errors_total{method,route}         risposte 5xx ed eccezioni non gestite
+#   http_requests_in_progress{method,route}         richieste in corso
+#   http_request_duration_seconds{method,route}     istogramma della latenza
+#   http_request_db_seconds{method,route}           istogramma del tempo passato in query
+#   http_request_db_queries{method,route}           istogramma del numero di query
+#
+# `route` è il template del path (es. /notes/{course_id}), non il path reale,
+# così il numero di serie resta limitato. Le metriche sono per processo: con
+# più worker Prometheus va configurato per raccoglierle da ognuno.
+#
+# METRICS_ENABLED=false disattiva middleware, hook SQL ed endpoint.
+
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from starlette.routing import compile_path
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+# [numero di query, secondi] della richiesta corrente. Oggetto mutabile: le
+# copie del contesto fatte dal threadpool vedono la stessa lista.
+_db_usage: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("db_usage", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # l'ultimo è +Inf
+        self.total = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self.errors: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.in_progress: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.db_time: Dict[Tuple[str, str], Histogram] = {}
+        self.db_queries: Dict[Tuple[str, str], Histogram] = {}
+
+    def started(self, key: Tuple[str, str]):
+        with self._lock:
+            self.in_progress[key] += 1
+
+    def finished(self, in_progress_key: Tuple[str, str], key: Tuple[str, str], status: int,
+                 duration: float, queries: int, db_seconds: float):
+        with self._lock:
+            self.in_progress[in_progress_key] -= 1
+            self.requests[key + (str(status),)] += 1
+            if status >= 500:
+                self.errors[key] += 1
+            self._histogram(self.latency, key, LATENCY_BUCKETS).observe(duration)
+            self._histogram(self.db_time, key, LATENCY_BUCKETS).observe(db_seconds)
+            self._histogram(self.db_queries, key, QUERY_COUNT_BUCKETS).observe(queries)
+
+    @staticmethod
+    def _histogram(store, key, buckets) -> Histogram:
+        histogram = store.get(key)
+        if histogram is None:
+            histogram = store[key] = Histogram(buckets)
+        return histogram
+
+    def render(self) -> str:
+        """Esporta tutte le serie nel formato testo di Prometheus (0.0.4)."""
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def labels(**values) -> str:
+            escaped = (f'{k}="{_escape(v)}"' for k, v in values.items())
+            return "{" + ",".join(escaped) + "}"
+
+        def histogram(name, help_text, store):
+            header(name, "histogram", help_text)
+            for (method, route), hist in sorted(store.items()):
+                cumulative = 0
+                for bound, count in zip(list(hist.buckets) + ["+Inf"], hist.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{labels(method=method, route=route, le=bound)} {cumulative}")
+                lines.append(f"{name}_sum{labels(method=method, route=route)} {hist.total}")
+                lines.append(f"{name}_count{labels(method=method, route=route)} {cumulative}")
+
+        with self._lock:
+            header("http_requests_total", "counter", "HTTP requests completed")
+            for (method, route, status), value in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{labels(method=method, route=route, status=status)} {value}")
+
+            header("http_request_errors_total", "counter", "HTTP requests ending with a 5xx or an unhandled exception")
+            for (method, route), value in sorted(self.errors.items()):
+                lines.append(f"http_request_errors_total{labels(method=method, route=route)} {value}")
+
+            header("http_requests_in_progress", "gauge", "HTTP requests currently being served")
+            for (method, route), value in sorted(self.in_progress.items()):
+                lines.append(f"http_requests_in_progress{labels(method=method, route=route)} {value}")
+
+            histogram("http_request_duration_seconds", "Request latency in seconds", self.latency)
+            histogram("http_request_db_seconds", "Time spent executing SQL per request, in seconds", self.db_time)
+            histogram("http_request_db_queries", "SQL statements executed per request", self.db_queries)
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+registry = MetricsRegistry()
+
+
+def route_template(scope) -> str:
+    """
+    Template della route che ha servito la richiesta (es. `/courses/{course_id}`):
+    i router inclusi vengono copiati nell'app con il loro prefisso, quindi il
+    `path` della route è già quello completo.
+    """
+    route = scope.get("route")
+    if "endpoint" not in scope or route is None:
+        return UNMATCHED_ROUTE
+    return getattr(route, "path", UNMATCHED_ROUTE)
+
+
+class RouteTemplates:
+    """
+    Template noti, per etichettare le richieste ancora in corso (prima del
+    routing il template non è noto). Caricati all'avvio dallo schema OpenAPI
+    e completati con quelli visti a richiesta servita.
+    """
+
+    def __init__(self):
+        self._static: Dict[Tuple[str, str], str] = {}
+        self._dynamic: Dict[Tuple[str, str], object] = {}
+
+    def learn(self, method: str, template: str):
+        if template == UNMATCHED_ROUTE or (method, template) in self._dynamic or (method, template) in self._static:
+            return
+        if "{" in template:
+            self._dynamic[(method, template)] = compile_path(template)[0]
+        else:
+            self._static[(method, template)] = template
+
+    def learn_app(self, app):
+        for template, operations in app.openapi().get("paths", {}).items():
+            for method in operations:
+                self.learn(method.upper(), template)
+
+    def resolve(self, method: str, path: str) -> str:
+        template = self._static.get((method, path))
+        if template is not None:
+            return template
+        for (known_method, template), regex in list(self._dynamic.items()):
+            if known_method == method and regex.match(path):
+                return template
+        return UNMATCHED_ROUTE
+
+
+route_templates = RouteTemplates()
+
+
+class MetricsMiddleware:
+    """Middleware ASGI che misura ogni richiesta HTTP e il lavoro SQL che genera."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        in_progress_key = (method, route_templates.resolve(method, scope["path"]))
+        usage = [0, 0.0]
+        token = _db_usage.set(usage)
+        status = 500
+        registry.started(in_progress_key)
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            template = route_template(scope)
+            route_templates.learn(method, template)
+            registry.finished(in_progress_key, (method, template), status,
+                              time.perf_counter() - start, usage[0], usage[1])
+            _db_usage.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("metrics_query_start")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    usage = _db_usage.get()
+    if usage is not None:
+        usage[0] += 1
+        usage[1] += elapsed
+
+
+def _handle_error(exception_context):
+    # La query fallita non arriva ad after_cursor_execute: toglie il suo inizio dallo stack
+    connection = exception_context.connection
+    started = connection.info.get("metrics_query_start") if connection is not None else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine):
+    """Registra gli hook che contano query e tempo SQL (engine sync o `async_engine.sync_engine`)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
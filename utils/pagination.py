@@ -0,0 +1,110 @@
+# utils/pagination.py
+#
+# Paginazione keyset (a cursore) per gli endpoint che restituiscono liste.
+# Il cursore è opaco per il client: contiene i valori delle colonne di
+# ordinamento dell'ultimo elemento della pagina, e la pagina successiva
+# parte con un WHERE su quei valori invece che con un OFFSET, quindi il costo
+# della query non cresce scorrendo la lista.
+#
+# Il corpo della risposta resta una lista; la pagina successiva è indicata
+# dagli header `Link: <...>; rel="next"` e `X-Next-Cursor`.
+
+import base64
+import json
+import os
+from datetime import date, datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query, Request, Response
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+MAX_PAGE_SIZE = int(os.getenv("PAGE_SIZE_MAX", "500"))
+
+# Colonna (o espressione) di ordinamento e verso: True = discendente
+OrderKey = Tuple[Any, bool]
+
+
+class PageParams:
+    """Dependency FastAPI con i parametri `cursor` e `limit` comuni a tutte le liste."""
+
+    def __init__(
+        self,
+        cursor: Optional[str] = Query(None, description="Opaque cursor from the previous page"),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+    ):
+        self.cursor = cursor
+        self.limit = limit
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _decode_value(column, value):
+    if value is None:
+        return None
+    try:
+        python_type = column.type.python_type
+    except (AttributeError, NotImplementedError):
+        return value
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, order: Sequence[OrderKey]) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != len(order):
+            raise ValueError("cursor length mismatch")
+        return [_decode_value(column, value) for (column, _), value in zip(order, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset(query, order: Sequence[OrderKey], page: PageParams):
+    """
+    Applica ORDER BY, la condizione sul cursore e LIMIT (page.limit + 1, per
+    sapere se esiste una pagina successiva) a una Query o a una select().
+    L'ultima colonna di `order` deve rendere l'ordinamento univoco (es. l'id).
+    """
+    if page.cursor:
+        values = decode_cursor(page.cursor, order)
+        # (a, b) "dopo" (va, vb)  <=>  a > va  OR  (a = va AND b > vb), col verso di ogni colonna
+        conditions = []
+        for i, (column, descending) in enumerate(order):
+            beyond = column < values[i] if descending else column > values[i]
+            equal_prefix = [order[j][0] == values[j] for j in range(i)]
+            conditions.append(and_(*equal_prefix, beyond))
+        query = query.where(or_(*conditions))
+
+    query = query.order_by(*[column.desc() if descending else column.asc() for column, descending in order])
+    return query.limit(page.limit + 1)
+
+
+def finish_page(rows: List[Any], page: PageParams, cursor_values: Callable[[Any], Sequence[Any]],
+                request: Request, response: Response) -> List[Any]:
+    """
+    Taglia la riga in più chiesta da `keyset`, imposta gli header della
+    pagina successiva e restituisce gli elementi della pagina corrente.
+    """
+    if len(rows) <= page.limit:
+        return rows
+
+    rows = rows[:page.limit]
+    next_cursor = encode_cursor(cursor_values(rows[-1]))
+    next_url = request.url.include_query_params(cursor=next_cursor, limit=page.limit)
+    response.headers["Link"] = f'<{next_url}>; rel="next"'
+    response.headers["X-Next-Cursor"] = next_cursor
+    return rows
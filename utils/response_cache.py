@@ -0,0 +1,149 @@
+# utils/response_cache.py
+#
+# Cache delle risposte per i dati di riferimento (facoltà, corsi, professori,
+# mappe): per ogni route + query string tiene il JSON già serializzato, con
+# un ETag forte (hash del contenuto) e Last-Modified. Le richieste con
+# If-None-Match / If-Modified-Since ricevono 304 senza corpo.
+#
+# Ogni voce ha dei tag ("faculties", "courses", "teachers"); gli endpoint
+# che scrivono su quelle tabelle chiamano `cache.invalidate(tag)`. Le voci
+# stanno nel sottosistema cache/ (in memoria o su Redis, vedi CACHE_BACKEND):
+# con Redis, o in memoria con PUBSUB_BACKEND=unix, l'invalidazione vale per
+# tutti i worker. Le richieste concorrenti per una risposta assente la
+# costruiscono una volta sola.
+#
+# Negli endpoint la cache arriva come dependency:
+# `cache: ResponseCache = Depends(get_response_cache)`.
+
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from cache import make_cache
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+# max-age per i client: dopo, rivalidano con If-None-Match (risposta 304 senza corpo)
+RESPONSE_CACHE_MAX_AGE = int(os.getenv("RESPONSE_CACHE_MAX_AGE", "60"))
+# Per quanto ricordare ETag e Last-Modified dell'ultima versione di una risposta
+VALIDATORS_TTL = 24 * 3600
+
+# Header impostati dagli endpoint che vanno conservati con il corpo (paginazione)
+STORED_HEADERS = ("link", "x-next-cursor")
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    last_modified: float
+    headers: Dict[str, str]
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # If-None-Match usa il confronto debole: W/"x" corrisponde a "x"
+    candidates = [value.strip() for value in header.split(",")]
+    return "*" in candidates or any(c.removeprefix("W/") == etag for c in candidates)
+
+
+def _not_modified_since(header: str, last_modified: float) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    return since is not None and int(last_modified) <= since.timestamp()
+
+
+class ResponseCache:
+    """Risposte serializzate nella cache "responses", invalidabili per tag."""
+
+    def __init__(self, size: int = RESPONSE_CACHE_SIZE, ttl: int = RESPONSE_CACHE_TTL):
+        self.entries = make_cache("responses", size, ttl)
+        # ETag e Last-Modified sopravvivono all'invalidazione: un contenuto
+        # ricostruito identico mantiene la stessa data di modifica
+        self.validators = make_cache("response-validators", size, VALIDATORS_TTL)
+
+    @staticmethod
+    def key(request: Request) -> str:
+        query = urlencode(sorted(request.query_params.multi_items()))
+        return f"{request.url.path}?{query}"
+
+    def invalidate(self, *tags: str):
+        """Invalida le risposte con uno dei tag, in tutti i worker."""
+        self.entries.invalidate(*tags)
+
+    def clear(self):
+        self.entries.clear()
+        self.validators.clear()
+
+    async def _build(self, key: str, build: Callable[[Response], Awaitable[Any]],
+                     adapter: Optional[TypeAdapter]) -> CachedResponse:
+        scratch = Response()
+        data = await build(scratch)
+        if adapter is not None:
+            body = adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+        else:
+            body = json.dumps(jsonable_encoder(data), separators=(",", ":")).encode()
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        last_modified = time.time()
+        if RESPONSE_CACHE_ENABLED:
+            previous = await self.validators.aget(key)
+            if previous is not None and previous[0] == etag:
+                last_modified = previous[1]
+            else:
+                await self.validators.aset(key, (etag, last_modified))
+        return CachedResponse(
+            body=body, etag=etag, last_modified=last_modified,
+            headers={k: v for k, v in scratch.headers.items() if k.lower() in STORED_HEADERS},
+        )
+
+    async def serve(self, request: Request, build: Callable[[Response], Awaitable[Any]],
+                    tags: Tuple[str, ...], adapter: Optional[TypeAdapter] = None,
+                    public: bool = True) -> Response:
+        """
+        Risposta dalla cache o, se manca, da `build(response)` (che può
+        impostare header sulla `response` ricevuta, es. la paginazione).
+        Con `adapter` i dati sono validati e serializzati come con response_model.
+        """
+        key = self.key(request)
+        if RESPONSE_CACHE_ENABLED:
+            entry = await self.entries.aget_or_set(key, lambda: self._build(key, build, adapter), tags=tags)
+        else:
+            entry = await self._build(key, build, adapter)
+        return self._respond(request, entry, public)
+
+    @staticmethod
+    def _respond(request: Request, entry: CachedResponse, public: bool) -> Response:
+        headers = {
+            "ETag": entry.etag,
+            "Last-Modified": formatdate(entry.last_modified, usegmt=True),
+            "Cache-Control": f"{'public' if public else 'private'}, max-age={RESPONSE_CACHE_MAX_AGE}",
+            **entry.headers,
+        }
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            not_modified = _etag_matches(if_none_match, entry.etag)
+        else:
+            if_modified_since = request.headers.get("if-modified-since")
+            not_modified = if_modified_since is not None and _not_modified_since(if_modified_since, entry.last_modified)
+        if not_modified:
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+response_cache = ResponseCache()
+
+
+def get_response_cache() -> ResponseCache:
+    """Dependency per FastAPI."""
+    return response_cache
@@ -0,0 +1,30 @@
+# utils/timetable.py
+
+from datetime import date
+from typing import List, Optional
+
+# `Lesson.day_of_week` è una stringa libera: accettiamo nomi inglesi e
+# italiani (con e senza accento), confrontati in minuscolo.
+WEEKDAY_NAMES = [
+    ("monday", "mon", "lunedì", "lunedi", "lun"),
+    ("tuesday", "tue", "martedì", "martedi", "mar"),
+    ("wednesday", "wed", "mercoledì", "mercoledi", "mer"),
+    ("thursday", "thu", "giovedì", "giovedi", "gio"),
+    ("friday", "fri", "venerdì", "venerdi", "ven"),
+    ("saturday", "sat", "sabato", "sab"),
+    ("sunday", "sun", "domenica", "dom"),
+]
+
+_WEEKDAY_BY_NAME = {name: index for index, names in enumerate(WEEKDAY_NAMES) for name in names}
+
+
+def weekday_aliases(day: date) -> List[str]:
+    """Tutti i valori di `day_of_week` che indicano il giorno della settimana di `day`."""
+    return list(WEEKDAY_NAMES[day.weekday()])
+
+
+def parse_weekday(day_of_week: Optional[str]) -> Optional[int]:
+    """Indice del giorno (0 = lunedì) oppure None se la stringa non è riconosciuta."""
+    if not day_of_week:
+        return None
+    return _WEEKDAY_BY_NAME.get(day_of_week.strip().lower())